@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.gis.db import models as gis_models
+from django.db.models.functions import Now
 from djangoapi.settings import EPSG_FOR_GEOMETRIES
 # Create your models here.
 class Addresses(models.Model):
@@ -10,3 +11,5 @@ class Addresses(models.Model):
     post_num = models.IntegerField(blank=True, null=True)
     post_name = models.CharField(max_length=64, blank=True, null=True)
     geom = gis_models.PointField(srid=int(EPSG_FOR_GEOMETRIES), blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now())
+    row_version = models.IntegerField(default=1, db_default=1, editable=False)  # +1 on every update, in the ETag
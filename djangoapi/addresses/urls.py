@@ -15,6 +15,13 @@ urlpatterns = [
     path('addresses_view/insert2/', views.AddressesView.as_view(), {'action': 'insert2'}, name='addresses_view_insert2'),  # POST
     path('addresses_view/update/<int:id>/', views.AddressesView.as_view(), {'action': 'update'}, name='addresses_view_update'),  # POST
     path('addresses_view/delete/<int:id>/', views.AddressesView.as_view(), {'action': 'delete'}, name='addresses_view_delete'),  # POST
+
+    # AddressesAsyncView - async variant of AddressesView, for the ASGI server
+    path('addresses_async/selectone/<int:id>/', views.AddressesAsyncView.as_view(), {'action': 'selectone'}, name='addresses_async_selectone'),  # GET
+    path('addresses_async/selectall/', views.AddressesAsyncView.as_view(), {'action': 'selectall'}, name='addresses_async_selectall'),  # GET
+    path('addresses_async/insert/', views.AddressesAsyncView.as_view(), {'action': 'insert'}, name='addresses_async_insert'),  # POST
+    path('addresses_async/update/<int:id>/', views.AddressesAsyncView.as_view(), {'action': 'update'}, name='addresses_async_update'),  # POST
+    path('addresses_async/delete/<int:id>/', views.AddressesAsyncView.as_view(), {'action': 'delete'}, name='addresses_async_delete'),  # POST
     
     # REST Framework router URLs (AddressesModelViewSet)
     path('', include(router.urls)),                                        
@@ -37,4 +44,7 @@ urlpatterns = [
 # POST /addresses/addresses/ - create() - vstavi
 # PUT /addresses/addresses/<id>/ - update() - posodobi
 # PATCH /addresses/addresses/<id>/ - partial_update() - delna posodobitev
-# DELETE /addresses/addresses/<id>/ - destroy() - izbriši
\ No newline at end of file
+# DELETE /addresses/addresses/<id>/ - destroy() - izbriši
+# POST /addresses/addresses/bulk_validate/ - bulk_validate() - preveri več geometrij z eno poizvedbo
+# POST /addresses/addresses/bulk_create/ - bulk_create() - vstavi več objektov v eni transakciji
+# PATCH /addresses/addresses/bulk_update/ - bulk_update() - delna posodobitev več objektov v eni transakciji
\ No newline at end of file
@@ -6,19 +6,23 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 
 # Geoss
 from django.contrib.gis.geos import GEOSGeometry
-from django.contrib.gis.db.models.functions import SnapToGrid
 
 # rest_framework imports
-from rest_framework import viewsets
 from rest_framework import permissions
 
 # My imports
-from core.myLib.geometryTools import WkbConversor, GeometryChecks
+from core.myLib.geometryTools import GeometryPreparer
 from .models import Addresses
 from .serializers import AddressSerializer
-from buildings.models import Buildings
-from djangoapi.settings import EPSG_FOR_GEOMETRIES, ST_SNAP_PRECISION, MAX_NUMBER_OF_RETRIEVED_ROWS
+from djangoapi.settings import EPSG_FOR_GEOMETRIES
 from core.myLib.baseDjangoView import BaseDjangoView
+from core.myLib.asyncBaseDjangoView import AsyncBaseDjangoView
+from core.myLib.geoModelViewSet import GeoModelViewSet
+from core.myLib.featureWriter import FeatureWriter
+
+
+# 9IM matrix of ST_Equals: two addresses in the same location
+EQUALS_MATRIX9IM = 'T*F**FFF*'
 
 
 class HelloWord(View):
@@ -48,6 +52,9 @@ class AddressesView(LoginRequiredMixin, BaseDjangoView):
         POST /addresses/addresses_view/delete/<id>/
     """
     
+    #selectone and selectall are cached until the layer changes (BaseDjangoView.cached_response)
+    model = Addresses
+
     def post(self, request, *args, **kwargs):
         """
         Redefines the post method of the BaseDjangoView class to add a new action.
@@ -73,26 +80,19 @@ class AddressesView(LoginRequiredMixin, BaseDjangoView):
         return JsonResponse({'ok': True, 'message': 'Address Retrieved', 'data': [d]}, status=200)
 
     def selectall(self):
-        l = Addresses.objects.all()[:MAX_NUMBER_OF_RETRIEVED_ROWS]
-        data = []
-        for a in l:
-            d = model_to_dict(a)
-            d['geom'] = a.geom.wkt
-            data.append(d)
-        return JsonResponse({'ok': True, 'message': 'Data retrieved', 'data': data}, status=200)
+        # ?stream=true streams all the rows. See BaseDjangoView.selectall_response
+        return self.selectall_response(Addresses.objects.all(), 'Data retrieved')
 
     # POST OPERATIONS
     def insert(self, request):
         """
-        Inserts the point. Latter snap it to the grid. This must be done
-        in the database. So we need to insert it before.
-        After the address has been inserted:
+        Inserts the point. Before writing anything, in only one query:
             - snap it to grid
             - Check if the geometry is valid
-            - Check if the point is within a building
             - Check if the point doesn't overlap with another address (same coordinates)
-            - If any check fails, remove the row.
-            - The only inconvenient is the id counter sums one more
+            - Check if the point is within a building
+        If any check fails nothing is written. If not, the address
+        is saved with only one INSERT. See core/myLib/featureWriter.py
         """
         print(f"Insert address")
         print(f"Request: {request.POST}")
@@ -103,65 +103,34 @@ class AddressesView(LoginRequiredMixin, BaseDjangoView):
         if originalWkt is None:
             return JsonResponse({'ok': False, 'message': 'The geometry is mandatory', 'data': []}, status=400)
         
-        # Creates the geometry
-        g = GEOSGeometry(request.POST.get('geom', ''), srid=EPSG_FOR_GEOMETRIES)
-        print(f"Original geometry: {g}")
-
-        # Check if it's a Point
+        # Check if it's a Point. It is done in process, without the database
+        g = GEOSGeometry(originalWkt, srid=EPSG_FOR_GEOMETRIES)
         if g.geom_type != 'Point':
             return JsonResponse({'ok': False, 'message': 'The geometry must be a Point', 'data': []}, status=400)
 
-        building_num = request.POST.get('building_num', None)
-        street = request.POST.get('street', '') 
-        house_num = request.POST.get('house_num', '')
-        post_num = request.POST.get('post_num', None)
-        post_name = request.POST.get('post_name', '')
-        
-        a = Addresses(
-            building_num=building_num,
-            street=street, 
-            house_num=house_num,
-            post_num=post_num,
-            post_name=post_name,
-            geom=g
-        )
-        a.save()
-        print(f"Geometry inserted id: {a.id}")
-
-        # Update the geometry to a snapped one to the grid
-        Addresses.objects.filter(id=a.id).update(geom=SnapToGrid('geom', ST_SNAP_PRECISION))
-
-        # Now we get a new object with the new geometry to perform the checks
-        a = Addresses.objects.get(id=a.id)
-        print('Snapped geometry', a.geom.wkt)
-        
-        # Check if geometry is valid
-        valid = a.geom.valid
-        print(f'Valid: {valid}')
-        if not valid:
-            print(f"Deleting invalid geometry {a.id}")
-            a.delete()
+        fields = {
+            'building_num': request.POST.get('building_num', None),
+            'street': request.POST.get('street', ''),
+            'house_num': request.POST.get('house_num', ''),
+            'post_num': request.POST.get('post_num', None),
+            'post_name': request.POST.get('post_name', ''),
+        }
+        limit = self.get_relate_check_limit(request)
+        fw = FeatureWriter(Addresses, EQUALS_MATRIX9IM, container_table='buildings_buildings')
+        fw.insert(originalWkt, fields, limit=limit)
+
+        if fw.error == FeatureWriter.INVALID_GEOMETRY:
             return JsonResponse({'ok': False, 'message': 'The geometry is not valid after the st_SnapToGrid', 'data': []}, status=200)   
-
-        # Check if there's another address at the same location (overlapping points)
-        filt = Addresses.objects.filter(geom__equals=a.geom).exclude(id=a.id)
-        if filt.exists():
-            n = filt.count()
-            print(f"Deleting the address id {a.id}, as it overlaps with {n} other address(es)")
-            a.delete()
-            return JsonResponse({'ok': False, 'message': f'The address overlaps with {n} existing address(es) at the same location'}, status=200)
-
-        # Check if the point is within a building
-        buildings_containing = Buildings.objects.filter(geom__contains=a.geom)
-        if not buildings_containing.exists():
-            print(f"Deleting the address id {a.id}, as it is not within any building")
-            a.delete()
+        if fw.error == FeatureWriter.RELATED_IDS:
+            ids = fw.get_related_ids()
+            n = len(ids)
+            at_least = 'at least ' if fw.is_limit_reached() else ''
+            return JsonResponse({'ok': False, 'message': f'The address overlaps with {at_least}{n} existing address(es) at the same location', 'data': ids}, status=200)
+        if fw.error == FeatureWriter.NOT_CONTAINED:
             return JsonResponse({'ok': False, 'message': 'The address must be within a building polygon'}, status=200)
-        
-        # Create an address object from the model Addresses
-        d = model_to_dict(a)
-        d['geom'] = a.geom.wkt
-        return JsonResponse({'ok': True, 'message': 'Address inserted', 'data': [d]}, status=201)
+        print(f"Geometry inserted id: {fw.instance.id}")
+
+        return JsonResponse({'ok': True, 'message': 'Address inserted', 'data': [fw.to_dict()]}, status=201)
 
     def update(self, request, id):
         """
@@ -178,12 +147,13 @@ class AddressesView(LoginRequiredMixin, BaseDjangoView):
         originalWkt = request.POST.get('geom', None)
         
         if originalWkt is not None:
-            conversor = WkbConversor()
-            wkb = conversor.set_wkt_from_text(originalWkt)
-            newWkt = conversor.get_as_wkt()
-            geojson = conversor.get_as_geojson()
-            gc = GeometryChecks(wkb)
-            isValid = gc.is_geometry_valid()
+            # Snap, validation, the equal addresses check and the building check in one query
+            gc = GeometryPreparer()
+            wkb = gc.prepare(originalWkt, 'addresses_addresses', EQUALS_MATRIX9IM, id_to_avoid=id,
+                             container_table='buildings_buildings', limit=self.get_relate_check_limit(request))
+            newWkt = gc.get_as_wkt()
+            geojson = gc.get_as_geojson()
+            isValid = gc.is_valid
 
             print(f"Snapped wkt: {newWkt}")
             print(f"Snapped geojson: {geojson}")
@@ -193,19 +163,17 @@ class AddressesView(LoginRequiredMixin, BaseDjangoView):
                 return JsonResponse({'ok': False, 'message': 'The geometry is not valid after the st_SnapToGrid', 'data': []}, status=200)   
             
             # Check geometry type
-            polyGeos = GEOSGeometry(wkb)
-            if polyGeos.geom_type != 'Point':
+            if gc.geom_type != 'POINT':
                 return JsonResponse({'ok': False, 'message': 'The geometry must be a Point', 'data': []}, status=400)
 
             # Check if there's another address at the same location (excluding current one)
-            overlapping = Addresses.objects.filter(geom__equals=polyGeos).exclude(id=id)
-            if overlapping.exists():
-                n = overlapping.count()
-                return JsonResponse({'ok': False, 'message': f'The address overlaps with {n} existing address(es) at the same location', 'data': []}, status=200)
+            if gc.are_there_related_ids():
+                n = len(gc.related_ids)
+                at_least = 'at least ' if gc.is_limit_reached() else ''
+                return JsonResponse({'ok': False, 'message': f'The address overlaps with {at_least}{n} existing address(es) at the same location', 'data': []}, status=200)
 
             # Check if the point is within a building
-            buildings_containing = Buildings.objects.filter(geom__contains=polyGeos)
-            if not buildings_containing.exists():
+            if not gc.is_contained:
                 return JsonResponse({'ok': False, 'message': 'The address must be within a building polygon', 'data': []}, status=200)
 
             # Update the address
@@ -218,7 +186,7 @@ class AddressesView(LoginRequiredMixin, BaseDjangoView):
             a.save()
             
             d = model_to_dict(a)
-            d['geom'] = conversor.get_as_wkt()  # snapped version
+            d['geom'] = newWkt  # snapped version
         else:
             return JsonResponse({'ok': False, 'message': 'Update. The geometry is mandatory', 'data': []}, status=200)
         
@@ -240,28 +208,26 @@ class AddressesView(LoginRequiredMixin, BaseDjangoView):
         originalWkt = request.POST.get('geom', None)
         
         if originalWkt is not None:
-            conversor = WkbConversor()
-            wkb = conversor.set_wkt_from_text(originalWkt)
-            gc = GeometryChecks(wkb)
-            isValid = gc.is_geometry_valid()
+            gc = GeometryPreparer()
+            wkb = gc.prepare(originalWkt, 'addresses_addresses', EQUALS_MATRIX9IM,
+                             container_table='buildings_buildings', limit=self.get_relate_check_limit(request))
+            isValid = gc.is_valid
 
             if not isValid:
                 return JsonResponse({'ok': False, 'message': 'The geometry is not valid after the st_SnapToGrid', 'data': []}, status=400)   
             
             # Check geometry type
-            polyGeos = GEOSGeometry(wkb)
-            if polyGeos.geom_type != 'Point':
+            if gc.geom_type != 'POINT':
                 return JsonResponse({'ok': False, 'message': 'The geometry must be a Point', 'data': []}, status=400)
 
             # Check if there's another address at the same location
-            overlapping = Addresses.objects.filter(geom__equals=polyGeos)
-            if overlapping.exists():
-                n = overlapping.count()
-                return JsonResponse({'ok': False, 'message': f'The address overlaps with {n} existing address(es) at the same location', 'data': []}, status=400)
+            if gc.are_there_related_ids():
+                n = len(gc.related_ids)
+                at_least = 'at least ' if gc.is_limit_reached() else ''
+                return JsonResponse({'ok': False, 'message': f'The address overlaps with {at_least}{n} existing address(es) at the same location', 'data': []}, status=400)
 
             # Check if the point is within a building
-            buildings_containing = Buildings.objects.filter(geom__contains=polyGeos)
-            if not buildings_containing.exists():
+            if not gc.is_contained:
                 return JsonResponse({'ok': False, 'message': 'The address must be within a building polygon', 'data': []}, status=400)
             
             a = Addresses()
@@ -274,14 +240,29 @@ class AddressesView(LoginRequiredMixin, BaseDjangoView):
             a.save()
             
             d = model_to_dict(a)
-            d['geom'] = a.geom.wkt
+            d['geom'] = gc.get_as_wkt()
         else:
             return JsonResponse({'ok': False, 'message': 'The geometry is mandatory', 'data': []}, status=200)
 
         return JsonResponse({'ok': True, 'message': "Address Inserted", 'data': [d]}, status=200)   
 
 
-class AddressesModelViewSet(viewsets.ModelViewSet):
+class AddressesAsyncView(AsyncBaseDjangoView):
+    """
+    Async variant of AddressesView, for the ASGI server. The geometry checks are the
+    rules of addresses_addresses in core/myLib/layerRules.py.
+    It needs the user to be logged in, as AddressesView.
+        GET /addresses/addresses_async/selectone/<id>/
+        GET /addresses/addresses_async/selectall/
+        POST /addresses/addresses_async/insert/
+        POST /addresses/addresses_async/update/<id>/
+        POST /addresses/addresses_async/delete/<id>/
+    """
+    model = Addresses
+    login_required = True
+
+
+class AddressesModelViewSet(GeoModelViewSet):
     """
     DJANGO REST FRAMEWORK VIEWSET.
 
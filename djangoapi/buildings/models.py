@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.gis.db import models as gis_models
+from django.db.models.functions import Now
 from djangoapi.settings import EPSG_FOR_GEOMETRIES
 # Create your models here.
 class Buildings(models.Model):
@@ -9,6 +10,8 @@ class Buildings(models.Model):
     description = models.CharField(max_length=100, blank=True, null=True)
     area = models.FloatField(blank=True, null=True)
     geom = gis_models.PolygonField(srid=int(EPSG_FOR_GEOMETRIES), blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now())
+    row_version = models.IntegerField(default=1, db_default=1, editable=False)  # +1 on every update, in the ETag
 #    def __str__(self):
 #        return str(self.id)
 
@@ -10,6 +10,7 @@ class BuildingsSerializer(GeoModelSerializer):
     check_geometry_is_valid = True #if true ºit will check if the geometry is valid: not self-intersecting and closed
     check_st_relation = True #if true it will chck the relation of the geometry with the other geometries
     matrix9IM = 'T********' #matrix 9IM for the relation of the geometries: 'T********' = interiors intersects
+    area_field_name = 'area' #the bulk operations store here the area of the geometry
     geoms_as_wkt = True #if true the serializer expects the geometries in WKT format. If false, in geojson format
     check_st_relation = True #if the new geometry must be checked against 
             #the other geometries in the table according to the matrix9IM. If any geometry
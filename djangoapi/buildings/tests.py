@@ -1,3 +1,146 @@
-from django.test import TestCase
+from django.contrib.gis.geos import GEOSGeometry
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from core.myLib.geoModelViewSet import INVALID_ID_MESSAGE
+from core.myLib.testing import PostGISTestCase
+from djangoapi.settings import EPSG_FOR_GEOMETRIES
+from .models import Buildings
+
+def square(x: float, y: float=0, size: float=1)->str:
+    return f'POLYGON(({x} {y},{x + size} {y},{x + size} {y + size},{x} {y + size},{x} {y}))'
+
+#self-intersecting
+BOWTIE = 'POLYGON((0 0,10 10,10 0,0 10,0 0))'
+
+def create_building(wkt: str, **fields)->Buildings:
+    return Buildings.objects.create(geom=GEOSGeometry(wkt, srid=int(EPSG_FOR_GEOMETRIES)), **fields)
+
+class BuildingsBulkTest(PostGISTestCase):
+    """
+    bulk_create, bulk_update and bulk_validate of GeoModelViewSet: all the items
+    are saved, or none, and the errors are returned by item
+    """
+    def setUp(self):
+        super().setUp()
+        self.client=APIClient()
+
+    def test_bulk_create(self):
+        response=self.client.post('/buildings/buildings/bulk_create/',
+                                  [{'geom': square(0), 'sifko': 1}, {'geom': square(10, size=2), 'sifko': 2}], format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual([d['index'] for d in response.data['data']], [0, 1])
+        building=Buildings.objects.get(id=response.data['data'][1]['id'])
+        self.assertAlmostEqual(building.area, 4)
+
+    def test_bulk_create_returns_the_errors_by_item(self):
+        create_building(square(100))
+        items=[
+            {'geom': square(0)},
+            {'geom': BOWTIE},
+            {'geom': square(100.5)},              #overlaps the building of the table
+            {'geom': square(20)},
+            {'geom': square(20.5)},               #overlaps the previous item
+            {'geom': square(40), 'sifko': 'abc'},
+        ]
+        response=self.client.post('/buildings/buildings/bulk_create/', items, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([d['ok'] for d in response.data['data']], [True, False, False, False, False, False])
+        errors=[d['errors'] for d in response.data['data']]
+        self.assertIn('geom', errors[1])
+        self.assertIn('geom', errors[2])
+        self.assertIn('geom', errors[3])
+        self.assertIn('geom', errors[4])
+        self.assertIn('sifko', errors[5])
+        self.assertEqual(Buildings.objects.count(), 1)
+
+    def test_bulk_update(self):
+        building=create_building(square(0), description='old')
+        response=self.client.patch('/buildings/buildings/bulk_update/',
+                                   [{'id': building.id, 'description': 'new', 'geom': square(0, size=3)}], format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        building.refresh_from_db()
+        self.assertEqual(building.description, 'new')
+        self.assertAlmostEqual(building.area, 9)
+        self.assertEqual(building.row_version, 2)
+
+    def test_bulk_update_returns_the_errors_of_the_ids_by_item(self):
+        building=create_building(square(0), description='old')
+        items=[
+            {'id': str(building.id), 'description': 'a'},
+            {'id': {'id': building.id}, 'description': 'b'},
+            {'id': [building.id], 'description': 'c'},
+            {'id': True, 'description': 'd'},
+            {'description': 'e'},
+            {'id': building.id + 1000, 'description': 'f'},
+            {'id': building.id, 'description': 'g'},
+            {'id': building.id, 'description': 'h'},
+        ]
+        response=self.client.patch('/buildings/buildings/bulk_update/', items, format='json')
+        self.assertEqual(response.status_code, 400)
+        errors=[d['errors'].get('id') for d in response.data['data']]
+        self.assertEqual(errors[:4], [[INVALID_ID_MESSAGE]] * 4)
+        self.assertEqual(errors[4], ['This field is required.'])
+        self.assertEqual(errors[5], [f'The feature {building.id + 1000} does not exist.'])
+        self.assertIsNone(errors[6])
+        self.assertEqual(errors[7], [f'The feature {building.id} is repeated in the list.'])
+        building.refresh_from_db()
+        self.assertEqual(building.description, 'old')
+
+    def test_bulk_validate_returns_the_wrong_ids_by_item(self):
+        items=[{'id': '7', 'geom': square(0)}, {'geom': square(10)}, {'geom': BOWTIE}]
+        response=self.client.post('/buildings/buildings/bulk_validate/', items, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertFalse(response.data['ok'])
+        data=response.data['data']
+        self.assertEqual([d['ok'] for d in data], [False, True, False])
+        self.assertEqual(data[0]['error'], INVALID_ID_MESSAGE)
+
+class BuildingsConditionalGetTest(PostGISTestCase):
+    """
+    retrieve and list answer 304 when the ETag or Last-Modified of the client
+    is still the one of the features
+    """
+    def setUp(self):
+        super().setUp()
+        self.client=APIClient()
+        self.building=create_building(square(0), description='old')
+        self.url=f'/buildings/buildings/{self.building.id}/'
+
+    def test_retrieve_has_a_strong_etag(self):
+        response=self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', response)
+
+    def test_unchanged_retrieve_is_not_modified(self):
+        etag=self.client.get(self.url)['ETag']
+        response=self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    def test_etag_of_the_compressed_variant(self):
+        etag=self.client.get(self.url)['ETag']
+        response=self.client.get(self.url, HTTP_IF_NONE_MATCH=f'{etag[:-1]}-gzip"')
+        self.assertEqual(response.status_code, 304)
+
+    def test_unchanged_retrieve_since_last_modified(self):
+        last_modified=self.client.get(self.url)['Last-Modified']
+        response=self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_changed_retrieve_is_sent(self):
+        etag=self.client.get(self.url)['ETag']
+        self.building.description='new'
+        self.building.save()
+        response=self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_unchanged_list_is_not_modified(self):
+        url='/buildings/buildings/?page_size=10'
+        etag=self.client.get(url)['ETag']
+        self.assertTrue(etag.startswith('W/'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        create_building(square(10))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
@@ -16,6 +16,13 @@ urlpatterns = [
     path('buildings_view/insert2/', views.BuildingsView.as_view(), {'action': 'insert2'}, name='buildings_view_insert2'),  # POST
     path('buildings_view/update/<int:id>/', views.BuildingsView.as_view(), {'action': 'update'}, name='buildings_view_update'),  # POST
     path('buildings_view/delete/<int:id>/', views.BuildingsView.as_view(), {'action': 'delete'}, name='buildings_view_delete'),  # POST
+
+    # BuildingsAsyncView - async variant of BuildingsView, for the ASGI server
+    path('buildings_async/selectone/<int:id>/', views.BuildingsAsyncView.as_view(), {'action': 'selectone'}, name='buildings_async_selectone'),  # GET
+    path('buildings_async/selectall/', views.BuildingsAsyncView.as_view(), {'action': 'selectall'}, name='buildings_async_selectall'),  # GET
+    path('buildings_async/insert/', views.BuildingsAsyncView.as_view(), {'action': 'insert'}, name='buildings_async_insert'),  # POST
+    path('buildings_async/update/<int:id>/', views.BuildingsAsyncView.as_view(), {'action': 'update'}, name='buildings_async_update'),  # POST
+    path('buildings_async/delete/<int:id>/', views.BuildingsAsyncView.as_view(), {'action': 'delete'}, name='buildings_async_delete'),  # POST
     
     # REST Framework router URLs (BuildingsModelViewSet and OwnersModelViewSet)
     path('', include(router.urls)),                                        
@@ -39,6 +46,9 @@ urlpatterns = [
 # PUT /buildings/buildings/<id>/ - update() - posodobi
 # PATCH /buildings/buildings/<id>/ - partial_update() - delna posodobitev
 # DELETE /buildings/buildings/<id>/ - destroy() - izbriši
+# POST /buildings/buildings/bulk_validate/ - bulk_validate() - preveri več geometrij z eno poizvedbo
+# POST /buildings/buildings/bulk_create/ - bulk_create() - vstavi več objektov v eni transakciji
+# PATCH /buildings/buildings/bulk_update/ - bulk_update() - delna posodobitev več objektov v eni transakciji
 #
 # REST Framework (OwnersModelViewSet):
 # 
@@ -7,21 +7,18 @@ from django.shortcuts import redirect
 from django.forms.models import model_to_dict
 from django.contrib.auth.mixins import LoginRequiredMixin
 
-#Geoss
-from django.contrib.gis.geos import GEOSGeometry
-from django.contrib.gis.db.models.functions import SnapToGrid
-
-
 #rest_framework imports
 from rest_framework import viewsets
 from rest_framework import permissions
 
 #My imports
-from core.myLib.geometryTools import WkbConversor, GeometryChecks
+from core.myLib.geometryTools import GeometryPreparer
 from .models import Buildings, Owners
 from .serializers import BuildingsSerializer, OwnersSerializer
-from djangoapi.settings import EPSG_FOR_GEOMETRIES, ST_SNAP_PRECISION, MAX_NUMBER_OF_RETRIEVED_ROWS
 from core.myLib.baseDjangoView import BaseDjangoView
+from core.myLib.asyncBaseDjangoView import AsyncBaseDjangoView
+from core.myLib.geoModelViewSet import GeoModelViewSet
+from core.myLib.featureWriter import FeatureWriter
 
 def custom_logout_view(request):
     logout(request)
@@ -54,6 +51,9 @@ class BuildingsView(LoginRequiredMixin, BaseDjangoView):
         POST /buildings_view/delete/<id>/
     """
     
+    #selectone and selectall are cached until the layer changes (BaseDjangoView.cached_response)
+    model = Buildings
+
     def post(self, request, *args, **kwargs):
         """
         Redefines the post method of the BaseDjangoView class to add a new action.
@@ -79,25 +79,18 @@ class BuildingsView(LoginRequiredMixin, BaseDjangoView):
         return JsonResponse({'ok':True, 'message': 'Building Retriewed', 'data': [d]}, status=200)
 
     def selectall(self):
-        l=Buildings.objects.all()[:MAX_NUMBER_OF_RETRIEVED_ROWS]
-        data=[]
-        for b in l:
-            d=model_to_dict(b)
-            d['geom']=b.geom.wkt
-            data.append(d)
-        return JsonResponse({'ok':True, 'message': 'Data retrieved', 'data': data}, status=200)
+        #?stream=true streams all the rows. See BaseDjangoView.selectall_response
+        return self.selectall_response(Buildings.objects.all(), 'Data retrieved')
 
     #POST OPERATIONS
     def insert(self, request):
         """
-        Inserts the polygon. Latter snap it to the grid. This must be done
-        in the database. So we need to insert it before.
-        After the building has been inserted:
+        Inserts the polygon. Before writing anything, in only one query:
             - snap it to grid
             - Check if the geometry is valid
             - Check if the interior intersects with other geometry
-            - If any check fails, remove the row.
-            - The only inconvenient is the id counter sums one more
+        If any check fails nothing is written. If not, the building
+        is saved with only one INSERT. See core/myLib/featureWriter.py
         """
         print(f"Insert building")
         print(f"Request: {request.POST}")
@@ -106,52 +99,23 @@ class BuildingsView(LoginRequiredMixin, BaseDjangoView):
         originalWkt=request.POST.get('geom', None)
         if originalWkt is None:
             return JsonResponse({'ok':False, 'message': 'The geometry is mandartory', 'data':[]}, status=400)
-        
-        #Creates the geometry
-        g=GEOSGeometry(request.POST.get('geom',''), srid=EPSG_FOR_GEOMETRIES)
-        #print the representation of the object
-        print(f"Original geometry: {g}")
 
         description = request.POST.get('description','') 
-        b=Buildings(description=description, area=g.area, geom=g)
-        b.save()
-        print(f"Geometry inserted id: {b.id}")
-
-        #Update the geometry to an snaped one yo the grid
-        Buildings.objects.filter(id=b.id).update(geom=SnapToGrid('geom', ST_SNAP_PRECISION))
-
-        #Now we get a new object with the new geometry to perform the checks
-        b=Buildings.objects.get(id=b.id)
-        print('Snapped geometry',b.geom.wkt)
-        #bGeos=GEOSGeometry(b.geom.wkt, srid=25830)
-        #valid=bGeos.valid
-        #b.geom is a GEOSGeometry object, so we can use it directly
-        valid=b.geom.valid
-        print(f'Valid: {valid}')
-        if not valid:
-            print(f"Deleting invalid geometry {b.id}")
-            b.delete()
+        limit=self.get_relate_check_limit(request)
+        fw=FeatureWriter(Buildings, 'T********', area_field_name='area')
+        fw.insert(originalWkt, {'description': description}, limit=limit)
+
+        if fw.error == FeatureWriter.INVALID_GEOMETRY:
             return JsonResponse({'ok':False, 'message': 'The geometry is not valid after the st_SnapToGrid', 'data':[]}, status=200)   
+        if fw.error == FeatureWriter.RELATED_IDS:
+            ids=fw.get_related_ids()
+            n=len(ids)
+            print(f"Values: {ids}")
+            at_least='at least ' if fw.is_limit_reached() else ''
+            return JsonResponse({'ok':False, 'message': f'The building intersects with {at_least}{n} building/s', 'data':ids}, status=200)
+        print(f"Geometry inserted id: {fw.instance.id}")
 
-        #create a filter to get all the geometries which interiors intersects,
-        #but excluding the one just created
-        filt=Buildings.objects.filter(geom__relate=(b.geom.wkt,'T********')).exclude(id=b.id)
-        print(f"Query:{filt.query}")
-        exist=filt.exists()
-        print(f"Exists {exist}") 
-        n=filt.count() 
-        print(f"Count: {n}")
-        print(f"Values: {list(filt)}")
-        
-        if exist:
-            print(f"Deleting de building id {b.id}, as it intersects with others")
-            b.delete()
-            return JsonResponse({'ok':False, 'message': f'The building intersects with {n} building/s'}, status=200)
-        
-        #create a building object, from the model Buildings
-        d=model_to_dict(b)
-        d['geom']=b.geom.wkt
-        return JsonResponse({'ok':True, 'message': 'Data inserted', 'data': [d]}, status=201)
+        return JsonResponse({'ok':True, 'message': 'Data inserted', 'data': [fw.to_dict()]}, status=201)
 
     def update(self, request, id):
         """
@@ -173,13 +137,14 @@ class BuildingsView(LoginRequiredMixin, BaseDjangoView):
         originalWkt=request.POST.get('geom', None)
         
         if originalWkt is not None:
-            conversor=WkbConversor()
-            wkb=conversor.set_wkt_from_text(originalWkt)
-            newWkt=conversor.get_as_wkt()
-            geojson=conversor.get_as_geojson()
-            gc=GeometryChecks(wkb)
-            isValid=gc.is_geometry_valid()
-            interesectionIds=gc.check_st_relate('buildings_buildings','T********', id_to_avoid=id)
+            #snap, validation, relate check and output formats in one query
+            gc=GeometryPreparer()
+            wkb=gc.prepare(originalWkt, 'buildings_buildings', 'T********', id_to_avoid=id,
+                           limit=self.get_relate_check_limit(request))
+            newWkt=gc.get_as_wkt()
+            geojson=gc.get_as_geojson()
+            isValid=gc.is_valid
+            interesectionIds=gc.related_ids
             thereAre = gc.are_there_related_ids()
 
             print(f"Snaped wkt: {newWkt}")
@@ -195,11 +160,10 @@ class BuildingsView(LoginRequiredMixin, BaseDjangoView):
                 return JsonResponse({'ok':False, 'message': gc.get_relate_message(), 'data':gc.related_ids}, status=200)   
             b.geom=wkb
             b.description=request.POST.get('description', '')
-            polyGeos=GEOSGeometry(wkb)
-            b.area=polyGeos.area
+            b.area=gc.area
             b.save()
             d=model_to_dict(b)
-            d['geom']=conversor.get_as_wkt()#snaped version
+            d['geom']=newWkt#snaped version
         else:
             return JsonResponse({'ok':False, 'message': 'Update. The geometry is mandartory', 'data':[]}, status=200)
         
@@ -226,11 +190,10 @@ class BuildingsView(LoginRequiredMixin, BaseDjangoView):
         originalWkt=request.POST.get('geom', None)
         
         if originalWkt is not None:
-            conversor=WkbConversor()
-            wkb=conversor.set_wkt_from_text(originalWkt)
-            gc=GeometryChecks(wkb)
-            isValid=gc.is_geometry_valid()
-            gc.check_st_relate('buildings_buildings','T********')
+            gc=GeometryPreparer()
+            wkb=gc.prepare(originalWkt, 'buildings_buildings', 'T********',
+                           limit=self.get_relate_check_limit(request))
+            isValid=gc.is_valid
             print(gc.get_relate_message())
 
             if not(isValid):
@@ -241,10 +204,10 @@ class BuildingsView(LoginRequiredMixin, BaseDjangoView):
             b=Buildings()
             b.geom=wkb
             b.description=request.POST.get('description', '')
-            b.area=b.geom.area
+            b.area=gc.area
             b.save()
             d=model_to_dict(b)
-            d['geom']=b.geom.wkt
+            d['geom']=gc.get_as_wkt()
         else:
             return JsonResponse({'ok':False, 'message': 'The geometry mandartory', 'data':[]}, status=200)
 
@@ -252,7 +215,22 @@ class BuildingsView(LoginRequiredMixin, BaseDjangoView):
 
 
 
-class BuildingsModelViewSet(viewsets.ModelViewSet):
+class BuildingsAsyncView(AsyncBaseDjangoView):
+    """
+    Async variant of BuildingsView, for the ASGI server. The geometry checks are the
+    rules of buildings_buildings in core/myLib/layerRules.py.
+    It needs the user to be logged in, as BuildingsView.
+        GET /buildings/buildings_async/selectone/<id>/
+        GET /buildings/buildings_async/selectall/
+        POST /buildings/buildings_async/insert/
+        POST /buildings/buildings_async/update/<id>/
+        POST /buildings/buildings_async/delete/<id>/
+    """
+    model = Buildings
+    login_required = True
+
+
+class BuildingsModelViewSet(GeoModelViewSet):
     """
     DJANGO REST FRAMEWORK VIEWSET.
 
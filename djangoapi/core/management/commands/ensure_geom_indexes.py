@@ -0,0 +1,58 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.contrib.gis.db.models import GeometryField
+
+class Command(BaseCommand):
+    """
+    Ensures that every geometry field of the installed models
+    (Buildings, Parcels, Roads, Addresses, ...) has a GiST index.
+    The tables loaded with pg_restore, ogr2ogr or pgAdmin may not have it,
+    and without it every relate check is a full scan of the table.
+
+    Usage:
+        python manage.py ensure_geom_indexes
+        python manage.py ensure_geom_indexes --dry-run
+    """
+    help = "Creates the missing GiST indexes on the geometry fields of the models"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only prints the indexes that would be created')
+
+    def handle(self, *args, **options):
+        for model in apps.get_models():
+            for field in model._meta.get_fields():
+                if not isinstance(field, GeometryField):
+                    continue
+                table_name = model._meta.db_table
+                column = field.column
+                if self.has_gist_index(table_name, column):
+                    self.stdout.write(f"{table_name}.{column}: GiST index exists")
+                    continue
+                if options['dry_run']:
+                    self.stdout.write(f"{table_name}.{column}: GiST index missing")
+                    continue
+                self.create_gist_index(table_name, column)
+                self.stdout.write(self.style.SUCCESS(f"{table_name}.{column}: GiST index created"))
+
+    def has_gist_index(self, table_name: str, column: str)->bool:
+        q = """SELECT 1
+                FROM pg_index i
+                    JOIN pg_class t ON t.oid = i.indrelid
+                    JOIN pg_class ic ON ic.oid = i.indexrelid
+                    JOIN pg_am am ON am.oid = ic.relam
+                    JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = ANY(i.indkey)
+                WHERE t.relname = %s AND a.attname = %s AND am.amname = 'gist'
+            """
+        with connection.cursor() as cursor:
+            cursor.execute(q, [table_name, column])
+            return cursor.fetchone() is not None
+
+    def create_gist_index(self, table_name: str, column: str):
+        qn = connection.ops.quote_name
+        index_name = qn(f"{table_name}_{column}_gist")
+        with connection.cursor() as cursor:
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {qn(table_name)} USING GIST ({qn(column)})")
+            #the planner needs the statistics to choose the index
+            cursor.execute(f"ANALYZE {qn(table_name)}")
@@ -2,3 +2,39 @@ from django.db import models
 from django.contrib.gis.db import models as gis_models
 # Create your models here.
 
+class LayerVersion(models.Model):
+    """
+    Counter of the changes of every layer (core/myLib/layers.py). It is
+    incremented every time layer_changed is sent, by core/signals.py.
+    The exports use it to know if their cached files are still valid.
+    """
+    layer_name = models.CharField(max_length=100, unique=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.layer_name} v{self.version}"
+
+class LayerChange(models.Model):
+    """
+    Log of the inserted, updated and deleted features of the layers, for the
+    change feed and the incremental exports (core/myLib/changes.py).
+    xid is the id of the transaction that made the change.
+    """
+    INSERT = 'insert'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    OPERATION_CHOICES = [(INSERT, 'Insert'), (UPDATE, 'Update'), (DELETE, 'Delete')]
+
+    layer_name = models.CharField(max_length=100)
+    feature_id = models.BigIntegerField()
+    operation = models.CharField(max_length=10, choices=OPERATION_CHOICES)
+    xid = models.BigIntegerField()
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['layer_name', 'xid', 'id'])]
+
+    def __str__(self):
+        return f"{self.layer_name} {self.feature_id} {self.operation}"
+
@@ -0,0 +1,274 @@
+"""
+Async variant of BaseDjangoView, for the ASGI server (djangoapi/asgi.py).
+
+The actions selectone, selectall, insert, update and delete are coroutines,
+so while a request waits for PostgreSQL the process serves other requests.
+The queries of the ORM use its async API (afirst, asave, adelete, async for,
+aiterator). The raw queries of GeometryPreparer and FeatureWriter (snap,
+validity, ST_Relate) run with sync_to_async in the thread of the request,
+because Django does not have async database cursors: they block that thread,
+not the event loop.
+
+The subclasses only set the model. The rules of the geometry (relation 9IM,
+container, area and length fields) are the ones of the layer in
+core/myLib/layerRules.py, so they are the same as in the sync views, the
+imports and the QA scans:
+
+    class BuildingsAsyncView(AsyncBaseDjangoView):
+        model = Buildings
+        login_required = True
+
+    path('buildings_async/selectone/<int:id>/', views.BuildingsAsyncView.as_view(), {'action': 'selectone'}),
+    path('buildings_async/selectall/', views.BuildingsAsyncView.as_view(), {'action': 'selectall'}),
+    path('buildings_async/insert/', views.BuildingsAsyncView.as_view(), {'action': 'insert'}),
+    path('buildings_async/update/<int:id>/', views.BuildingsAsyncView.as_view(), {'action': 'update'}),
+    path('buildings_async/delete/<int:id>/', views.BuildingsAsyncView.as_view(), {'action': 'delete'}),
+
+insert and update take the geometry in geom (wkt or geojson) and the other
+fields of the model by their name, in the body of the POST.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.contrib.gis.geos import GEOSGeometry, GEOSException
+from django.core.exceptions import ValidationError
+from django.forms.models import model_to_dict
+from django.http import JsonResponse
+
+from djangoapi.settings import LOGIN_URL, MAX_NUMBER_OF_RETRIEVED_ROWS, \
+    STREAMING_CHUNK_SIZE, MAX_NUMBER_OF_STREAMED_ROWS
+from .baseDjangoView import BaseDjangoView
+from .binaryOutput import get_attribute_fields
+from .featureWriter import FeatureWriter
+from .geometryTools import GeometryPreparer
+from .geoOutput import annotate_geom_formats, get_geom_output_options, is_geodetic
+from .layerRules import LAYER_RULES
+from .pagination import akeyset_page
+from .responseCache import ResponseCache
+from .streaming import wants_streaming, astream_json_response
+
+class AsyncBaseDjangoView(BaseDjangoView):
+    """
+    DJANGO ASYNC CLASS BASED VIEW
+
+    The same urls and responses as BaseDjangoView, but all the handlers
+    are coroutines. login_required works as LoginRequiredMixin, which
+    can not be used in async views.
+    """
+    login_required = False
+
+    async def dispatch(self, request, *args, **kwargs):
+        if self.login_required:
+            user=await request.auser()
+            if not user.is_authenticated:
+                return redirect_to_login(request.get_full_path(), LOGIN_URL)
+        return await super().dispatch(request, *args, **kwargs)
+
+    async def get(self, request, *args, **kwargs):
+        action=kwargs.get('action')
+        if action == 'selectone':
+            id=kwargs.get('id')
+            return await self.cached_response(request, lambda: self.selectone(id))
+        elif action == 'selectall':
+            return await self.cached_response(request, self.selectall)
+        return JsonResponse({"message": "Invalid operation option"}, status=400)
+
+    async def post(self, request, *args, **kwargs):
+        action=kwargs.get('action')
+        if action == 'insert':
+            return await self.insert(request)
+        elif action == 'update':
+            return await self.update(request, kwargs.get('id'))
+        elif action == 'delete':
+            return await self.delete(kwargs.get('id'))
+        return JsonResponse({"message": "Invalid operation option"}, status=400)
+
+    async def cached_response(self, request, compute):
+        """
+        The same as BaseDjangoView.cached_response, with compute a coroutine function
+        """
+        rc=await sync_to_async(ResponseCache)(request, self.get_layer_name())
+        response=await sync_to_async(rc.lookup)()
+        if response is None:
+            response=await sync_to_async(rc.store)(await compute())
+        return response
+
+    def get_layer_name(self)->str:
+        return self.model._meta.db_table
+
+    def get_rules(self):
+        return LAYER_RULES[self.get_layer_name()]
+
+    def get_verbose_name(self)->str:
+        return self.model._meta.verbose_name
+
+    def get_fields(self, query_dict)->dict:
+        """
+        The values of the attributes of the model in the request, converted
+        to their type. The id, the area, the length and the fields that are not
+        editable (updated_at, row_version) are not taken: the area and the length
+        are computed from the geometry.
+        Raises ValidationError if a value is not correct
+        """
+        rules=self.get_rules()
+        computed=(rules.area_field_name, rules.length_field_name)
+        fields={}
+        for field in get_attribute_fields(self.model):
+            if field.primary_key or not field.editable or field.attname in computed or field.attname not in query_dict:
+                continue
+            value=query_dict.get(field.attname)
+            fields[field.attname]=None if value == '' and field.null else field.to_python(value)
+        return fields
+
+    def check_geometry_type(self, geom_text: str)->str:
+        """
+        Parses the geometry in process and returns an error message if it can not
+        be read or its type is not the type of the geometry field. None if it is correct
+        """
+        try:
+            g=GEOSGeometry(geom_text)
+        except (ValueError, TypeError, GEOSException) as e:
+            return f'The geometry can not be read: {e}'
+        geom_type=self.model._meta.get_field('geom').geom_type
+        if geom_type != 'GEOMETRY' and g.geom_type.upper() != geom_type:
+            return f'The geometry must be a {geom_type.capitalize()}'
+        return None
+
+    def check_error_response(self, error: str, preparer: GeometryPreparer):
+        """
+        Response of a geometry that does not pass the checks of the layer
+        """
+        name=self.get_verbose_name()
+        if error == FeatureWriter.INVALID_GEOMETRY:
+            return JsonResponse({'ok':False, 'message': f'The {name} geometry is not valid after the st_SnapToGrid', 'data':[]}, status=400)
+        if error == FeatureWriter.RELATED_IDS:
+            return JsonResponse({'ok':False, 'message': preparer.get_relate_message(),
+                                 'data':[r[0] for r in preparer.related_ids]}, status=400)
+        return JsonResponse({'ok':False, 'message': f'The {name} must be within a feature of {self.get_rules().container_table}', 'data':[]}, status=400)
+
+    #GET OPERATIONS
+    async def selectone(self, id):
+        queryset=annotate_geom_formats(self.model.objects.filter(id=id), ('wkt',))
+        feature=await queryset.afirst()
+        if feature is None:
+            return JsonResponse({'ok':False, 'message': f'The {self.get_verbose_name()} id {id} does not exist', 'data':[]}, status=404)
+        return JsonResponse({'ok':True, 'message': f'{self.get_verbose_name().capitalize()} retrieved', 'data': [self.feature_to_dict(feature)]}, status=200)
+
+    async def selectall(self):
+        return await self.selectall_response(self.model.objects.all(), 'Data retrieved')
+
+    async def selectall_response(self, queryset, message: str='Data retrieved'):
+        """
+        The same as BaseDjangoView.selectall_response: a page with keyset pagination,
+        or all the rows streamed with stream=true, read with aiterator
+        """
+        #the first time it reads the srid in spatial_ref_sys, with a sync query
+        geodetic=await sync_to_async(is_geodetic)(queryset.model)
+        try:
+            options=get_geom_output_options(self.request.GET, geodetic)
+        except ValueError as e:
+            return JsonResponse({'ok':False, 'message': str(e), 'data': []}, status=400)
+        queryset=annotate_geom_formats(queryset, ('wkt',), **options)
+        if wants_streaming(self.request.GET):
+            queryset=queryset.order_by('id')
+            if MAX_NUMBER_OF_STREAMED_ROWS > 0:
+                queryset=queryset[:MAX_NUMBER_OF_STREAMED_ROWS]
+
+            async def rows():
+                async for f in queryset.aiterator(chunk_size=STREAMING_CHUNK_SIZE):
+                    yield self.feature_to_dict(f)
+
+            return astream_json_response(True, message, rows())
+        try:
+            rows, next_url=await akeyset_page(queryset, self.request, MAX_NUMBER_OF_RETRIEVED_ROWS)
+        except ValueError:
+            return JsonResponse({'ok':False, 'message': 'The parameters after and page_size must be integers', 'data': []}, status=400)
+        data=[self.feature_to_dict(f) for f in rows]
+        return JsonResponse({'ok':True, 'message': message, 'data': data, 'next': next_url}, status=200)
+
+    #POST OPERATIONS
+    async def insert(self, request):
+        """
+        Checks the geometry with the rules of the layer and inserts the feature
+        with only one INSERT. See core/myLib/featureWriter.py
+        """
+        geom_text=request.POST.get('geom', None)
+        if geom_text is None:
+            return JsonResponse({'ok':False, 'message': 'The geometry is mandatory', 'data':[]}, status=400)
+        error=self.check_geometry_type(geom_text)
+        if error is not None:
+            return JsonResponse({'ok':False, 'message': error, 'data':[]}, status=400)
+        try:
+            fields=self.get_fields(request.POST)
+        except ValidationError as e:
+            return JsonResponse({'ok':False, 'message': ' '.join(e.messages), 'data':[]}, status=400)
+
+        rules=self.get_rules()
+        fw=FeatureWriter(self.model, rules.matrix9IM, container_table=rules.container_table,
+                         area_field_name=rules.area_field_name, length_field_name=rules.length_field_name)
+        await sync_to_async(fw.insert)(geom_text, fields, limit=self.get_relate_check_limit(request))
+        if fw.error is not None:
+            return self.check_error_response(fw.error, fw.preparer)
+        return JsonResponse({'ok':True, 'message': 'Data inserted', 'data': [fw.to_dict()]}, status=201)
+
+    async def update(self, request, id):
+        """
+        Checks the new geometry with the rules of the layer, without the feature
+        itself, and saves the feature with the geometry and the fields of the request
+        """
+        feature=await self.model.objects.filter(id=id).afirst()
+        if feature is None:
+            return JsonResponse({'ok':False, 'message': f'The {self.get_verbose_name()} id {id} does not exist', 'data':[]}, status=404)
+        geom_text=request.POST.get('geom', None)
+        if geom_text is None:
+            return JsonResponse({'ok':False, 'message': 'Update. The geometry is mandatory', 'data':[]}, status=400)
+        error=self.check_geometry_type(geom_text)
+        if error is not None:
+            return JsonResponse({'ok':False, 'message': error, 'data':[]}, status=400)
+        try:
+            fields=self.get_fields(request.POST)
+        except ValidationError as e:
+            return JsonResponse({'ok':False, 'message': ' '.join(e.messages), 'data':[]}, status=400)
+
+        rules=self.get_rules()
+        gp=GeometryPreparer()
+        if rules.matrix9IM is not None:
+            wkb=await sync_to_async(gp.prepare)(geom_text, self.get_layer_name(), rules.matrix9IM, id_to_avoid=id,
+                                                container_table=rules.container_table,
+                                                limit=self.get_relate_check_limit(request))
+        else:
+            wkb=await sync_to_async(gp.prepare)(geom_text, container_table=rules.container_table)
+        if not gp.is_valid:
+            return self.check_error_response(FeatureWriter.INVALID_GEOMETRY, gp)
+        if gp.are_there_related_ids():
+            return self.check_error_response(FeatureWriter.RELATED_IDS, gp)
+        if rules.container_table is not None and not gp.is_contained:
+            return self.check_error_response(FeatureWriter.NOT_CONTAINED, gp)
+
+        feature.geom=wkb
+        for name, value in fields.items():
+            setattr(feature, name, value)
+        if rules.area_field_name is not None:
+            setattr(feature, rules.area_field_name, gp.area)
+        if rules.length_field_name is not None:
+            setattr(feature, rules.length_field_name, gp.length)
+        await feature.asave()
+        d=self.feature_to_dict(feature, gp.wkt)
+        return JsonResponse({'ok':True, 'message': f'{self.get_verbose_name().capitalize()} updated', 'data':[d]}, status=200)
+
+    async def delete(self, id):
+        feature=await self.model.objects.filter(id=id).afirst()
+        if feature is None:
+            return JsonResponse({'ok':False, 'message': f'The {self.get_verbose_name()} id {id} does not exist', 'data':[]}, status=404)
+        await feature.adelete()
+        return JsonResponse({'ok':True, 'message': f'The {self.get_verbose_name()} id {id} has been deleted', 'data':[]}, status=200)
+
+    def feature_to_dict(self, feature, wkt: str=None)->dict:
+        """
+        The feature as a dict, with the geometry annotated as geom_wkt,
+        or the given wkt
+        """
+        if wkt is None:
+            return super().feature_to_dict(feature)
+        d=model_to_dict(feature, exclude=['geom'])
+        d['geom']=wkt
+        return d
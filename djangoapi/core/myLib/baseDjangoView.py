@@ -2,6 +2,23 @@
 from django.http import JsonResponse
 from django.views import View   
 
+from django.forms.models import model_to_dict
+
+from djangoapi.settings import RELATE_CHECK_LIMIT, MAX_NUMBER_OF_RETRIEVED_ROWS, \
+    STREAMING_CHUNK_SIZE, MAX_NUMBER_OF_STREAMED_ROWS
+from .geoOutput import annotate_geom_formats, get_geom_output_options, is_geodetic
+from .streaming import wants_streaming, stream_json_response
+from .pagination import keyset_page
+from .layers import get_layer_name
+from .responseCache import ResponseCache
+
+def wants_detailed_errors(query_dict)->bool:
+    """
+    True if the request has the parameter detailed_errors=true. Then
+    the geometry checks return all the conflicting ids, not only the first ones
+    """
+    return query_dict.get('detailed_errors', 'false').lower() in ('true', '1', 't')
+
 class BaseDjangoView(View):
     """
     DJANGO CLASS BASED VIEW
@@ -54,15 +71,21 @@ class BaseDjangoView(View):
         To call them, the URL must be like:
             GET /buildings_view/newgetmethod/
             POST /buildings_view/newpostmethod/       
+
+        If the model of the layer is set in the attribute model, the responses of
+        selectone and selectall are cached until the layer changes, with ETag
+        (core/myLib/responseCache.py).
     """
+    model = None
+
     def get(self, request, *args, **kwargs):
         """Handles the 'select' method with a GET request."""
         action=kwargs.get('action')
         if action == 'selectone':
             id = kwargs.get('id')
-            return self.selectone(id)
+            return self.cached_response(request, lambda: self.selectone(id))
         elif action == 'selectall':
-            return self.selectall()
+            return self.cached_response(request, self.selectall)
         else:            
             return JsonResponse({"message": "Invalid operation option"}, status=400)
 
@@ -81,6 +104,69 @@ class BaseDjangoView(View):
         else:
             JsonResponse({"message": "Invalid operation option"}, status=400)
     
+    def cached_response(self, request, compute):
+        """
+        Returns the response of the cache, or 304 if the client has it. If not,
+        the one made by compute(), which is saved in the cache
+        """
+        layer_name=get_layer_name(self.model) if self.model is not None else None
+        if layer_name is None:
+            return compute()
+        rc=ResponseCache(request, layer_name)
+        response=rc.lookup()
+        if response is None:
+            response=rc.store(compute())
+        return response
+
+    def get_relate_check_limit(self, request):
+        """
+        Returns the maximum number of conflicting ids the relate checks have
+        to search: None (all of them) if the request has detailed_errors=true,
+        RELATE_CHECK_LIMIT otherwise.
+        """
+        if wants_detailed_errors(request.POST) or wants_detailed_errors(request.GET):
+            return None
+        return RELATE_CHECK_LIMIT
+
+    def selectall_response(self, queryset, message: str='Data retrieved'):
+        """
+        Returns the rows of the queryset ordered by id, with the geometry in wkt made by PostGIS.
+        With the parameter stream=true, the rows are read with a server side cursor
+        and the response is streamed, up to MAX_NUMBER_OF_STREAMED_ROWS (0 = all).
+        If not, a JsonResponse with a page of up to MAX_NUMBER_OF_RETRIEVED_ROWS rows
+        (or page_size), and the url of the next page in next (keyset pagination on the id).
+            GET /buildings_view/selectall/?stream=true
+            GET /buildings_view/selectall/?after=1234&page_size=500
+        The geometries can be simplified in the database with simplify, precision or zoom:
+            GET /buildings_view/selectall/?zoom=12
+        """
+        try:
+            options=get_geom_output_options(self.request.GET, is_geodetic(queryset.model))
+        except ValueError as e:
+            return JsonResponse({'ok':False, 'message': str(e), 'data': []}, status=400)
+        queryset=annotate_geom_formats(queryset, ('wkt',), **options)
+        if wants_streaming(self.request.GET):
+            queryset=queryset.order_by('id')
+            if MAX_NUMBER_OF_STREAMED_ROWS > 0:
+                queryset=queryset[:MAX_NUMBER_OF_STREAMED_ROWS]
+            rows=(self.feature_to_dict(f) for f in queryset.iterator(chunk_size=STREAMING_CHUNK_SIZE))
+            return stream_json_response(True, message, rows)
+        try:
+            rows, next_url=keyset_page(queryset, self.request, MAX_NUMBER_OF_RETRIEVED_ROWS)
+        except ValueError:
+            return JsonResponse({'ok':False, 'message': 'The parameters after and page_size must be integers', 'data': []}, status=400)
+        data=[self.feature_to_dict(f) for f in rows]
+        return JsonResponse({'ok':True, 'message': message, 'data': data, 'next': next_url}, status=200)
+
+    def feature_to_dict(self, feature)->dict:
+        """
+        The feature as a dict, with the geometry annotated as geom_wkt.
+        The geometry field is deferred, so model_to_dict must not read it
+        """
+        d=model_to_dict(feature, exclude=['geom'])
+        d['geom']=feature.geom_wkt
+        return d
+
     #GET OPERATIONS
     def selectone(self, id):
         return JsonResponse({'ok':True, 'message': 'Method selectone called: GET', 'data': []}, status=200)
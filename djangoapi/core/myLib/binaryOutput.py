@@ -0,0 +1,187 @@
+"""
+Binary output formats of the features, for the list() of the geo viewsets.
+
+They are requested with the Accept header or with the parameter format
+(content negotiation of Django Rest Framework):
+    - wkb: records of the id and the WKB of the geometry, one after the other,
+        little endian: <int64 id><uint32 length of the wkb><wkb>. A null geometry
+        has length 0. Media type application/vnd.geo-wkb-records.
+    - fgb: FlatGeobuf, with all the fields and a spatial index. Made with the
+        GDAL python bindings. Media type application/flatgeobuf.
+    - arrow: Arrow IPC stream, with all the fields and the geometry as WKB
+        (geoarrow.wkb). Only if pyarrow is installed.
+        Media type application/vnd.apache.arrow.stream.
+
+The rows are read with a server side cursor, as tuples (values_list), without
+building a dict or a GEOS geometry per row. wkb and arrow are streamed. FlatGeobuf
+is written in memory (/vsimem/), as its header has the number of features and
+the index.
+
+Example:
+    GET /buildings/buildings/?format=fgb&bbox=...
+    curl -H "Accept: application/vnd.apache.arrow.stream" .../buildings/buildings/
+"""
+import io
+import json
+import struct
+import uuid
+
+from django.contrib.gis.db.models import GeometryField
+from django.http import HttpResponse, StreamingHttpResponse
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .ogrWriter import INTEGER_FIELD_TYPES, create_ogr_layer, write_ogr_features
+from djangoapi.settings import STREAMING_CHUNK_SIZE
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+WKB_RECORD_HEADER = struct.Struct('<qI')
+
+class BinaryRenderer(BaseRenderer):
+    """
+    The content of the binary formats is made in GeoModelViewSet.list(), from
+    the cursor. The renderers are only used for the content negotiation, and to
+    render the errors, that are dicts, as JSON.
+    """
+    charset=None
+    render_style='binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, (bytes, bytearray)):
+            return data
+        return JSONRenderer().render(data)
+
+class WkbRecordsRenderer(BinaryRenderer):
+    media_type='application/vnd.geo-wkb-records'
+    format='wkb'
+
+class FlatGeobufRenderer(BinaryRenderer):
+    media_type='application/flatgeobuf'
+    format='fgb'
+
+class ArrowRenderer(BinaryRenderer):
+    media_type='application/vnd.apache.arrow.stream'
+    format='arrow'
+
+BINARY_RENDERERS = [WkbRecordsRenderer, FlatGeobufRenderer]
+if pyarrow is not None:
+    BINARY_RENDERERS.append(ArrowRenderer)
+BINARY_FORMATS = tuple(r.format for r in BINARY_RENDERERS)
+
+def get_attribute_fields(model)->list:
+    """
+    The concrete fields of the model, except the geometries
+    """
+    return [f for f in model._meta.concrete_fields if not isinstance(f, GeometryField)]
+
+def iter_chunks(rows, rows_per_chunk: int=STREAMING_CHUNK_SIZE):
+    chunk=[]
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= rows_per_chunk:
+            yield chunk
+            chunk=[]
+    if len(chunk) > 0:
+        yield chunk
+
+def iter_wkb_records(rows):
+    """
+    rows: tuples (id, wkb)
+    """
+    for chunk in iter_chunks(rows):
+        parts=[]
+        for id, wkb in chunk:
+            wkb=bytes(wkb) if wkb is not None else b''
+            parts.append(WKB_RECORD_HEADER.pack(id, len(wkb)))
+            parts.append(wkb)
+        yield b''.join(parts)
+
+def wkb_records_response(rows)->StreamingHttpResponse:
+    """
+    rows: tuples (id, wkb)
+    """
+    return StreamingHttpResponse(iter_wkb_records(rows), content_type=WkbRecordsRenderer.media_type)
+
+def flatgeobuf_response(rows, fields: list, srid: int, layer_name: str)->HttpResponse:
+    """
+    rows: tuples with the values of the fields and the wkb at the end
+    """
+    from osgeo import gdal, ogr
+    gdal.UseExceptions()
+    path=f'/vsimem/{uuid.uuid4().hex}.fgb'
+    try:
+        ds=ogr.GetDriverByName('FlatGeobuf').CreateDataSource(path)
+        layer=create_ogr_layer(ds, layer_name, fields, srid)
+        write_ogr_features(layer, rows)
+        ds=None #closes the file and writes the index
+        f=gdal.VSIFOpenL(path, 'rb')
+        content=gdal.VSIFReadL(1, gdal.VSIStatL(path).size, f)
+        gdal.VSIFCloseL(f)
+    finally:
+        gdal.Unlink(path)
+    response=HttpResponse(content, content_type=FlatGeobufRenderer.media_type)
+    response['Content-Disposition']=f'attachment; filename="{layer_name}.fgb"'
+    return response
+
+def arrow_type(field):
+    internal_type=field.get_internal_type()
+    if internal_type in INTEGER_FIELD_TYPES:
+        return pyarrow.int64()
+    if internal_type in ('FloatField', 'DecimalField'):
+        return pyarrow.float64()
+    if internal_type == 'BooleanField':
+        return pyarrow.bool_()
+    if internal_type == 'DateField':
+        return pyarrow.date32()
+    if internal_type == 'DateTimeField':
+        return pyarrow.timestamp('us', tz='UTC')
+    return pyarrow.string()
+
+def arrow_schema(fields: list, srid: int, geom_field_name: str='geom'):
+    crs={'id': {'authority': 'EPSG', 'code': srid}}
+    columns=[pyarrow.field(f.attname, arrow_type(f)) for f in fields]
+    columns.append(pyarrow.field(geom_field_name, pyarrow.binary(),
+                                 metadata={'ARROW:extension:name': 'geoarrow.wkb',
+                                           'ARROW:extension:metadata': json.dumps({'crs': crs})}))
+    geo={'version': '1.0.0', 'primary_column': geom_field_name,
+         'columns': {geom_field_name: {'encoding': 'WKB', 'geometry_types': [], 'crs': crs}}}
+    return pyarrow.schema(columns, metadata={'geo': json.dumps(geo)})
+
+def arrow_column(values, field):
+    if field.get_internal_type() == 'DecimalField':
+        return [float(v) if v is not None else None for v in values]
+    return values
+
+def iter_arrow_stream(rows, fields: list, srid: int, geom_field_name: str='geom'):
+    """
+    One record batch for every STREAMING_CHUNK_SIZE rows
+    """
+    schema=arrow_schema(fields, srid, geom_field_name)
+    sink=io.BytesIO()
+
+    def pop():
+        content=sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return content
+
+    with pyarrow.ipc.new_stream(sink, schema) as writer:
+        for chunk in iter_chunks(rows):
+            columns=list(zip(*chunk))
+            arrays=[pyarrow.array(arrow_column(columns[i], f), type=schema.field(i).type) for i, f in enumerate(fields)]
+            arrays.append(pyarrow.array([bytes(g) if g is not None else None for g in columns[-1]], type=pyarrow.binary()))
+            writer.write_batch(pyarrow.record_batch(arrays, schema=schema))
+            yield pop()
+    yield pop()
+
+def arrow_response(rows, fields: list, srid: int, geom_field_name: str='geom')->StreamingHttpResponse:
+    """
+    rows: tuples with the values of the fields and the wkb at the end
+    """
+    return StreamingHttpResponse(iter_arrow_stream(rows, fields, srid, geom_field_name),
+                                 content_type=ArrowRenderer.media_type)
@@ -0,0 +1,122 @@
+"""
+Change feed of the layers.
+
+Every insert, update and delete of a feature is written in core.models.LayerChange,
+in the same transaction, by send_layer_changed() (core/myLib/layers.py), with the
+id of the transaction (pg_current_xact_id, PostgreSQL 13 or newer).
+
+The clients read the changes since a token, and receive the token of the next
+request. The token is <xid>.<id>. Only the changes of the transactions older than
+the oldest transaction still running are returned (xid < xmin of the snapshot), so
+a transaction that commits late can not be skipped: its changes have a bigger or
+equal xid than the token.
+
+Example:
+    changes=get_changes('buildings_buildings', '0.0', 1000)
+    changes['inserted'], changes['updated'] -> ids of the features to insert or update
+    changes['deleted'] -> ids of the features to delete
+    changes['next'] -> token of the next request
+"""
+from django.db import connection
+from django.db.models import Q, Func, BigIntegerField
+
+from core.models import LayerChange
+
+class CurrentXactId(Func):
+    """
+    Id of the current transaction, as bigint
+    """
+    template='pg_current_xact_id()::text::bigint'
+    output_field=BigIntegerField()
+
+def snapshot_xmin()->int:
+    """
+    The oldest transaction still running. All the transactions with a
+    smaller id have already finished.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+        return cursor.fetchone()[0]
+
+def current_token()->str:
+    """
+    Token of the current state of the data. The changes made after it
+    will be returned by get_changes(layer_name, current_token())
+    """
+    return f'{snapshot_xmin()}.0'
+
+def parse_token(token: str)->tuple:
+    """
+    Returns (xid, id). Raises ValueError if it is not correct.
+    None or '' is the beginning of the log.
+    """
+    if token is None or token == '':
+        return 0, 0
+    parts=token.split('.')
+    if len(parts) != 2:
+        raise ValueError(f"The token {token} is not correct. It must be <xid>.<id>")
+    xid, id=int(parts[0]), int(parts[1])
+    if xid < 0 or id < 0:
+        raise ValueError(f"The token {token} is not correct. It must be <xid>.<id>")
+    return xid, id
+
+def record_changes(layer_name: str, ids: list, operation: str):
+    """
+    Writes the changes of the features in the log, in the current transaction
+    """
+    LayerChange.objects.bulk_create([LayerChange(layer_name=layer_name, feature_id=id, operation=operation,
+                                                 xid=CurrentXactId()) for id in ids], batch_size=1000)
+
+def changes_since(layer_name: str, token: str, xmin: int=None):
+    """
+    Queryset of the changes of the layer after the token, in order
+    """
+    since_xid, since_id=parse_token(token)
+    if xmin is None:
+        xmin=snapshot_xmin()
+    return (LayerChange.objects.filter(layer_name=layer_name, xid__lt=xmin)
+            .filter(Q(xid__gt=since_xid) | Q(xid=since_xid, id__gt=since_id))
+            .order_by('xid', 'id'))
+
+def changed_ids_since(layer_name: str, token: str):
+    """
+    Queryset with the ids of the features inserted or updated after the token,
+    to filter the layer: Buildings.objects.filter(id__in=changed_ids_since(...))
+    """
+    return (changes_since(layer_name, token)
+            .filter(operation__in=(LayerChange.INSERT, LayerChange.UPDATE))
+            .values('feature_id'))
+
+def get_changes(layer_name: str, token: str, limit: int)->dict:
+    """
+    Returns at most limit changes after the token, grouped by feature: the
+    features inserted, updated or deleted, and the token of the next request.
+    A feature inserted and deleted in the same changes is not returned.
+    Raises ValueError if the token is not correct
+    """
+    since_xid, since_id=parse_token(token)
+    xmin=snapshot_xmin()
+    rows=list(changes_since(layer_name, token, xmin).values_list('id', 'xid', 'feature_id', 'operation')[:limit + 1])
+    has_more=len(rows) > limit
+    rows=rows[:limit]
+    if has_more:
+        next_token=f'{rows[-1][1]}.{rows[-1][0]}'
+    else:
+        next_token=f'{xmin}.0' if xmin > since_xid else f'{since_xid}.{since_id}'
+
+    first_operation={}
+    last_operation={}
+    for id, xid, feature_id, operation in rows:
+        first_operation.setdefault(feature_id, operation)
+        last_operation[feature_id]=operation
+    inserted, updated, deleted=[], [], []
+    for feature_id, operation in last_operation.items():
+        if operation == LayerChange.DELETE:
+            if first_operation[feature_id] != LayerChange.INSERT:
+                deleted.append(feature_id)
+        elif first_operation[feature_id] == LayerChange.INSERT:
+            inserted.append(feature_id)
+        else:
+            updated.append(feature_id)
+    return {'since': f'{since_xid}.{since_id}', 'next': next_token, 'has_more': has_more,
+            'inserted': inserted, 'updated': updated, 'deleted': deleted}
@@ -0,0 +1,100 @@
+from django.forms.models import model_to_dict
+
+from .geometryTools import GeometryPreparer
+
+class FeatureWriter:
+    """
+    Inserts a feature of a model with geometry, checking the geometry before
+    writing anything to the database.
+
+    With GeometryPreparer, in only one query, the geometry is snapped to the grid,
+    checked (validity, relation 9IM with the geometries of the table, and
+    optionally containment in other table), and the area and length are computed.
+    Only if all the checks pass, the feature is saved with exactly one INSERT.
+    The rejected features do not write anything: no insert-snap-delete,
+    no dead rows and no burned ids.
+
+    After insert(), the attribute error is one of:
+        - None: the feature has been inserted. It is in the attribute instance.
+        - INVALID_GEOMETRY: the snapped geometry is not valid.
+        - RELATED_IDS: there are geometries in the table with the relation 9IM.
+            The ids are in preparer.related_ids.
+        - NOT_CONTAINED: the geometry is not inside any geometry of the container_table.
+
+    Example:
+        fw=FeatureWriter(Buildings, 'T********', area_field_name='area')
+        b=fw.insert(originalWkt, {'description': description}, limit=limit)
+        if fw.error == FeatureWriter.INVALID_GEOMETRY:
+            ...
+        if fw.error == FeatureWriter.RELATED_IDS:
+            ids=fw.get_related_ids()
+    """
+    INVALID_GEOMETRY = 'invalid_geometry'
+    RELATED_IDS = 'related_ids'
+    NOT_CONTAINED = 'not_contained'
+
+    def __init__(self, model, matrix9IM: str=None, container_table: str=None,
+                 area_field_name: str=None, length_field_name: str=None):
+        self.model=model
+        self.matrix9IM=matrix9IM
+        self.container_table=container_table
+        self.area_field_name=area_field_name
+        self.length_field_name=length_field_name
+
+        self.preparer=GeometryPreparer()
+        self.instance=None
+        self.error=None
+
+    def get_table_name(self):
+        return self.model._meta.db_table
+
+    def insert(self, geom_text: str, fields: dict, limit: int=None):
+        """
+        Checks the geometry and, if it is correct, inserts the feature
+        with the rest of the fields. Returns the instance, or None if
+        any check fails. The reason is in the attribute error.
+        limit: maximum number of related ids searched.
+        """
+        gp=self.preparer
+        if self.matrix9IM is not None:
+            wkb=gp.prepare(geom_text, self.get_table_name(), self.matrix9IM,
+                           container_table=self.container_table, limit=limit)
+        else:
+            wkb=gp.prepare(geom_text, container_table=self.container_table)
+
+        self.instance=None
+        if not gp.is_valid:
+            self.error=self.INVALID_GEOMETRY
+        elif gp.are_there_related_ids():
+            self.error=self.RELATED_IDS
+        elif self.container_table is not None and not gp.is_contained:
+            self.error=self.NOT_CONTAINED
+        else:
+            self.error=None
+        if self.error is not None:
+            return None
+
+        values=dict(fields)
+        if self.area_field_name is not None:
+            values[self.area_field_name]=gp.area
+        if self.length_field_name is not None:
+            values[self.length_field_name]=gp.length
+        self.instance=self.model.objects.create(geom=wkb, **values)
+        return self.instance
+
+    def get_related_ids(self)->list:
+        """
+        Returns the ids with the relation 9IM as a flat list
+        """
+        return [r[0] for r in self.preparer.related_ids]
+
+    def is_limit_reached(self)->bool:
+        return self.preparer.is_limit_reached()
+
+    def to_dict(self)->dict:
+        """
+        Returns the inserted feature as a dict, with the snapped geometry in wkt
+        """
+        d=model_to_dict(self.instance)
+        d['geom']=self.preparer.get_as_wkt()
+        return d
@@ -3,8 +3,10 @@ from django.db import connection
 
 from rest_framework import serializers
 
-from djangoapi.settings import EPSG_FOR_GEOMETRIES, ST_SNAP_PRECISION
-from .geometryTools import WkbConversor, GeometryChecks
+from djangoapi.settings import EPSG_FOR_GEOMETRIES, ST_SNAP_PRECISION, RELATE_CHECK_LIMIT
+from .geometryTools import GeometryPreparer
+from .baseDjangoView import wants_detailed_errors
+from .geoOutput import GEOM_FORMATS
 
 class GeoModelSerializer(serializers.ModelSerializer):
     """
@@ -15,10 +17,15 @@ class GeoModelSerializer(serializers.ModelSerializer):
         -geom: the geometry field
     The serializer will return the geometry in WKT and GEOJSON format,
         in the fields 'geom_geojson' and 'geom_wkt'.
+    If the queryset has been annotated with annotate_geom_formats() (core/myLib/geoOutput.py),
+        the strings computed by PostGIS are returned untouched. Only the formats in the
+        context 'geom_formats' are returned (GeoModelViewSet sets it from ?geom_format=).
     """
     check_geometry_is_valid = True #if true it will check if the geometry is valid: not self-intersecting and closed
     check_st_relation = True #if true it will chck the relation of the geometry with the other geometries
     matrix9IM = 'T********' #matrix 9IM for the relation of the geometries: 'T********' = interiors intersects
+    area_field_name = None #field of the model where the bulk operations store the area of the geometry
+    length_field_name = None #field of the model where the bulk operations store the length of the geometry
     geom = serializers.CharField(write_only=True) # Este campo es para input. No se devuelve en GETs
     geom_geojson = serializers.SerializerMethodField()  # Este campo es para serialización (output)
     geom_wkt = serializers.SerializerMethodField()  # Este campo es para serialización (output)
@@ -32,34 +39,89 @@ class GeoModelSerializer(serializers.ModelSerializer):
         value stored in the database
         """
         print('validate_geom')
-        c=WkbConversor()
-        wkb=c.set_wkt_from_text(value)
-        gc=GeometryChecks(wkb)
-        if self.check_geometry_is_valid:
-            if not gc.is_geometry_valid():
-                raise serializers.ValidationError('Invalid geometry. May be self-intersecting or not closed.')
+        if self.context.get('batch_geometry_checks'):
+            #bulk operations: the geometries of all the items are checked
+            #together by the viewset, with BatchGeometryChecks
+            return value
+        #snap, validity and relate check are done in only one query
+        gc=GeometryPreparer()
         if self.check_st_relation:
             #we have to know if we are editing (UPDATE) or inserting (CREATE)
             if self.instance:
                 print("It is an UPDATE. You must remove the current geometry from the checks")
-                gc.check_st_relate(self.get_table_name(),self.matrix9IM, self.instance.id)
-                if gc.are_there_related_ids():
-                    raise serializers.ValidationError(gc.get_relate_message())
+                wkb=gc.prepare(value, self.get_table_name(), self.matrix9IM, self.instance.id,
+                               limit=self.get_relate_check_limit(),
+                               check_validity=self.check_geometry_is_valid)
             else:
                 print("It is a CREATE.")
-                gc.check_st_relate(self.get_table_name(),self.matrix9IM)        
-                if gc.are_there_related_ids():
-                    raise serializers.ValidationError(gc.get_relate_message())        
+                wkb=gc.prepare(value, self.get_table_name(), self.matrix9IM,
+                               limit=self.get_relate_check_limit(),
+                               check_validity=self.check_geometry_is_valid)
+        else:
+            wkb=gc.prepare(value)
+        if self.check_geometry_is_valid:
+            if not gc.is_valid:
+                raise serializers.ValidationError('Invalid geometry. May be self-intersecting or not closed.')
+        if gc.are_there_related_ids():
+            raise serializers.ValidationError(gc.get_relate_message())
+        #create() and update() store its area and length
+        self.prepared_geometry=gc
         return wkb
+
+    def set_geometry_fields(self, validated_data: dict):
+        """
+        Sets the area and length of the snapped geometry in the fields area_field_name
+        and length_field_name, as the bulk operations do
+        """
+        gc=getattr(self, 'prepared_geometry', None)
+        if gc is None or 'geom' not in validated_data:
+            return
+        if self.area_field_name is not None:
+            validated_data[self.area_field_name]=gc.area
+        if self.length_field_name is not None:
+            validated_data[self.length_field_name]=gc.length
+
+    def create(self, validated_data):
+        self.set_geometry_fields(validated_data)
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        self.set_geometry_fields(validated_data)
+        return super().update(instance, validated_data)
     
+    def get_relate_check_limit(self):
+        """
+        Returns the maximum number of conflicting ids the relate check has to search:
+        None (all of them) if the request has detailed_errors=true, RELATE_CHECK_LIMIT otherwise.
+        """
+        request=self.context.get('request')
+        if request is not None and wants_detailed_errors(request.query_params):
+            return None
+        return RELATE_CHECK_LIMIT
+
+    def get_fields(self):
+        """Removes the output geometry fields not requested in the context 'geom_formats'"""
+        fields=super().get_fields()
+        geom_formats=self.context.get('geom_formats')
+        if geom_formats is not None:
+            for geom_format in GEOM_FORMATS:
+                if geom_format not in geom_formats:
+                    fields.pop(f'geom_{geom_format}', None)
+        return fields
+
     def get_geom_geojson(self, obj):
         """Obtiene la geometría en formato WKT a partir de WKB usando PostGIS."""
         # print('get_geom_asgeojson ')
+        #annotated by annotate_geom_formats: the string made by PostGIS
+        if hasattr(obj, 'geom_geojson'):
+            return obj.geom_geojson
         return obj.geom.geojson
     
     def get_geom_wkt(self, obj):
         """Obtiene la geometría en formato WKT a partir de WKB usando PostGIS."""
         # print('get_geom_wkt')
+        if hasattr(obj, 'geom_wkt'):
+            return obj.geom_wkt
         return obj.geom.wkt
         
     def get_table_name(self):
@@ -118,11 +180,16 @@ class GeoModelSerializer2(serializers.ModelSerializer):
     def get_geom_geojson(self, obj):
         """Obtiene la geometría en formato WKT a partir de WKB usando PostGIS."""
         print('get_geom_asgeojson 4')
+        #annotated by annotate_geom_formats: no query per row
+        if hasattr(obj, 'geom_geojson'):
+            return obj.geom_geojson
         return self.get_geometry_as_geojson(obj.id)
     
     def get_geom_wkt(self, obj):
         """Obtiene la geometría en formato WKT a partir de WKB usando PostGIS."""
         print('get_geom_wkt')
+        if hasattr(obj, 'geom_wkt'):
+            return obj.geom_wkt
         return self.get_geometry_as_wkt(obj.id)
 
     def get_geometry_as_geojson(self, model_id):
@@ -0,0 +1,404 @@
+from django.db import transaction
+from django.utils import timezone
+
+from rest_framework import viewsets, status, serializers
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.settings import api_settings
+
+from .geometryTools import BatchGeometryChecks
+from .baseDjangoView import wants_detailed_errors
+from .geoOutput import get_geom_formats, get_geom_output_options, annotate_geom_formats, is_geodetic, wkb_geometry
+from .binaryOutput import (BINARY_RENDERERS, BINARY_FORMATS, get_attribute_fields,
+                           wkb_records_response, flatgeobuf_response, arrow_response)
+from .streaming import wants_streaming, stream_json_array_response
+from .pagination import IdCursorPagination
+from .spatialFilters import SpatialFilterBackend
+from .layers import geometry_extent, send_layer_changed, get_layer_name
+from .responseCache import ResponseCache, has_row_version, feature_validators, list_validators
+from core.models import LayerChange
+from djangoapi.settings import RELATE_CHECK_LIMIT, STREAMING_CHUNK_SIZE
+
+#the ids are integer (serial) columns
+MAX_FEATURE_ID = 2**31 - 1
+INVALID_ID_MESSAGE = 'The id must be a positive integer.'
+
+def is_feature_id(value)->bool:
+    """
+    True if the id of a bulk item can be used in the queries: a positive integer
+    of the json, not a string, a bool, a list or a dict
+    """
+    return isinstance(value, int) and not isinstance(value, bool) and 0 < value <= MAX_FEATURE_ID
+
+class GeoModelViewSet(viewsets.ModelViewSet):
+    """
+    DJANGO REST FRAMEWORK VIEWSET FOR MODELS WITH GEOMETRY.
+
+    It is a ModelViewSet, so it has the actions list, retrieve, create, update,
+    partial_update and destroy. The serializer_class must be a GeoModelSerializer.
+    The geometry checks (validity and matrix 9IM) are taken from the serializer.
+
+    In list() and retrieve() the geometry is returned in geojson and wkt made by PostGIS,
+    in the same query (see core/myLib/geoOutput.py). With the parameter geom_format
+    only one of them can be requested: ?geom_format=geojson or ?geom_format=wkt
+    The vertices and decimals can be reduced with ?simplify=<tolerance>, ?precision=<digits>
+    or ?zoom=<z>, which derives both from the zoom of the map.
+    list() is paginated with keyset pagination on the id (IdCursorPagination). The
+    response has the links next and previous, and the rows in results:
+        GET /<app>/<model>/?page_size=500
+    list() accepts the spatial filters of core/myLib/spatialFilters.py, which use the
+    GiST index, together with the field filters and the pagination:
+        GET /<app>/<model>/?bbox=minx,miny,maxx,maxy
+        GET /<app>/<model>/?intersects=<wkt>
+        GET /<app>/<model>/?dwithin=<wkt>,<distance>
+        GET /<app>/<model>/?contains_point=x,y
+    With ?stream=true, list() is not paginated: it reads the rows with a server side cursor and streams
+    the JSON array, so the memory does not depend on the number of rows.
+    list() can also return the features in the binary formats of core/myLib/binaryOutput.py,
+    with the Accept header or the parameter format. They are not paginated, and are made
+    from the cursor, without the serializer:
+        GET /<app>/<model>/?format=wkb     records id + wkb
+        GET /<app>/<model>/?format=fgb     FlatGeobuf
+        GET /<app>/<model>/?format=arrow   Arrow IPC stream, if pyarrow is installed
+    The responses of list() and retrieve() are cached until the layer changes, and
+    have an ETag: with If-None-Match the response is 304 if the layer has not
+    changed (core/myLib/responseCache.py).
+
+    It adds the following actions:
+        -bulk_validate() -> POST operation over /<app>/<model>/bulk_validate/.
+            Checks many geometries in only one query. The body is a list of objects
+            with the geometry (geom) and optionally the id of the feature, if it is an update:
+                [{"geom": "POLYGON((...))"}, {"id": 5, "geom": "POLYGON((...))"}, ...]
+            For every geometry returns if it is valid, the snapped wkb, the ids of
+            the table with the relation, and the positions of the geometries of
+            the same list with the relation.
+        -bulk_create() -> POST operation over /<app>/<model>/bulk_create/.
+            Inserts many features. The body is a list of objects, as in create().
+        -bulk_update() -> PATCH operation over /<app>/<model>/bulk_update/.
+            Partial update of many features. The body is a list of objects
+            with the id and the fields to update.
+        In both, the fields are validated with the serializer (many=True), and all 
+        the geometries with BatchGeometryChecks, in one query. If there is any 
+        error nothing is saved, and the errors of every item are returned. If not,
+        all the features are saved in one transaction, with bulk_create / bulk_update.
+        The area and the length are stored in the fields area_field_name and 
+        length_field_name of the serializer.
+
+    To use it, inherit from this class instead of viewsets.ModelViewSet:
+        class ParcelsModelViewSet(GeoModelViewSet):
+            queryset = Parcels.objects.all()
+            serializer_class = ParcelsSerializer
+    """
+
+    pagination_class = IdCursorPagination
+    filter_backends = list(api_settings.DEFAULT_FILTER_BACKENDS) + [SpatialFilterBackend]
+    renderer_classes = list(api_settings.DEFAULT_RENDERER_CLASSES) + BINARY_RENDERERS
+    bulk_batch_size = 1000 #number of rows of every INSERT / UPDATE of the bulk operations
+    response_cache = None
+
+    def get_serializer_context(self):
+        context=super().get_serializer_context()
+        #in the bulk operations the geometries are not checked one by one
+        #by the serializer, but all together in check_geometries()
+        context['batch_geometry_checks']=self.action in ('bulk_create', 'bulk_update')
+        context['geom_formats']=self.get_geom_formats()
+        return context
+
+    def get_queryset(self):
+        queryset=super().get_queryset()
+        if self.action in ('list', 'retrieve') and self.get_binary_format() is None:
+            queryset=annotate_geom_formats(queryset, self.get_geom_formats(),
+                                           **self.get_geom_output_options(queryset.model))
+        return queryset
+
+    def get_geom_output_options(self, model)->dict:
+        try:
+            return get_geom_output_options(self.request.query_params, is_geodetic(model))
+        except ValueError as e:
+            raise serializers.ValidationError({'geom_output': [str(e)]})
+
+    def get_binary_format(self)->str:
+        """
+        The binary format chosen by the content negotiation, or None
+        """
+        renderer=getattr(self.request, 'accepted_renderer', None)
+        binary_format=getattr(renderer, 'format', None)
+        if binary_format in BINARY_FORMATS:
+            return binary_format
+        return None
+
+    def binary_list(self, binary_format: str):
+        """
+        Reads the fields and the wkb made by PostGIS as tuples, with a server side cursor
+        """
+        queryset=self.filter_queryset(self.get_queryset()).order_by('id')
+        model=queryset.model
+        queryset=queryset.annotate(geom_wkb=wkb_geometry('geom', **self.get_geom_output_options(model)))
+        if binary_format == 'wkb':
+            rows=queryset.values_list('id', 'geom_wkb').iterator(chunk_size=STREAMING_CHUNK_SIZE)
+            return wkb_records_response(rows)
+        fields=get_attribute_fields(model)
+        rows=queryset.values_list(*[f.attname for f in fields], 'geom_wkb').iterator(chunk_size=STREAMING_CHUNK_SIZE)
+        srid=model._meta.get_field('geom').srid
+        if binary_format == 'fgb':
+            return flatgeobuf_response(rows, fields, srid, model._meta.db_table)
+        return arrow_response(rows, fields, srid)
+
+    def cached_action(self, request):
+        """
+        For list and retrieve: returns the response of the cache, or 304, or None if it
+        has to be made. The response made by the action is saved in finalize_response.
+        The ETag and Last-Modified are the versions of the features (row_version,
+        updated_at), read before any geometry is read or serialized
+        """
+        model=self.queryset.model
+        layer_name=get_layer_name(model)
+        if layer_name is None:
+            return None
+        etag, last_modified=None, None
+        if has_row_version(model) and request.method in ('GET', 'HEAD'):
+            if self.action == 'retrieve':
+                lookup_url_kwarg=self.lookup_url_kwarg or self.lookup_field
+                etag, last_modified=feature_validators(self.queryset, self.kwargs[lookup_url_kwarg], request)
+            else:
+                etag, last_modified=list_validators(self.filter_queryset(self.queryset.all()), layer_name, request)
+        self.response_cache=ResponseCache(request, layer_name, etag, last_modified)
+        return self.response_cache.lookup()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response=super().finalize_response(request, response, *args, **kwargs)
+        if self.response_cache is not None:
+            response=self.response_cache.store(response)
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        response=self.cached_action(request)
+        if response is not None:
+            return response
+        return super().retrieve(request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        response=self.cached_action(request)
+        if response is not None:
+            return response
+        binary_format=self.get_binary_format()
+        if binary_format is not None:
+            return self.binary_list(binary_format)
+        if not wants_streaming(request.query_params):
+            return super().list(request, *args, **kwargs)
+        queryset=self.filter_queryset(self.get_queryset())
+        #only one serializer for all the rows
+        serializer=self.get_serializer()
+        rows=(serializer.to_representation(obj) for obj in queryset.iterator(chunk_size=STREAMING_CHUNK_SIZE))
+        return stream_json_array_response(rows, encoder=JSONEncoder)
+
+    def get_geom_formats(self)->tuple:
+        try:
+            return get_geom_formats(self.request.query_params)
+        except ValueError as e:
+            raise serializers.ValidationError({'geom_format': [str(e)]})
+
+    def get_table_name(self):
+        return self.get_queryset().model._meta.db_table
+
+    def get_relate_check_limit(self):
+        if wants_detailed_errors(self.request.query_params):
+            return None
+        return RELATE_CHECK_LIMIT
+
+    def check_geometries(self, geom_texts: list, ids_to_avoid: list=None)->BatchGeometryChecks:
+        """
+        Checks all the geometries in one query, with the checks
+        defined in the serializer
+        """
+        serializer_class=self.get_serializer_class()
+        bc=BatchGeometryChecks()
+        if serializer_class.check_st_relation:
+            bc.check(geom_texts, self.get_table_name(), serializer_class.matrix9IM,
+                     ids_to_avoid=ids_to_avoid, limit=self.get_relate_check_limit())
+        else:
+            bc.check(geom_texts, ids_to_avoid=ids_to_avoid)
+        return bc
+
+    def get_bulk_items(self, request):
+        """
+        Returns the list of objects of the body, or None if the body is not a list
+        """
+        items=request.data
+        if not isinstance(items, list):
+            return None
+        return items
+
+    @action(detail=False, methods=['post'])
+    def bulk_validate(self, request):
+        items=self.get_bulk_items(request)
+        if items is None:
+            return Response({'ok':False, 'message':'The body must be a list of objects with the field geom', 'data':[]},
+                            status=status.HTTP_400_BAD_REQUEST)
+        for i, item in enumerate(items):
+            if not isinstance(item, dict) or not item.get('geom'):
+                return Response({'ok':False, 'message':f'The item {i} has not the field geom', 'data':[]},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+        #the ids go to the query as integer[]: the wrong ones are errors of their items
+        ids=[item.get('id') for item in items]
+        id_errors=[id is not None and not is_feature_id(id) for id in ids]
+        bc=self.check_geometries([item['geom'] for item in items],
+                                 [None if id_error else id for id, id_error in zip(ids, id_errors)])
+        data=[]
+        for id, id_error, r in zip(ids, id_errors, bc.results):
+            data.append({
+                'index': r['index'],
+                'id': id,
+                'ok': r['ok'] and not id_error,
+                'is_valid': r['is_valid'],
+                'wkb': r['wkb'],
+                'related_ids': r['related_ids'],
+                'batch_related': r['batch_related'],
+                'error': INVALID_ID_MESSAGE if id_error else r['error'],
+            })
+        wrong=len([d for d in data if not d['ok']])
+        if wrong == 0:
+            message='All the geometries are correct'
+        else:
+            message=f"{wrong} geometries are not correct"
+        return Response({'ok':wrong == 0, 'message':message, 'data':data}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'])
+    def bulk_create(self, request):
+        items=self.get_bulk_items(request)
+        if items is None:
+            return Response({'ok':False, 'message':'The body must be a list of objects', 'data':[]},
+                            status=status.HTTP_400_BAD_REQUEST)
+        model=self.get_queryset().model
+        with transaction.atomic():
+            validated_data, errors, checks=self.validate_bulk(items)
+            if any(errors):
+                transaction.set_rollback(True)
+                return self.bulk_errors_response(items, errors)
+            objs=[]
+            for data, r in zip(validated_data, checks):
+                self.set_geometry_fields(data, r)
+                objs.append(model(**data))
+            model.objects.bulk_create(objs, batch_size=self.bulk_batch_size)
+            #bulk_create does not send post_save
+            send_layer_changed(model, [obj.id for obj in objs], [geometry_extent(obj.geom) for obj in objs],
+                               LayerChange.INSERT)
+        data=[{'index': i, 'id': obj.id} for i, obj in enumerate(objs)]
+        return Response({'ok':True, 'message':f'{len(objs)} features inserted', 'data':data},
+                        status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['patch'])
+    def bulk_update(self, request):
+        items=self.get_bulk_items(request)
+        if items is None:
+            return Response({'ok':False, 'message':'The body must be a list of objects with the field id', 'data':[]},
+                            status=status.HTTP_400_BAD_REQUEST)
+        ids=[item.get('id') if isinstance(item, dict) else None for item in items]
+        with transaction.atomic():
+            #the rows are locked until the end of the transaction
+            instances=self.get_queryset().select_for_update().in_bulk([i for i in ids if is_feature_id(i)])
+            id_errors=[]
+            seen=set()
+            for id in ids:
+                if id is None:
+                    id_errors.append({'id': ['This field is required.']})
+                elif not is_feature_id(id):
+                    id_errors.append({'id': [INVALID_ID_MESSAGE]})
+                elif id not in instances:
+                    id_errors.append({'id': [f'The feature {id} does not exist.']})
+                elif id in seen:
+                    id_errors.append({'id': [f'The feature {id} is repeated in the list.']})
+                else:
+                    id_errors.append({})
+                    seen.add(id)
+            validated_data, errors, checks=self.validate_bulk(items, [id if is_feature_id(id) and id in instances else None
+                                                                      for id in ids])
+            errors=[{**e1, **e2} for e1, e2 in zip(id_errors, errors)]
+            if any(errors):
+                transaction.set_rollback(True)
+                return self.bulk_errors_response(items, errors)
+            objs=[]
+            fields=set()
+            extents=[]
+            for id, data, r in zip(ids, validated_data, checks):
+                obj=instances[id]
+                #the attributes are also in the tiles, caches, ...
+                extents.append(geometry_extent(obj.geom))
+                if r is not None:
+                    self.set_geometry_fields(data, r)
+                    extents.append(geometry_extent(r['wkb']))
+                for field_name, value in data.items():
+                    setattr(obj, field_name, value)
+                fields.update(data.keys())
+                objs.append(obj)
+            if len(fields) > 0:
+                #bulk_update does not send pre_save nor sets the auto_now fields
+                now=timezone.now()
+                for obj in objs:
+                    obj.row_version=(obj.row_version or 0) + 1
+                    obj.updated_at=now
+                fields.update(('row_version', 'updated_at'))
+                self.get_queryset().model.objects.bulk_update(objs, list(fields), batch_size=self.bulk_batch_size)
+                #bulk_update does not send post_save
+                send_layer_changed(self.get_queryset().model, [obj.id for obj in objs], extents, LayerChange.UPDATE)
+        data=[{'index': i, 'id': obj.id} for i, obj in enumerate(objs)]
+        return Response({'ok':True, 'message':f'{len(objs)} features updated', 'data':data},
+                        status=status.HTTP_200_OK)
+
+    def validate_bulk(self, items: list, ids: list=None):
+        """
+        Validates the fields of all the items with the serializer, many=True, and 
+        the geometries all together with check_geometries().
+        ids: the ids of the features, if it is an update.
+        Returns three lists, with the same length as items:
+            -validated_data: the validated data of each item. Empty if there are errors.
+            -errors: dict with the errors of the fields of each item. Empty dict if it is correct.
+            -checks: the result of BatchGeometryChecks for each item, or None if 
+                the item has not geometry (partial update).
+        """
+        partial=ids is not None
+        serializer=self.get_serializer(data=items, many=True, partial=partial)
+        if serializer.is_valid():
+            validated_data=serializer.validated_data
+            errors=[{} for item in items]
+        else:
+            validated_data=[]
+            errors=[dict(e) for e in serializer.errors]
+
+        #only the items with geometry. In a partial update it may not be there
+        positions=[i for i, item in enumerate(items) if isinstance(item, dict) and item.get('geom')]
+        checks=[None]*len(items)
+        if len(positions) > 0:
+            bc=self.check_geometries([items[i]['geom'] for i in positions],
+                                     [ids[i] for i in positions] if partial else None)
+            for i, r in zip(positions, bc.results):
+                checks[i]=r
+                if not r['ok']:
+                    errors[i].setdefault('geom', []).append(r['error'])
+        return validated_data, errors, checks
+
+    def set_geometry_fields(self, data: dict, r: dict):
+        """
+        Sets in the validated data of an item the snapped geometry, and 
+        the area and length, if the serializer defines the fields to store them
+        """
+        serializer_class=self.get_serializer_class()
+        data['geom']=r['wkb']
+        if serializer_class.area_field_name is not None:
+            data[serializer_class.area_field_name]=r['area']
+        if serializer_class.length_field_name is not None:
+            data[serializer_class.length_field_name]=r['length']
+
+    def bulk_errors_response(self, items: list, errors: list):
+        data=[]
+        for i, (item, e) in enumerate(zip(items, errors)):
+            data.append({
+                'index': i,
+                'id': item.get('id') if isinstance(item, dict) else None,
+                'ok': not e,
+                'errors': e,
+            })
+        message=f"{len([e for e in errors if e])} of {len(items)} items are not correct. Nothing has been saved"
+        return Response({'ok':False, 'message':message, 'data':data}, status=status.HTTP_400_BAD_REQUEST)
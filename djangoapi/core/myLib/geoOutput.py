@@ -0,0 +1,139 @@
+"""
+Output formats of the geometries, computed in the database.
+
+Instead of reading the geometry of every row as a GEOS object and
+converting it in python, the querysets are annotated with ST_AsGeojson
+and ST_AsText, so the strings come already made from PostGIS, in the
+same query as the rest of the fields.
+
+The number of vertices and the decimals can be reduced, also in the
+database, with the parameters:
+    - simplify=<tolerance>: ST_SimplifyPreserveTopology, tolerance in the units of the layer.
+    - precision=<digits>: number of decimals of the coordinates.
+    - zoom=<z>: sets simplify and precision to the size of a pixel of a web map
+        at that zoom, if they are not given.
+
+Example:
+    geom_formats=get_geom_formats(request.query_params) #?geom_format=wkt
+    options=get_geom_output_options(request.query_params, is_geodetic(Buildings)) #?zoom=14
+    queryset=annotate_geom_formats(Buildings.objects.all(), geom_formats, **options)
+    for b in queryset:
+        b.geom_wkt
+"""
+import math
+
+from django.db import connection
+from django.db.models import Value
+from django.contrib.gis.db.models.functions import AsGeoJSON, AsWKT, AsWKB, GeoFunc, SnapToGrid
+
+from .geosTools import GEOJSON_DECIMAL_DIGITS, WKT_DECIMAL_DIGITS
+
+GEOM_FORMATS = ('geojson', 'wkt')
+MAX_ZOOM = 24
+#size of a pixel of a web map (tiles of 256 pixels) at zoom 0
+PIXEL_SIZE_METERS_ZOOM_0 = 40075016.68557849 / 256
+PIXEL_SIZE_DEGREES_ZOOM_0 = 360 / 256
+
+class SimplifyPreserveTopology(GeoFunc):
+    """ST_SimplifyPreserveTopology(geom, tolerance)"""
+    function='ST_SimplifyPreserveTopology'
+
+    def __init__(self, expression, tolerance: float, **extra):
+        super().__init__(expression, Value(float(tolerance)), **extra)
+
+def get_geom_formats(query_dict)->tuple:
+    """
+    Returns the formats requested with the parameter geom_format:
+        ?geom_format=geojson, ?geom_format=wkt or ?geom_format=geojson,wkt
+    All of them if the parameter is not present.
+    Raises ValueError if a format does not exist.
+    """
+    value=query_dict.get('geom_format', None)
+    if value is None or value == '':
+        return GEOM_FORMATS
+    geom_formats=tuple(f.strip().lower() for f in value.split(','))
+    for geom_format in geom_formats:
+        if geom_format not in GEOM_FORMATS:
+            raise ValueError(f"The geom_format {geom_format} does not exist. Use one or more of {GEOM_FORMATS}")
+    return geom_formats
+
+def is_geodetic(model, geom_field_name: str='geom')->bool:
+    """
+    True if the coordinates of the geometry field are in degrees
+    """
+    return model._meta.get_field(geom_field_name).geodetic(connection)
+
+def get_pixel_size(zoom: int, geodetic: bool)->float:
+    """
+    Size of a pixel of a web map at the zoom, in degrees or meters
+    """
+    if geodetic:
+        return PIXEL_SIZE_DEGREES_ZOOM_0 / 2**zoom
+    return PIXEL_SIZE_METERS_ZOOM_0 / 2**zoom
+
+def get_geom_output_options(query_dict, geodetic: bool)->dict:
+    """
+    Returns the dict {'simplify': tolerance, 'precision': digits} from the
+    parameters simplify, precision and zoom. None if they are not requested.
+    Raises ValueError if the values are not correct.
+    """
+    simplify=query_dict.get('simplify', None)
+    precision=query_dict.get('precision', None)
+    zoom=query_dict.get('zoom', None)
+    simplify=float(simplify) if simplify not in (None, '') else None
+    precision=int(precision) if precision not in (None, '') else None
+    if simplify is not None and simplify < 0:
+        raise ValueError("simplify must be a positive number")
+    if precision is not None and not 0 <= precision <= WKT_DECIMAL_DIGITS:
+        raise ValueError(f"precision must be between 0 and {WKT_DECIMAL_DIGITS}")
+    if zoom not in (None, ''):
+        zoom=int(zoom)
+        if not 0 <= zoom <= MAX_ZOOM:
+            raise ValueError(f"zoom must be between 0 and {MAX_ZOOM}")
+        pixel_size=get_pixel_size(zoom, geodetic)
+        if simplify is None:
+            simplify=pixel_size
+        if precision is None:
+            #a tenth of a pixel
+            precision=max(0, math.ceil(-math.log10(pixel_size / 10)))
+    return {'simplify': simplify, 'precision': precision}
+
+def annotate_geom_formats(queryset, geom_formats: tuple=GEOM_FORMATS, geom_field_name: str='geom',
+                          simplify: float=None, precision: int=None):
+    """
+    Annotates the queryset with the geometry in the requested formats, in the
+    fields geom_geojson and geom_wkt. The geometry field is deferred,
+    so it is not read from the database nor converted to GEOS.
+    simplify: tolerance of ST_SimplifyPreserveTopology. None or 0, not simplified.
+    precision: number of decimals of the coordinates. None, all of them.
+    """
+    geom=simplified_geometry(geom_field_name, simplify)
+    annotations={}
+    if 'geojson' in geom_formats:
+        geojson_precision=GEOJSON_DECIMAL_DIGITS if precision is None else precision
+        annotations['geom_geojson']=AsGeoJSON(geom, precision=geojson_precision)
+    if 'wkt' in geom_formats:
+        annotations['geom_wkt']=AsWKT(snapped_geometry(geom, precision))
+    return queryset.defer(geom_field_name).annotate(**annotations)
+
+def simplified_geometry(geom, simplify: float=None):
+    """
+    The geometry expression simplified with the tolerance, if there is any
+    """
+    if simplify:
+        return SimplifyPreserveTopology(geom, simplify)
+    return geom
+
+def snapped_geometry(geom, precision: int=None):
+    """
+    The geometry expression snapped to the number of decimals, if there is any
+    """
+    if precision is not None:
+        return SnapToGrid(geom, 10**-precision)
+    return geom
+
+def wkb_geometry(geom_field_name: str='geom', simplify: float=None, precision: int=None):
+    """
+    ST_AsBinary of the geometry, with the same options as annotate_geom_formats
+    """
+    return AsWKB(snapped_geometry(simplified_geometry(geom_field_name, simplify), precision))
@@ -1,16 +1,48 @@
-from django.db import connection
-from djangoapi.settings import EPSG_FOR_GEOMETRIES, ST_SNAP_PRECISION
+from django.db import connection, transaction
+from django.contrib.gis.geos import GEOSGeometry
+from djangoapi.settings import EPSG_FOR_GEOMETRIES, ST_SNAP_PRECISION, GEOMETRY_ENGINE
+from . import geosTools
+
+GEOMETRY_ENGINES = ('postgis', 'geos')
+
+def check_engine(engine: str):
+    if engine not in GEOMETRY_ENGINES:
+        raise Exception(f"The geometry engine {engine} does not exist. Use one of {GEOMETRY_ENGINES}")
+
+def relate_requires_intersection(matrix9IM: str)->bool:
+    """
+    Returns true if the matrix 9IM can only be true when the geometries intersect.
+    That happens when the matrix requires contact between the interiors and/or
+    boundaries: positions II, IB, BI or BB are T, 0, 1 or 2. For example 
+    'T********' or '1*T***T**', but not 'FF*FF****' (disjoint).
+    In that case the bounding boxes must overlap, and the filter geom && other
+    can be added to the ST_Relate query, so the GiST index is used.
+    """
+    return any(matrix9IM[i] in 'T012' for i in (0, 1, 3, 4))
 
 class WkbConversor:
+    """
+    Converts geometries in wkt or geojson to wkb, snaped to the grid.
+
+    The engine can be:
+        - 'postgis': the conversions are done in the database.
+        - 'geos': the conversions are done in process with GEOS. No
+            database connection is used. The results are the same as with 'postgis'.
+    By default the engine is the GEOMETRY_ENGINE in settings.py
+    """
     def __init__(self,epsg_for_geometries: str=EPSG_FOR_GEOMETRIES,
                  st_snap_precision: float=ST_SNAP_PRECISION,
-                 snap_to_grid: bool = True):   
+                 snap_to_grid: bool = True,
+                 engine: str = GEOMETRY_ENGINE):   
 
+        check_engine(engine)
         self.epsg_for_geometries=epsg_for_geometries
         self.st_snap_precision=st_snap_precision
         self.snap_to_grid=snap_to_grid
+        self.engine=engine
 
         self.__wkb=None
+        self.__geos=None
 
     def set_wkt_from_text(self, geom_text:str)-> str:
         """
@@ -18,6 +50,8 @@ class WkbConversor:
         and return it in wkt. 
         If the self.st_snap_precision is true the vertices are rounded
         """
+        if self.engine == 'geos':
+            return self.__set_wkb_with_geos(geom_text)
         if 'coordinates' in geom_text:
             print('geojson')
             return self.__set_wkb_from_geojson(geom_text)
@@ -27,9 +61,34 @@ class WkbConversor:
 
     def set_wkb_from_wkb(self,wkb):
         self.__wkb=wkb
+        self.__geos=None
+
+    def __set_wkb_with_geos(self, geom_text:str)->str:
+        print('set_wkb_with_geos')
+        geom=geosTools.geometry_from_text(geom_text, self.epsg_for_geometries)
+        if self.snap_to_grid:
+            geom=geosTools.snap_to_grid(geom, self.st_snap_precision)
+        self.__geos=geom
+        self.__wkb=geosTools.as_hexewkb(geom)
+        return self.get_as_wkb()
+
+    def get_as_geos(self):
+        """
+        Returns the snaped geometry as a GEOSGeometry object
+        """
+        if self.__geos is None:
+            self.__geos=GEOSGeometry(self.get_as_wkb())
+        return self.__geos
+
+    def is_geometry_valid(self)->bool:
+        """
+        Checks if the snaped geometry is valid. 
+        """
+        if self.engine == 'geos':
+            return self.get_as_geos().valid
+        return GeometryChecks(self.get_as_wkb()).is_geometry_valid()
 
     def __set_wkb_from_geojson(self, geojson:str)->str:
-        cursor = connection.cursor()
         #Ejecuta la función PostGIS ST_GeomFromText para convertir WKT a WKB
         print('set_wkb_from_geojson')
         if self.snap_to_grid:
@@ -50,13 +109,14 @@ class WkbConversor:
                     ),
                     %s
             """           
-        cursor.execute(q, [geojson, self.epsg_for_geometries, self.st_snap_precision])
-        row = cursor.fetchone()
+        with connection.cursor() as cursor:
+            cursor.execute(q, [geojson, self.epsg_for_geometries, self.st_snap_precision])
+            row = cursor.fetchone()
         self.__wkb=row[0]
+        self.__geos=None
         return self.get_as_wkb()  # Esto será el WKB
 
     def __set_wkb_from_wkt(self, wkt:str):
-        cursor = connection.cursor()
         #Ejecuta la función PostGIS ST_GeomFromText para convertir WKT a WKB
         print('set_wkb_from_wkt')
         if self.snap_to_grid:
@@ -77,13 +137,14 @@ class WkbConversor:
                     ),
                     %s
             """               
-        cursor.execute(q, [wkt, self.epsg_for_geometries, self.st_snap_precision])
-        row = cursor.fetchone()
+        with connection.cursor() as cursor:
+            cursor.execute(q, [wkt, self.epsg_for_geometries, self.st_snap_precision])
+            row = cursor.fetchone()
         self.__wkb=row[0]
+        self.__geos=None
         return self.get_as_wkb() 
          
     def set_wkb_from_table(self, table_name:str, id_to_select:int, geom_field_name:str='geom')->str:
-        cursor = connection.cursor()
         #Ejecuta la función PostGIS ST_GeomFromText para convertir WKT a WKB
         print('set_wkb_from_table')
         if self.snap_to_grid:
@@ -94,12 +155,14 @@ class WkbConversor:
             q=f"""SELECT {geom_field_name}
                   FROM {table_name} WHERE id = %s
                 """             
-        cursor.execute(q, [id_to_select])
-        l = cursor.fetchall()
+        with connection.cursor() as cursor:
+            cursor.execute(q, [id_to_select])
+            l = cursor.fetchall()
         if len(l)==0:
             raise Exception(f"No reccord with the id {id_to_select} in the table {table_name}")
         
         self.__wkb=l[0][0]
+        self.__geos=None
         return self.get_as_wkb()
 
     def get_as_wkb(self):
@@ -112,69 +175,85 @@ class WkbConversor:
         """
         Returns the snaped geometry in geojson
         """
+        if self.engine == 'geos':
+            return geosTools.as_geojson(self.get_as_geos())
         query="SELECT ST_AsGeojson(%s)"
-        cursor=connection.cursor()
-        cursor.execute(query,[self.get_as_wkb()])
-        row = cursor.fetchone()
+        with connection.cursor() as cursor:
+            cursor.execute(query,[self.get_as_wkb()])
+            row = cursor.fetchone()
         return row[0] if row else None  #Devuelve la geometría en formato geojson o None
     
     def get_as_wkt(self):
         """
         Returns the snaped geometry in wkt
         """
+        if self.engine == 'geos':
+            return geosTools.as_wkt(self.get_as_geos())
         query="SELECT ST_AsText(%s)"
-        cursor=connection.cursor()
-        cursor.execute(query, [self.get_as_wkb()])
-        row = cursor.fetchone()
+        with connection.cursor() as cursor:
+            cursor.execute(query, [self.get_as_wkb()])
+            row = cursor.fetchone()
         return row[0] if row else None  #Devuelve la geometría en formato geojson o None
 
 class GeometryChecks:
-    def __init__(self, wkb: str):
+    def __init__(self, wkb: str, engine: str = GEOMETRY_ENGINE):
+        check_engine(engine)
         self.wkb=wkb
+        self.engine=engine
         self.related_ids = None
+        self.limit = None
         self.requested_relation = None
         self.table_name = None
 
-class GeometryChecks:
-    def __init__(self, wkb: str):
-        self.wkb=wkb
-        self.related_ids = None
-
     def is_geometry_valid(self):
-        """Checks if a geometry in geojson is valid."""
+        """Checks if a geometry in geojson is valid.
+        With the 'geos' engine it is checked in process.
+        The relation checks always need the database.
+        """
         print('is_geometry_valid')
-        cursor=connection.cursor()
+        if self.engine == 'geos':
+            return GEOSGeometry(self.wkb).valid
         q="""SELECT ST_IsValid(%s)"""
-        cursor.execute(q, [self.wkb])
-        row = cursor.fetchone()
+        with connection.cursor() as cursor:
+            cursor.execute(q, [self.wkb])
+            row = cursor.fetchone()
         #row is true or false
         return row[0]
             
-    def check_st_relate(self, table_name: str, matrix9IM: str, id_to_avoid:int=None)->list:
+    def check_st_relate(self, table_name: str, matrix9IM: str, id_to_avoid:int=None, limit:int=None)->list:
         """Checks whether or not exists a geometry wih the relation of the geom with all the geometries in the layer
             layername using the matrix 9IM. The geom is in geojson format.
+            If limit is given, the query stops as soon as limit ids are found
+            (limit=1 only checks the existence). If None all the ids are returned.
         """
         
-        cursor=connection.cursor()
-        if id_to_avoid is None:
+        #ST_relate can not use the spatial index. If the matrix requires 
+        #the geometries to intersect, the bounding box filter && uses it
+        if relate_requires_intersection(matrix9IM):
+            q=f"""SELECT id FROM {table_name} WHERE geom && %s and ST_relate(geom,%s,%s)"""
+            values=[self.wkb, self.wkb, matrix9IM]
+        else:
             q=f"""SELECT id FROM {table_name} WHERE ST_relate(geom,%s,%s)"""
             values=[self.wkb, matrix9IM]
-        else:
-            q=f"""SELECT id FROM {table_name} WHERE ST_relate(geom,%s,%s) and id != %s"""
-            values=[self.wkb, matrix9IM, id_to_avoid]
-        cursor.execute(q, values)
-        self.related_ids=cursor.fetchall()
+        if id_to_avoid is not None:
+            q+=" and id != %s"
+            values.append(id_to_avoid)
+        q, values = self.__add_limit(q, values, limit)
+        with connection.cursor() as cursor:
+            cursor.execute(q, values)
+            self.related_ids=cursor.fetchall()
+        self.limit=limit
         self.requested_relation= f'ST_relate, matrix: {matrix9IM}'
         self.table_name=table_name
         return self.related_ids  # Devuelve los ids de las geometrías que cumplen la relación
 
-    def check_st_condition(self, table_name: str, st_condition: str, id_to_avoid:int=None)->list:   
+    def check_st_condition(self, table_name: str, st_condition: str, id_to_avoid:int=None, limit:int=None)->list:   
         """Checks whether or not exists a geometry wih the condition 
            st_condition: st_intersects, st_contains, st_within, ... 
            of the current geom with all the geometries in the layer
             layername.
+            If limit is given, the query stops as soon as limit ids are found.
         """
-        cursor=connection.cursor()
         if id_to_avoid is None:
             q=f"""SELECT id FROM {table_name} WHERE {st_condition}(geom,%s)"""
             values=[self.wkb]
@@ -182,12 +261,29 @@ class GeometryChecks:
             q=f"""SELECT id FROM {table_name} WHERE {st_condition}(geom,%s) and id != %s"""
             values=[self.wkb, id_to_avoid]
 
-        cursor.execute(q, values)
-        self.related_ids=cursor.fetchall()
+        q, values = self.__add_limit(q, values, limit)
+        with connection.cursor() as cursor:
+            cursor.execute(q, values)
+            self.related_ids=cursor.fetchall()
+        self.limit=limit
         self.requested_relation= st_condition
         self.table_name=table_name
         return self.related_ids
 
+    def __add_limit(self, q: str, values: list, limit: int=None):
+        #Without ORDER BY, PostgreSQL stops the scan when it has found limit rows
+        if limit is not None:
+            q+=" LIMIT %s"
+            values=values + [limit]
+        return q, values
+
+    def is_limit_reached(self)->bool:
+        """
+        True if the check was limited and there could be more related ids 
+        than the ones in related_ids
+        """
+        return self.limit is not None and len(self.related_ids) >= self.limit
+
     def are_there_related_ids(self)->bool:
         """
         First must call check_st_relate, or raise exception
@@ -203,6 +299,302 @@ class GeometryChecks:
             
     def get_relate_message(self)->str:
         if self.are_there_related_ids():
+            if self.is_limit_reached():
+                return f"At least the following ids of the table {self.table_name} have the requested  relation ({self.requested_relation}), with the given geometry: {self.related_ids}"
             return f"The following ids of the table {self.table_name} have the requested  relation ({self.requested_relation}), with the given geometry: {self.related_ids}"
         else:        
             return "There are not geometries with the requested relation"
+
+class GeometryPreparer(GeometryChecks):
+    """
+    Prepares a geometry for an insert or an update in a single query.
+
+    In only one round trip to the database it:
+        - parses the geometry (wkt or geojson),
+        - sets the srid and snaps it to the grid,
+        - checks if it is valid,
+        - checks the relation with the geometries of a table, using the matrix 9IM,
+        - optionally, checks that it is inside a geometry of other table,
+        - returns the wkb, wkt, geojson, geometry type, area and length.
+
+    As it inherits from GeometryChecks, after calling prepare() the methods
+    are_there_related_ids() and get_relate_message() can be used.
+
+    Example:
+        gp=GeometryPreparer()
+        wkb=gp.prepare(originalWkt, 'buildings_buildings', 'T********', id_to_avoid=id)
+        if not gp.is_valid:
+            ...
+        if gp.are_there_related_ids():
+            ...
+    """
+    def __init__(self, epsg_for_geometries: str=EPSG_FOR_GEOMETRIES,
+                 st_snap_precision: float=ST_SNAP_PRECISION,
+                 snap_to_grid: bool = True):
+        super().__init__(None)
+        self.epsg_for_geometries=epsg_for_geometries
+        self.st_snap_precision=st_snap_precision
+        self.snap_to_grid=snap_to_grid
+
+        self.wkt=None
+        self.geojson=None
+        self.geom_type=None
+        self.is_valid=None
+        self.area=None
+        self.length=None
+        self.is_contained=None
+
+    def prepare(self, geom_text: str, table_name: str=None, matrix9IM: str=None,
+                id_to_avoid: int=None, container_table: str=None, limit: int=None,
+                check_validity: bool=True)->str:
+        """
+        Receives a string, with a geojson, or wkt geometry, and returns the
+        snapped wkb. The rest of the results are stored in the attributes
+        wkt, geojson, geom_type, is_valid, area, length, related_ids and is_contained.
+
+        If table_name and matrix9IM are given, the related_ids are the ids of the
+        geometries of the table that have the relation with the new geometry. 
+        The id_to_avoid is excluded (use it on updates).
+        If container_table is given, is_contained is true if the geometry is
+        inside (ST_Contains) any geometry of the container table.
+        If check_validity is true, the relate checks are only done if the geometry
+        is valid, as it will be rejected. If it is false, they are always done,
+        with ST_MakeValid of the geometry if it is not valid.
+        If limit is given, only the first limit related ids are searched.
+        """
+        if 'coordinates' in geom_text:
+            geom_expression="ST_GeomFromGeoJSON(%s)"
+        else:
+            geom_expression="ST_GeomFromText(%s)"
+        geom_expression=f"ST_SetSRID({geom_expression}, %s)"
+        values=[geom_text, self.epsg_for_geometries]
+        if self.snap_to_grid:
+            geom_expression=f"ST_SnapToGrid({geom_expression}, %s)"
+            values.append(self.st_snap_precision)
+
+        if table_name is not None and matrix9IM is not None:
+            related_query=f"SELECT t.id FROM {table_name} t WHERE ST_Relate(t.geom, g.relate_geom, %s)"
+            if relate_requires_intersection(matrix9IM):
+                related_query+=" AND t.geom && g.relate_geom"
+            values.append(matrix9IM)
+            if id_to_avoid is not None:
+                related_query+=" AND t.id != %s"
+                values.append(id_to_avoid)
+            if limit is None:
+                related_query+=" ORDER BY t.id"
+            else:
+                related_query+=" LIMIT %s"
+                values.append(limit)
+            related_query=f"ARRAY({related_query})"
+            if check_validity:
+                related_query=f"CASE WHEN g.is_valid THEN {related_query} END"
+        else:
+            related_query="NULL::integer[]"
+
+        if container_table is not None:
+            contained_query=f"EXISTS(SELECT 1 FROM {container_table} c WHERE ST_Contains(c.geom, g.relate_geom))"
+            if check_validity:
+                contained_query=f"CASE WHEN g.is_valid THEN {contained_query} END"
+        else:
+            contained_query="NULL::boolean"
+
+        #ST_Relate and ST_Contains fail with some invalid geometries
+        q=f"""WITH snapped AS (
+                    SELECT {geom_expression} AS geom
+                ), v AS (
+                    SELECT geom, ST_IsValid(geom) AS is_valid FROM snapped
+                ), g AS (
+                    SELECT geom, is_valid, CASE WHEN is_valid THEN geom ELSE ST_MakeValid(geom) END AS relate_geom FROM v
+                )
+                SELECT g.geom, ST_AsText(g.geom), ST_AsGeojson(g.geom), GeometryType(g.geom),
+                       g.is_valid, ST_Area(g.geom), ST_Length(g.geom),
+                       {related_query},
+                       {contained_query}
+                FROM g
+            """
+        print('prepare')
+        with connection.cursor() as cursor:
+            cursor.execute(q, values)
+            row=cursor.fetchone()
+        self.wkb, self.wkt, self.geojson, self.geom_type, self.is_valid, \
+            self.area, self.length, related_ids, self.is_contained = row
+
+        #same format as cursor.fetchall() in GeometryChecks: [(id,), ...]
+        #If the geometry is not valid and check_validity is true, the relation has not been checked
+        self.related_ids=[(related_id,) for related_id in related_ids or []]
+        self.limit=limit
+        self.table_name=table_name
+        self.requested_relation=f'ST_relate, matrix: {matrix9IM}'
+        return self.wkb
+
+    def get_as_wkb(self):
+        """
+        Returns the snaped geometry in wkb
+        """
+        return self.wkb
+
+    def get_as_geojson(self):
+        """
+        Returns the snaped geometry in geojson
+        """
+        return self.geojson
+
+    def get_as_wkt(self):
+        """
+        Returns the snaped geometry in wkt
+        """
+        return self.wkt
+
+class BatchGeometryChecks:
+    """
+    Checks many geometries at once, in one set-based query, instead 
+    of one query per geometry.
+
+    For every geometry it returns the snapped wkb, if it is valid, and the
+    ids of the table that have the relation 9IM with it. It also returns 
+    the geometries of the same batch that have the relation between them.
+
+    The ids_to_avoid are the ids of the features that are being updated. They 
+    are excluded from the table check, as their geometries are replaced by the
+    ones of the batch, which are checked against each other.
+
+    The geometries that can not be parsed are reported as not valid without 
+    sending them to the database, so one bad geometry does not break the batch.
+
+    Example:
+        bc=BatchGeometryChecks()
+        results=bc.check(['POLYGON((...))', 'POLYGON((...))'], 'parcels_parcels', 'T********')
+        for r in results:
+            r['ok'], r['wkb'], r['is_valid'], r['related_ids'], r['batch_related']
+    """
+    #From this number of geometries, they are copied to a temporary table 
+    #with a GiST index, so the checks between them use the index
+    temp_table_threshold = 1000
+    temp_table_name = 'batch_geometry_checks'
+
+    def __init__(self, epsg_for_geometries: str=EPSG_FOR_GEOMETRIES,
+                 st_snap_precision: float=ST_SNAP_PRECISION,
+                 snap_to_grid: bool = True):
+        self.epsg_for_geometries=epsg_for_geometries
+        self.st_snap_precision=st_snap_precision
+        self.snap_to_grid=snap_to_grid
+        self.results=None
+
+    def check(self, geom_texts: list, table_name: str=None, matrix9IM: str=None,
+              ids_to_avoid: list=None, limit: int=None)->list:
+        """
+        geom_texts: list of geometries in wkt or geojson.
+        ids_to_avoid: list, with the same length as geom_texts, with the id of 
+            each feature if it is an update, or None if it is an insert.
+        limit: maximum number of related ids searched for each geometry.
+        Returns a list of dicts, in the same order as geom_texts, with the keys:
+            index, ok, wkb, is_valid, geom_type, area, length, related_ids, batch_related, error
+        """
+        if ids_to_avoid is None:
+            ids_to_avoid=[None]*len(geom_texts)
+
+        self.results=[self.__empty_result(i) for i in range(len(geom_texts))]
+        texts=[]
+        ids=[]
+        positions=[]
+        for i, geom_text in enumerate(geom_texts):
+            try:
+                GEOSGeometry(geom_text)
+            except Exception as e:
+                self.results[i]['error']=f'The geometry can not be parsed: {e}'
+                continue
+            texts.append(geom_text)
+            ids.append(ids_to_avoid[i])
+            positions.append(i)
+
+        if len(texts) > 0:
+            for row in self.__execute(texts, ids, table_name, matrix9IM, limit):
+                row_ord, wkb, is_valid, geom_type, area, length, related_ids, batch_related = row
+                r=self.results[positions[row_ord - 1]]
+                r['wkb']=wkb
+                r['is_valid']=is_valid
+                r['geom_type']=geom_type
+                r['area']=area
+                r['length']=length
+                r['related_ids']=related_ids or []
+                r['batch_related']=[positions[o - 1] for o in batch_related or []]
+                if not is_valid:
+                    r['error']='Invalid geometry. May be self-intersecting or not closed.'
+                elif len(r['related_ids']) > 0:
+                    r['error']=f"The following ids of the table {table_name} have the requested relation (ST_relate, matrix: {matrix9IM}): {r['related_ids']}"
+                elif len(r['batch_related']) > 0:
+                    r['error']=f"The following geometries of the batch have the requested relation (ST_relate, matrix: {matrix9IM}): {r['batch_related']}"
+                r['ok']=r['error'] is None
+        return self.results
+
+    def are_all_ok(self)->bool:
+        if self.results is None:
+            raise Exception("You first have to call the check method")
+        return all(r['ok'] for r in self.results)
+
+    def __empty_result(self, index: int)->dict:
+        return {'index': index, 'ok': False, 'wkb': None, 'is_valid': False, 'geom_type': None,
+                'area': None, 'length': None, 'related_ids': [], 'batch_related': [], 'error': None}
+
+    def __execute(self, texts: list, ids: list, table_name: str, matrix9IM: str, limit: int)->list:
+        geom_expression="""ST_SetSRID(CASE WHEN u.geom_text LIKE '%%coordinates%%' 
+                                THEN ST_GeomFromGeoJSON(u.geom_text)
+                                ELSE ST_GeomFromText(u.geom_text) END, %s)"""
+        input_values=[self.epsg_for_geometries]
+        if self.snap_to_grid:
+            geom_expression=f"ST_SnapToGrid({geom_expression}, %s)"
+            input_values.append(self.st_snap_precision)
+        input_query=f"""SELECT u.ord, u.id_to_avoid, {geom_expression} AS geom
+                    FROM unnest(%s::text[], %s::integer[]) WITH ORDINALITY AS u(geom_text, id_to_avoid, ord)"""
+        input_values+=[texts, ids]
+
+        use_temp_table=len(texts) >= self.temp_table_threshold
+        relation='g' if not use_temp_table else self.temp_table_name
+        select_values=[]
+        if table_name is not None and matrix9IM is not None:
+            bbox_filter=relate_requires_intersection(matrix9IM)
+            related_query=f"""SELECT t.id FROM {table_name} t
+                    WHERE ST_Relate(t.geom, g.geom, %s) AND t.id <> ALL(%s::integer[])"""
+            select_values+=[matrix9IM, [i for i in ids if i is not None]]
+            if bbox_filter:
+                related_query+=" AND t.geom && g.geom"
+            if limit is None:
+                related_query+=" ORDER BY t.id"
+            else:
+                related_query+=" LIMIT %s"
+                select_values.append(limit)
+            batch_query=f"""SELECT o.ord FROM {relation} o
+                    WHERE o.ord <> g.ord AND o.is_valid AND ST_Relate(o.geom, g.geom, %s)"""
+            select_values.append(matrix9IM)
+            if bbox_filter:
+                batch_query+=" AND o.geom && g.geom"
+            related_query=f"CASE WHEN g.is_valid THEN ARRAY({related_query}) END"
+            batch_query=f"CASE WHEN g.is_valid THEN ARRAY({batch_query} ORDER BY o.ord) END"
+        else:
+            related_query="NULL::integer[]"
+            batch_query="NULL::bigint[]"
+
+        select_query=f"""SELECT g.ord, g.geom, g.is_valid, GeometryType(g.geom), ST_Area(g.geom), ST_Length(g.geom),
+                    {related_query},
+                    {batch_query}
+                FROM {relation} g ORDER BY g.ord"""
+
+        print('batch_geometry_checks')
+        if not use_temp_table:
+            q=f"""WITH input AS ({input_query}),
+                    g AS (SELECT ord, id_to_avoid, geom, ST_IsValid(geom) AS is_valid FROM input)
+                {select_query}"""
+            with connection.cursor() as cursor:
+                cursor.execute(q, input_values + select_values)
+                return cursor.fetchall()
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {self.temp_table_name}")
+            cursor.execute(f"""CREATE TEMP TABLE {self.temp_table_name} ON COMMIT DROP AS
+                    SELECT i.*, ST_IsValid(i.geom) AS is_valid FROM ({input_query}) i""", input_values)
+            cursor.execute(f"CREATE INDEX ON {self.temp_table_name} USING GIST (geom)")
+            cursor.execute(f"ANALYZE {self.temp_table_name}")
+            cursor.execute(select_query, select_values)
+            rows=cursor.fetchall()
+            cursor.execute(f"DROP TABLE {self.temp_table_name}")
+        return rows
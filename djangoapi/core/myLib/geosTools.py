@@ -0,0 +1,191 @@
+"""
+In-process geometry tools, with the GEOS library of GeoDjango.
+
+They do the same as the PostGIS functions used in geometryTools.py,
+but without any query to the database:
+    - snap_to_grid() -> ST_SnapToGrid(geom, size)
+    - as_wkt() -> ST_AsText(geom)
+    - as_geojson() -> ST_AsGeojson(geom)
+    - as_hexewkb() -> the geometry as it is returned by psycopg2
+
+The output strings are formatted as PostGIS does, so the results
+are the same with both engines.
+"""
+import json
+from decimal import Decimal
+
+from django.contrib.gis.geos import (GEOSGeometry, Point, LineString, Polygon,
+                                     MultiPoint, MultiLineString, MultiPolygon,
+                                     GeometryCollection)
+
+#PostGIS defaults: ST_AsText uses 15 decimal digits, and ST_AsGeojson 9
+WKT_DECIMAL_DIGITS = 15
+GEOJSON_DECIMAL_DIGITS = 9
+#PostGIS prints 0 for values smaller than this tolerance
+FP_TOLERANCE = 1e-12
+#from this value PostGIS prints the numbers in exponential notation
+OUT_MAX_DOUBLE = 1e15
+
+def geometry_from_text(geom_text: str, srid: int)->GEOSGeometry:
+    """
+    Receives a string, with a geojson, or wkt geometry,
+    and returns the GEOSGeometry with the srid set. The same as
+    st_setsrid(ST_GeomFromText(geom_text), srid)
+    """
+    geom = GEOSGeometry(geom_text)
+    geom.srid = int(srid)
+    return geom
+
+def _snap_value(value: float, size: float)->float:
+    #the same as rint((value - 0)/size) * size + 0 in PostGIS.
+    #round() rounds half to even, as rint does
+    return round(value / size) * size + 0.0
+
+def _snap_coords(coords, size: float)->list:
+    """
+    Snaps the coordinates, and removes the consecutive repeated points
+    """
+    snapped = []
+    for c in coords:
+        p = tuple(_snap_value(v, size) if i < 2 else v for i, v in enumerate(c))
+        if len(snapped) > 0 and snapped[-1] == p:
+            continue
+        snapped.append(p)
+    return snapped
+
+def snap_to_grid(geom: GEOSGeometry, size: float)->GEOSGeometry:
+    """
+    Snaps the vertices of the geometry to a grid of the given size, as ST_SnapToGrid does:
+        - Consecutive repeated points are removed.
+        - The lines with less than two points are returned empty.
+        - The rings with less than four points are removed. If it is the exterior ring,
+          the polygon is returned empty.
+        - The empty parts of the collections are removed.
+    """
+    srid = geom.srid
+    if geom.empty:
+        return geom.clone()
+    geom_type = geom.geom_type
+    if geom_type == 'Point':
+        return Point(_snap_coords([geom.coords], size)[0], srid=srid)
+    if geom_type in ('LineString', 'LinearRing'):
+        coords = _snap_coords(geom.coords, size)
+        if len(coords) < 2:
+            return LineString(srid=srid)
+        return LineString(coords, srid=srid)
+    if geom_type == 'Polygon':
+        rings = []
+        for i, ring in enumerate(geom):
+            coords = _snap_coords(ring.coords, size)
+            if len(coords) < 4:
+                if i == 0:
+                    return Polygon(srid=srid)
+                continue
+            rings.append(coords)
+        return Polygon(*rings, srid=srid)
+
+    collections = {
+        'MultiPoint': MultiPoint,
+        'MultiLineString': MultiLineString,
+        'MultiPolygon': MultiPolygon,
+        'GeometryCollection': GeometryCollection,
+    }
+    parts = [snap_to_grid(part, size) for part in geom]
+    return collections[geom_type]([part for part in parts if not part.empty], srid=srid)
+
+def format_double(value: float, decimal_digits: int)->str:
+    """
+    Prints a number as PostGIS does: the shortest representation
+    that round-trips, with up to decimal_digits decimals, 
+    without the zeros on the right.
+    """
+    if abs(value) <= FP_TOLERANCE:
+        return '0'
+    if abs(value) < OUT_MAX_DOUBLE:
+        #repr() is the shortest representation that round-trips
+        text = format(Decimal(repr(value)), 'f')
+        if '.' in text and len(text.split('.')[1]) > decimal_digits:
+            text = f'{value:.{decimal_digits}f}'
+    else:
+        mantissa, exponent = f'{value:.{decimal_digits}e}'.split('e')
+        if '.' in mantissa:
+            mantissa = mantissa.rstrip('0').rstrip('.')
+        return f'{mantissa}e{exponent}'
+    if '.' in text:
+        text = text.rstrip('0').rstrip('.')
+    if text == '-0':
+        text = '0'
+    return text
+
+def _wkt_coords(coords, decimal_digits: int)->str:
+    return ','.join(' '.join(format_double(v, decimal_digits) for v in c) for c in coords)
+
+def _wkt_body(geom: GEOSGeometry, decimal_digits: int)->str:
+    """
+    Returns the wkt of the geometry without the type name, with the parenthesis
+    """
+    if geom.empty:
+        return ' EMPTY'
+    geom_type = geom.geom_type
+    if geom_type == 'Point':
+        return f'({_wkt_coords([geom.coords], decimal_digits)})'
+    if geom_type in ('LineString', 'LinearRing'):
+        return f'({_wkt_coords(geom.coords, decimal_digits)})'
+    if geom_type == 'Polygon':
+        return '(' + ','.join(f'({_wkt_coords(ring.coords, decimal_digits)})' for ring in geom) + ')'
+    if geom_type == 'MultiPoint':
+        #PostGIS does not write the parenthesis of the points of a multipoint
+        return f'({_wkt_coords([p.coords for p in geom], decimal_digits)})'
+    if geom_type == 'GeometryCollection':
+        return '(' + ','.join(as_wkt(part, decimal_digits) for part in geom) + ')'
+    return '(' + ','.join(_wkt_body(part, decimal_digits) for part in geom) + ')'
+
+def as_wkt(geom: GEOSGeometry, decimal_digits: int=WKT_DECIMAL_DIGITS)->str:
+    """
+    Returns the geometry in wkt, as ST_AsText does
+    """
+    return geom.geom_type.upper() + _wkt_body(geom, decimal_digits)
+
+def _geojson_coords(geom: GEOSGeometry, decimal_digits: int)->str:
+    def position(c):
+        return '[' + ','.join(format_double(v, decimal_digits) for v in c) + ']'
+    def positions(coords):
+        return '[' + ','.join(position(c) for c in coords) + ']'
+
+    geom_type = geom.geom_type
+    if geom.empty:
+        return '[]'
+    if geom_type == 'Point':
+        return position(geom.coords)
+    if geom_type in ('LineString', 'LinearRing'):
+        return positions(geom.coords)
+    if geom_type == 'Polygon':
+        return '[' + ','.join(positions(ring.coords) for ring in geom) + ']'
+    if geom_type == 'MultiPoint':
+        return positions([p.coords for p in geom])
+    return '[' + ','.join(_geojson_coords(part, decimal_digits) for part in geom) + ']'
+
+def as_geojson(geom: GEOSGeometry, decimal_digits: int=GEOJSON_DECIMAL_DIGITS, add_crs: bool=True)->str:
+    """
+    Returns the geometry in geojson, as ST_AsGeojson does. The short
+    crs (EPSG:xxxx) is added if the srid is not 4326
+    """
+    geojson_type = geom.geom_type
+    crs = ''
+    if add_crs and geom.srid and geom.srid != 4326:
+        crs = ',"crs":' + json.dumps({"type": "name", "properties": {"name": f"EPSG:{geom.srid}"}},
+                                     separators=(',', ':'))
+    if geojson_type == 'GeometryCollection':
+        geometries = ','.join(as_geojson(part, decimal_digits, add_crs=False) for part in geom)
+        return f'{{"type":"{geojson_type}"{crs},"geometries":[{geometries}]}}'
+    return f'{{"type":"{geojson_type}"{crs},"coordinates":{_geojson_coords(geom, decimal_digits)}}}'
+
+def as_hexewkb(geom: GEOSGeometry)->str:
+    """
+    Returns the geometry as hex ewkb, the same string that psycopg2
+    returns for a geometry computed in PostGIS
+    """
+    hexewkb = geom.hexewkb
+    if isinstance(hexewkb, bytes):
+        hexewkb = hexewkb.decode()
+    return hexewkb.upper()
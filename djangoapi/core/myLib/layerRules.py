@@ -0,0 +1,24 @@
+"""
+Topological rules of the layers, the same as the ones checked by their
+serializers and views when a feature is written. They are used by the
+imports (importer/) and the QA scans (qa/), that check many features at once:
+    - matrix9IM: two features of the layer can not have this relation.
+    - container_table: every feature must be inside (ST_Contains) a feature of it.
+    - area_field_name, length_field_name: fields where the area and the length
+        of the geometry are stored.
+"""
+
+class LayerRules:
+    def __init__(self, matrix9IM: str=None, container_table: str=None,
+                 area_field_name: str=None, length_field_name: str=None):
+        self.matrix9IM=matrix9IM
+        self.container_table=container_table
+        self.area_field_name=area_field_name
+        self.length_field_name=length_field_name
+
+LAYER_RULES = {
+    'parcels_parcels': LayerRules(matrix9IM='T********', area_field_name='area'),
+    'buildings_buildings': LayerRules(matrix9IM='T********', area_field_name='area'),
+    'roads_roads': LayerRules(matrix9IM='1*T***T**', length_field_name='length'),
+    'addresses_addresses': LayerRules(matrix9IM='T*F**FFF*', container_table='buildings_buildings'),
+}
@@ -0,0 +1,108 @@
+"""
+Registry of the geometry layers of the application, and the signal
+sent when their features change.
+
+The layers are identified by the name of their table, as in GeoServer
+and in the GeoPackage export: buildings_buildings, parcels_parcels, ...
+
+layer_changed is sent when features are inserted, updated or deleted,
+after the transaction has been committed:
+    - through the views and the serializers, by the post_save and post_delete
+      receivers of core/signals.py.
+    - by the bulk operations, that do not send post_save, with send_layer_changed().
+The arguments are:
+    - sender: the model
+    - layer: the name of the layer
+    - ids: list with the ids of the features
+    - extents: list with the (xmin, ymin, xmax, ymax) of the old and the new
+        geometries, in the srid of the layer
+    - operation: insert, update or delete
+
+To receive it:
+    from core.myLib.layers import layer_changed
+    def my_receiver(sender, layer, ids, extents, **kwargs):
+        ...
+    layer_changed.connect(my_receiver)
+
+Every layer has a version (core.models.LayerVersion), incremented on every
+layer_changed. Anything computed from a layer is still valid while its version
+has not changed:
+    versions=get_layer_versions(['buildings_buildings', 'roads_roads'])
+"""
+from django.apps import apps
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Now
+from django.dispatch import Signal
+from django.contrib.gis.geos import GEOSGeometry
+
+LAYERS = {
+    'buildings_buildings': 'buildings.Buildings',
+    'parcels_parcels': 'parcels.Parcels',
+    'roads_roads': 'roads.Roads',
+    'addresses_addresses': 'addresses.Addresses',
+}
+
+layer_changed = Signal()
+
+def get_layer_model(layer_name: str):
+    """
+    Returns the model of the layer. Raises KeyError if the layer does not exist
+    """
+    return apps.get_model(LAYERS[layer_name])
+
+def get_layer_name(model)->str:
+    """
+    Returns the name of the layer of the model, or None if it is not a layer
+    """
+    layer_name=model._meta.db_table
+    if layer_name in LAYERS:
+        return layer_name
+    return None
+
+def geometry_extent(geom)->tuple:
+    """
+    Returns the (xmin, ymin, xmax, ymax) of a geometry, GEOSGeometry or
+    hex wkb, or None if there is not geometry
+    """
+    if geom is None:
+        return None
+    if isinstance(geom, (str, bytes, memoryview)):
+        geom=GEOSGeometry(geom)
+    if geom.empty:
+        return None
+    return geom.extent
+
+def send_layer_changed(model, ids: list, extents: list, operation: str=None):
+    """
+    Sends layer_changed when the current transaction is committed,
+    or at once if there is not transaction.
+    operation: insert, update or delete. If it is given, the changes are
+    also written in the change log (core/myLib/changes.py), in the
+    current transaction.
+    """
+    layer_name=get_layer_name(model)
+    if layer_name is None:
+        return
+    if operation is not None:
+        from .changes import record_changes
+        record_changes(layer_name, ids, operation)
+    extents=[e for e in extents if e is not None]
+    transaction.on_commit(lambda: layer_changed.send(sender=model, layer=layer_name, ids=ids, extents=extents,
+                                                     operation=operation))
+
+def increment_layer_version(layer_name: str):
+    LayerVersion=apps.get_model('core', 'LayerVersion')
+    n=LayerVersion.objects.filter(layer_name=layer_name).update(version=F('version') + 1, updated_at=Now())
+    if n == 0:
+        obj, created=LayerVersion.objects.get_or_create(layer_name=layer_name, defaults={'version': 1})
+        if not created:
+            LayerVersion.objects.filter(layer_name=layer_name).update(version=F('version') + 1, updated_at=Now())
+
+def get_layer_versions(layer_names: list)->dict:
+    """
+    Returns {layer_name: version}. 0 if the layer has never changed
+    """
+    LayerVersion=apps.get_model('core', 'LayerVersion')
+    versions=dict(LayerVersion.objects.filter(layer_name__in=layer_names).values_list('layer_name', 'version'))
+    return {layer_name: versions.get(layer_name, 0) for layer_name in layer_names}
@@ -0,0 +1,39 @@
+"""
+Compression of the responses with gzip, for the clients that accept it
+(Accept-Encoding: gzip). The GeoJSON and WKT of the layers are text with
+many repeated coordinates, and are 3 to 10 times smaller compressed.
+
+It is the GZipMiddleware of Django, except for the responses that are
+already compressed (zip files of the exports) or are files sent from the
+disk (GeoPackage), where gzip only costs CPU.
+
+GZipMiddleware makes the strong ETags weak, as the compressed content is
+not the same. Here they stay strong, with the suffix -gzip, as the ETag of
+the compressed variant: "12.3.ab" -> "12.3.ab-gzip". responseCache.py removes
+the suffix from If-None-Match before it compares the ETags.
+
+Enabled with GZIP_RESPONSES in the settings:
+    MIDDLEWARE = ['core.myLib.middleware.CompressionMiddleware', ...]
+"""
+from django.http import FileResponse
+from django.middleware.gzip import GZipMiddleware
+
+UNCOMPRESSED_CONTENT_TYPES = ('application/zip', 'application/geopackage+sqlite3', 'image/png', 'image/jpeg')
+GZIP_ETAG_SUFFIX = '-gzip'
+
+class CompressionMiddleware(GZipMiddleware):
+    def process_response(self, request, response):
+        if isinstance(response, FileResponse):
+            return response
+        if response.get('Content-Type', '').startswith(UNCOMPRESSED_CONTENT_TYPES):
+            return response
+        etag=response.get('ETag')
+        strong_etag=etag is not None and etag.startswith('"')
+        encoded=response.has_header('Content-Encoding')
+        if strong_etag:
+            del response['ETag']
+        response=super().process_response(request, response)
+        if strong_etag:
+            compressed=not encoded and response.get('Content-Encoding') == 'gzip'
+            response['ETag']=f'{etag[:-1]}{GZIP_ETAG_SUFFIX}"' if compressed else etag
+        return response
@@ -0,0 +1,97 @@
+"""
+Writes the features of the layers with the OGR drivers of the GDAL python
+bindings (FlatGeobuf, GPKG, ...), in the same process.
+
+The rows are tuples with the values of the fields and the wkb of the
+geometry at the end, as read with values_list from the database, so
+no GEOS geometry is built.
+
+Example:
+    ds=ogr.GetDriverByName('GPKG').CreateDataSource(path)
+    fields=get_attribute_fields(Buildings)
+    layer=create_ogr_layer(ds, 'buildings_buildings', fields, 3794, ogr.wkbPolygon)
+    rows=queryset.annotate(geom_wkb=AsWKB('geom')).values_list(*[f.attname for f in fields], 'geom_wkb')
+    write_ogr_features(layer, rows.iterator(chunk_size=STREAMING_CHUNK_SIZE))
+    ds=None
+"""
+from decimal import Decimal
+
+INTEGER_FIELD_TYPES = ('AutoField', 'BigAutoField', 'SmallAutoField', 'IntegerField', 'BigIntegerField',
+                       'SmallIntegerField', 'PositiveIntegerField', 'PositiveBigIntegerField',
+                       'PositiveSmallIntegerField', 'ForeignKey', 'OneToOneField')
+
+def ogr_field_type(field):
+    """
+    (type, subtype) of OGR for the django field
+    """
+    from osgeo import ogr
+    internal_type=field.get_internal_type()
+    if internal_type in INTEGER_FIELD_TYPES:
+        return ogr.OFTInteger64, ogr.OFSTNone
+    if internal_type in ('FloatField', 'DecimalField'):
+        return ogr.OFTReal, ogr.OFSTNone
+    if internal_type == 'BooleanField':
+        return ogr.OFTInteger, ogr.OFSTBoolean
+    if internal_type == 'DateField':
+        return ogr.OFTDate, ogr.OFSTNone
+    if internal_type == 'DateTimeField':
+        return ogr.OFTDateTime, ogr.OFSTNone
+    return ogr.OFTString, ogr.OFSTNone
+
+def ogr_value(value):
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, (int, float, str)):
+        return value
+    return str(value)
+
+def create_ogr_layer(ds, layer_name: str, fields: list, srid: int, geom_type: int=None, options: list=None):
+    """
+    Creates the layer in the datasource, with the fields of the model
+    """
+    from osgeo import ogr, osr
+    srs=osr.SpatialReference()
+    srs.ImportFromEPSG(srid)
+    if geom_type is None:
+        geom_type=ogr.wkbUnknown
+    layer=ds.CreateLayer(layer_name, srs, geom_type, options=options or [])
+    for field in fields:
+        field_type, field_subtype=ogr_field_type(field)
+        field_defn=ogr.FieldDefn(field.attname, field_type)
+        field_defn.SetSubType(field_subtype)
+        layer.CreateField(field_defn)
+    return layer
+
+def write_ogr_features(layer, rows, use_transaction: bool=False, progress=None, progress_every: int=1000)->int:
+    """
+    Writes the rows in the layer. With use_transaction, all of them in
+    one transaction, which is much faster in GPKG.
+    progress: function called with the number of features written, every
+    progress_every features.
+    Returns the number of features
+    """
+    from osgeo import ogr
+    layer_defn=layer.GetLayerDefn()
+    n=0
+    if use_transaction:
+        layer.StartTransaction()
+    for row in rows:
+        feature=ogr.Feature(layer_defn)
+        for i, value in enumerate(row[:-1]):
+            if value is None:
+                feature.SetFieldNull(i)
+            else:
+                feature.SetField(i, ogr_value(value))
+        if row[-1] is not None:
+            feature.SetGeometryDirectly(ogr.CreateGeometryFromWkb(bytes(row[-1])))
+        layer.CreateFeature(feature)
+        n+=1
+        if progress is not None and n % progress_every == 0:
+            progress(n)
+    if use_transaction:
+        layer.CommitTransaction()
+    return n
@@ -0,0 +1,77 @@
+"""
+Keyset pagination on the id.
+
+The pages are selected with WHERE id > <last id of the previous page>
+ORDER BY id LIMIT <page size>, using the primary key index. The cost
+of a page does not depend on its position, as it happens with OFFSET,
+and the pages are stable when new rows are inserted.
+
+    - IdCursorPagination: for the Django Rest Framework viewsets. The next
+        and previous links have an opaque cursor:
+            GET /roads/roads/?page_size=500
+            GET /roads/roads/?cursor=cD0xMjM0&page_size=500
+    - keyset_page(): for the class based views (BaseDjangoView.selectall_response),
+        and akeyset_page() for the async ones. The next link has the parameter after=<last id>:
+            GET /roads/roads_view/selectall/?after=1234&page_size=500
+"""
+from rest_framework.pagination import CursorPagination
+
+from djangoapi.settings import PAGE_SIZE, MAX_PAGE_SIZE
+
+class IdCursorPagination(CursorPagination):
+    ordering = 'id'
+    page_size = PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = MAX_PAGE_SIZE
+
+def get_page_size(query_dict, default: int=PAGE_SIZE, maximum: int=MAX_PAGE_SIZE)->int:
+    """
+    Returns the parameter page_size, between 1 and maximum.
+    Raises ValueError if it is not an integer
+    """
+    page_size=query_dict.get('page_size', None)
+    if page_size is None or page_size == '':
+        return min(default, maximum)
+    return max(1, min(int(page_size), maximum))
+
+def keyset_queryset(queryset, request, default_page_size: int=PAGE_SIZE, max_page_size: int=MAX_PAGE_SIZE):
+    """
+    Returns the queryset of the page, with one row more than the page size
+    to know if there is a next page, and the page size.
+    Raises ValueError if after or page_size are not integers
+    """
+    queryset=queryset.order_by('id')
+    after=request.GET.get('after', None)
+    if after is not None and after != '':
+        queryset=queryset.filter(id__gt=int(after))
+    page_size=get_page_size(request.GET, default_page_size, max_page_size)
+    return queryset[:page_size + 1], page_size
+
+def next_page(rows: list, request, page_size: int):
+    """
+    Returns the rows of the page and the url of the next page, or None
+    if rows has no more rows than the page size
+    """
+    if len(rows) <= page_size:
+        return rows, None
+    rows=rows[:page_size]
+    query_dict=request.GET.copy()
+    query_dict['after']=rows[-1].id
+    return rows, request.build_absolute_uri(f"{request.path}?{query_dict.urlencode()}")
+
+def keyset_page(queryset, request, default_page_size: int=PAGE_SIZE, max_page_size: int=MAX_PAGE_SIZE):
+    """
+    Returns the rows of the page, and the url of the next page, or None if it
+    is the last one. The page starts after the id in the parameter after.
+    One row more than the page size is read, to know if there is a next page.
+    Raises ValueError if after or page_size are not integers
+    """
+    queryset, page_size=keyset_queryset(queryset, request, default_page_size, max_page_size)
+    return next_page(list(queryset), request, page_size)
+
+async def akeyset_page(queryset, request, default_page_size: int=PAGE_SIZE, max_page_size: int=MAX_PAGE_SIZE):
+    """
+    The same as keyset_page, with the async ORM
+    """
+    queryset, page_size=keyset_queryset(queryset, request, default_page_size, max_page_size)
+    return next_page([row async for row in queryset], request, page_size)
@@ -0,0 +1,200 @@
+"""
+Cache of the responses of the read endpoints of the layers (selectone,
+selectall, and list and retrieve of the viewsets).
+
+The key is made of the layer, its version (core.models.LayerVersion), the
+url with the parameters in order, and the Accept header. Every insert, update
+or delete of the layer, through the views, the serializers, the bulk actions
+or the imports, increments its version (layer_changed), so after a change the
+keys are new and the old responses are not used any more: nothing has to be
+removed from the cache, they expire after RESPONSE_CACHE_TTL seconds.
+The version is in the database, so a change made by any worker is seen by all of them.
+
+The key is also the ETag of the response. If the client sends it in If-None-Match,
+and the layer has not changed, the response is 304 Not Modified, without reading
+the cache nor the features. The version is read before the response is made, so
+a response is never saved with a version newer than its data.
+
+The features of the layers also have their own version (row_version, +1 on every
+update, and updated_at), so list and retrieve of the viewsets use more precise
+validators, read without the geometries (feature_validators, list_validators):
+    - retrieve: strong ETag "<id>.<row_version>.<hash of the url>", and Last-Modified
+        the updated_at of the feature. It only changes when that feature changes.
+    - list: weak ETag of the count, the max updated_at and the sum of the row_version
+        of the features that pass the filters (bbox, ...), and the url. It only
+        changes when a feature of the filtered list changes. Last-Modified is the
+        time of the last change of the layer, as a deleted feature does not
+        change the max updated_at.
+If-None-Match has precedence over If-Modified-Since. They are used even if
+RESPONSE_CACHE_ENABLED is False.
+
+The cache is CACHES['responses'] (RESPONSE_CACHE_BACKEND in the settings: memory
+of the process, files or Redis). The streamed responses (stream=true, wkb, arrow),
+the pages of the browsable API and the responses bigger than
+RESPONSE_CACHE_MAX_ENTRY_SIZE are not saved, but have ETag.
+
+Example:
+    rc=ResponseCache(request, 'buildings_buildings')
+    response=rc.lookup()
+    if response is None:
+        response=rc.store(make_the_response())
+"""
+import hashlib
+import json
+
+from django.apps import apps
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max, Sum
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import parse_etags
+from django.utils.http import http_date, parse_http_date_safe
+
+from djangoapi.settings import RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_ENTRY_SIZE
+from .layers import get_layer_versions
+from .middleware import GZIP_ETAG_SUFFIX
+
+CACHE_ALIAS = 'responses'
+
+def get_request_hash(request, **extra)->str:
+    """
+    Hash of the request (url, parameters in order and Accept) and the values of extra
+    """
+    content=json.dumps({
+        **extra,
+        'host': request.get_host(),
+        'path': request.path,
+        'params': sorted(request.GET.lists()),
+        'accept': request.META.get('HTTP_ACCEPT', ''),
+    }, sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+def get_cache_key(request, layer_name: str, version: int)->str:
+    return get_request_hash(request, layer=layer_name, version=version)
+
+def has_row_version(model)->bool:
+    field_names=[f.name for f in model._meta.concrete_fields]
+    return 'row_version' in field_names and 'updated_at' in field_names
+
+def feature_validators(queryset, pk, request)->tuple:
+    """
+    Returns (strong ETag, Last-Modified) of the feature pk, or (None, None) if it
+    does not exist. Only its row_version and updated_at are read
+    """
+    try:
+        row=queryset.filter(pk=pk).values_list('row_version', 'updated_at').first()
+    except (TypeError, ValueError, ValidationError):
+        #the action answers 404, as get_object
+        return None, None
+    if row is None:
+        return None, None
+    row_version, updated_at=row
+    return f'"{pk}.{row_version}.{get_request_hash(request)[:16]}"', updated_at
+
+def list_validators(queryset, layer_name: str, request)->tuple:
+    """
+    Returns (weak ETag, Last-Modified) of the features of the filtered queryset,
+    with one aggregate, without the geometries
+    """
+    values=queryset.order_by().aggregate(count=Count('pk'), max_updated_at=Max('updated_at'),
+                                         sum_row_version=Sum('row_version'))
+    key=get_request_hash(request, count=values['count'], sum_row_version=values['sum_row_version'],
+                         max_updated_at=values['max_updated_at'].isoformat() if values['max_updated_at'] else None)
+    LayerVersion=apps.get_model('core', 'LayerVersion')
+    last_modified=LayerVersion.objects.filter(layer_name=layer_name).values_list('updated_at', flat=True).first()
+    return f'W/"{key[:40]}"', last_modified or values['max_updated_at']
+
+def opaque_tag(etag: str)->str:
+    """
+    The ETag without W/ and without the suffix of the compressed variant (middleware.py)
+    """
+    etag=etag[2:] if etag.startswith('W/') else etag
+    if etag.endswith(f'{GZIP_ETAG_SUFFIX}"'):
+        etag=etag[:-len(GZIP_ETAG_SUFFIX) - 1] + '"'
+    return etag
+
+class ResponseCache:
+    """
+    etag and last_modified: the validators of the response (feature_validators,
+    list_validators). If etag is not given, it is the key of the cache
+    """
+    def __init__(self, request, layer_name: str, etag: str=None, last_modified=None):
+        self.request=request
+        self.layer_name=layer_name
+        self.conditional=request.method in ('GET', 'HEAD')
+        self.enabled=RESPONSE_CACHE_ENABLED and self.conditional
+        self.key=None
+        self.etag=etag if self.conditional else None
+        self.last_modified=last_modified if self.conditional else None
+        if self.enabled:
+            version=get_layer_versions([layer_name])[layer_name]
+            self.key=get_cache_key(request, layer_name, version)
+            if self.etag is None:
+                self.etag=f'W/"{self.key[:40]}"'
+
+    def is_not_modified(self)->bool:
+        """
+        True if the client already has the response: If-None-Match has the ETag or,
+        without If-None-Match, If-Modified-Since is not older than Last-Modified
+        """
+        if_none_match=self.request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            if self.etag is None:
+                return False
+            etags=parse_etags(if_none_match)
+            #weak comparison, as in If-None-Match
+            return '*' in etags or opaque_tag(self.etag) in [opaque_tag(e) for e in etags]
+        if_modified_since=self.request.META.get('HTTP_IF_MODIFIED_SINCE')
+        if if_modified_since is None or self.last_modified is None:
+            return False
+        if_modified_since=parse_http_date_safe(if_modified_since)
+        #the dates of http have seconds
+        return if_modified_since is not None and int(self.last_modified.timestamp()) <= if_modified_since
+
+    def set_validators(self, response):
+        if self.etag is not None:
+            response['ETag']=self.etag
+        if self.last_modified is not None:
+            response['Last-Modified']=http_date(self.last_modified.timestamp())
+        return response
+
+    def lookup(self):
+        """
+        Returns the response 304 if the client has it, the response in the cache,
+        or None if it has to be made
+        """
+        if not self.conditional:
+            return None
+        if self.is_not_modified():
+            return self.set_validators(HttpResponseNotModified())
+        if not self.enabled:
+            return None
+        cached=caches[CACHE_ALIAS].get(self.key)
+        if cached is None:
+            return None
+        content, content_type=cached
+        response=self.set_validators(HttpResponse(content, content_type=content_type))
+        response['X-Response-Cache']='HIT'
+        return response
+
+    def store(self, response):
+        """
+        Saves the response in the cache, if it can be saved, and sets its ETag and Last-Modified.
+        DRF responses must be already finalized (finalize_response), to be rendered
+        """
+        if not self.conditional or response.status_code != 200:
+            return response
+        self.set_validators(response)
+        if not self.enabled:
+            return response
+        response['X-Response-Cache']='MISS'
+        if response.streaming:
+            return response
+        if hasattr(response, 'render'):
+            response.render()
+        #the pages of the browsable API have the user and the forms
+        if response.get('Content-Type', '').startswith('text/html'):
+            return response
+        if len(response.content) <= RESPONSE_CACHE_MAX_ENTRY_SIZE:
+            caches[CACHE_ALIAS].set(self.key, (response.content, response['Content-Type']), RESPONSE_CACHE_TTL)
+        return response
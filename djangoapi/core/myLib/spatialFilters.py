@@ -0,0 +1,87 @@
+"""
+Spatial filters for the list endpoints of the Django Rest Framework viewsets.
+
+All of them are translated to PostGIS functions that use the GiST index
+of the geometry field:
+    - bbox=minx,miny,maxx,maxy -> ST_Intersects(geom, envelope)
+    - intersects=<wkt or geojson> -> ST_Intersects(geom, geometry)
+    - dwithin=<wkt>,<distance> -> ST_DWithin(geom, geometry, distance)
+    - contains_point=x,y or contains_point=POINT(x y) -> ST_Contains(geom, point)
+
+The coordinates are in the EPSG_FOR_GEOMETRIES, unless the geometry is
+given in EWKT (SRID=xxxx;POINT(...)). The distance of dwithin is in the
+units of the srid of the layer.
+
+The filters can be combined between them, and with the field filters and
+the pagination:
+    GET /buildings/buildings/?bbox=725000,4372000,726000,4373000&sifko=1
+"""
+from django.contrib.gis.geos import GEOSGeometry, Point, Polygon
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from djangoapi.settings import EPSG_FOR_GEOMETRIES
+
+def parse_geometry(value: str, param: str)->GEOSGeometry:
+    try:
+        geom=GEOSGeometry(value)
+    except Exception as e:
+        raise ValidationError({param: [f'The geometry can not be parsed: {e}']})
+    if geom.srid is None:
+        geom.srid=EPSG_FOR_GEOMETRIES
+    return geom
+
+def parse_numbers(value: str, param: str, count: int)->list:
+    try:
+        numbers=[float(v) for v in value.split(',')]
+    except ValueError:
+        numbers=[]
+    if len(numbers) != count:
+        raise ValidationError({param: [f'{count} numbers separated by commas are expected']})
+    return numbers
+
+class SpatialFilterBackend(BaseFilterBackend):
+    """
+    Filters the queryset with the parameters bbox, intersects, dwithin and contains_point.
+    The geometry field is the attribute spatial_filter_field of the view, or geom.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        field_name=getattr(view, 'spatial_filter_field', 'geom')
+        params=request.query_params
+
+        value=params.get('bbox')
+        if value:
+            minx, miny, maxx, maxy=parse_numbers(value, 'bbox', 4)
+            envelope=Polygon.from_bbox((minx, miny, maxx, maxy))
+            envelope.srid=EPSG_FOR_GEOMETRIES
+            queryset=queryset.filter(**{f'{field_name}__intersects': envelope})
+
+        value=params.get('intersects')
+        if value:
+            queryset=queryset.filter(**{f'{field_name}__intersects': parse_geometry(value, 'intersects')})
+
+        value=params.get('dwithin')
+        if value:
+            #the wkt has commas: the distance is after the last one
+            geom_text, sep, distance=value.rpartition(',')
+            try:
+                distance=float(distance)
+            except ValueError:
+                raise ValidationError({'dwithin': ['The format is dwithin=<wkt>,<distance>']})
+            if distance < 0 or sep == '':
+                raise ValidationError({'dwithin': ['The format is dwithin=<wkt>,<distance>']})
+            geom=parse_geometry(geom_text, 'dwithin')
+            queryset=queryset.filter(**{f'{field_name}__dwithin': (geom, distance)})
+
+        value=params.get('contains_point')
+        if value:
+            if any(c in value for c in '({;'):
+                point=parse_geometry(value, 'contains_point')
+            else:
+                x, y=parse_numbers(value, 'contains_point', 2)
+                point=Point(x, y, srid=EPSG_FOR_GEOMETRIES)
+            queryset=queryset.filter(**{f'{field_name}__contains': point})
+
+        return queryset
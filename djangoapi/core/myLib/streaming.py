@@ -0,0 +1,128 @@
+"""
+Streaming JSON responses.
+
+The rows are read from the database with a server side cursor
+(queryset.iterator(chunk_size)), and the JSON is written as they arrive,
+so the memory does not depend on the number of rows, and the first
+bytes are sent before the query has been completely read.
+
+Example:
+    rows=(feature_to_dict(b) for b in queryset.iterator(chunk_size=STREAMING_CHUNK_SIZE))
+    return stream_json_response(True, 'Data retrieved', rows)
+"""
+import json
+import os
+import zipfile
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from djangoapi.settings import STREAMING_CHUNK_SIZE
+
+def wants_streaming(query_dict)->bool:
+    """
+    True if the request has the parameter stream=true
+    """
+    return query_dict.get('stream', 'false').lower() in ('true', '1', 't')
+
+def iter_json_array(rows, encoder=DjangoJSONEncoder, rows_per_chunk: int=STREAMING_CHUNK_SIZE):
+    """
+    Generator of the JSON array of the rows, in pieces of rows_per_chunk rows
+    """
+    yield '['
+    parts=[]
+    separator=''
+    for row in rows:
+        parts.append(separator + json.dumps(row, cls=encoder))
+        separator=','
+        if len(parts) >= rows_per_chunk:
+            yield ''.join(parts)
+            parts=[]
+    if len(parts) > 0:
+        yield ''.join(parts)
+    yield ']'
+
+def stream_json_response(ok: bool, message: str, rows, status: int=200)->StreamingHttpResponse:
+    """
+    The same as JsonResponse({'ok':ok, 'message':message, 'data':rows}),
+    but the data array is streamed
+    """
+    def content():
+        yield f'{{"ok": {json.dumps(ok)}, "message": {json.dumps(message)}, "data": '
+        yield from iter_json_array(rows)
+        yield '}'
+    return StreamingHttpResponse(content(), status=status, content_type='application/json')
+
+async def aiter_json_array(rows, encoder=DjangoJSONEncoder, rows_per_chunk: int=STREAMING_CHUNK_SIZE):
+    """
+    The same as iter_json_array, for an async iterator of rows (queryset.aiterator())
+    """
+    yield '['
+    parts=[]
+    separator=''
+    async for row in rows:
+        parts.append(separator + json.dumps(row, cls=encoder))
+        separator=','
+        if len(parts) >= rows_per_chunk:
+            yield ''.join(parts)
+            parts=[]
+    if len(parts) > 0:
+        yield ''.join(parts)
+    yield ']'
+
+def astream_json_response(ok: bool, message: str, rows, status: int=200)->StreamingHttpResponse:
+    """
+    The same as stream_json_response, for an async iterator of rows. The
+    response is sent by the ASGI server without blocking a thread
+    """
+    async def content():
+        yield f'{{"ok": {json.dumps(ok)}, "message": {json.dumps(message)}, "data": '
+        async for part in aiter_json_array(rows):
+            yield part
+        yield '}'
+    return StreamingHttpResponse(content(), status=status, content_type='application/json')
+
+def stream_json_array_response(rows, encoder=DjangoJSONEncoder, status: int=200)->StreamingHttpResponse:
+    """
+    Streams only the JSON array of the rows, as the list() of the viewsets
+    """
+    return StreamingHttpResponse(iter_json_array(rows, encoder), status=status, content_type='application/json')
+
+
+class ZipStreamBuffer:
+    """
+    Not seekable file where zipfile writes. The bytes are taken
+    with pop() as they are written.
+    """
+    def __init__(self):
+        self.parts=[]
+
+    def write(self, b)->int:
+        self.parts.append(bytes(b))
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def pop(self)->bytes:
+        content=b''.join(self.parts)
+        self.parts=[]
+        return content
+
+def iter_zip(files: list, chunk_size: int=1024 * 1024):
+    """
+    Generator of a zip file with the files [(name in the zip, path), ...].
+    The zip is made while it is sent: the files are read and compressed in
+    pieces of chunk_size bytes, and the compressed bytes are yielded at once.
+    """
+    buffer=ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, path in files:
+            info=zipfile.ZipInfo.from_file(path, name)
+            info.compress_type=zipfile.ZIP_DEFLATED
+            with open(path, 'rb') as src, zf.open(info, 'w', force_zip64=os.path.getsize(path) > zipfile.ZIP64_LIMIT) as dst:
+                for chunk in iter(lambda: src.read(chunk_size), b''):
+                    dst.write(chunk)
+                    yield buffer.pop()
+            yield buffer.pop()
+    yield buffer.pop()
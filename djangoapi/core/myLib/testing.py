@@ -0,0 +1,36 @@
+"""
+Base class of the tests that need PostGIS: the geometry checks, the layers,
+the change feed, ... They are skipped if the database has not PostGIS.
+Every test starts with the cache of the responses empty: in a TestCase the
+transactions are not committed, so the versions of the layers do not change.
+
+    class RoadsApiTest(PostGISTestCase):
+        def setUp(self):
+            super().setUp()
+            ...
+"""
+from django.core.cache import caches
+from django.db import connection, transaction, DatabaseError
+from django.test import TestCase
+
+from .responseCache import CACHE_ALIAS
+
+def postgis_available()->bool:
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SELECT PostGIS_Version()")
+        return True
+    except DatabaseError:
+        return False
+
+class PostGISTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        if not postgis_available():
+            cls.tearDownClass()
+            raise cls.skipException('PostGIS is not available')
+
+    def setUp(self):
+        super().setUp()
+        caches[CACHE_ALIAS].clear()
@@ -0,0 +1,56 @@
+"""
+Receivers that translate the save and delete of the features of the
+layers (core/myLib/layers.py) to the signal layer_changed, and that
+increment the version of the layer when it is sent. The version of every
+feature (row_version) is incremented when it is updated.
+They are connected in CoreConfig.ready()
+"""
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.contrib.gis.db.models.functions import Envelope
+
+from core.models import LayerChange
+from core.myLib.layers import (layer_changed, get_layer_name, geometry_extent, send_layer_changed,
+                               increment_layer_version)
+
+@receiver(pre_save)
+def remember_old_extent(sender, instance, raw=False, **kwargs):
+    """
+    On updates, reads the extent of the geometry stored in the database,
+    as the tiles, caches, ... of the old position must also be invalidated
+    """
+    if raw or get_layer_name(sender) is None:
+        return
+    instance._old_extent=None
+    if instance.pk is None:
+        return
+    old=sender.objects.filter(pk=instance.pk).annotate(envelope=Envelope('geom')).values_list('envelope', flat=True).first()
+    instance._old_extent=geometry_extent(old)
+
+@receiver(pre_save)
+def increment_row_version(sender, instance, raw=False, **kwargs):
+    """
+    On updates, increments the version of the feature, which is in the ETag
+    of its responses (core/myLib/responseCache.py). bulk_update does not send
+    pre_save: GeoModelViewSet.bulk_update increments it itself
+    """
+    if raw or get_layer_name(sender) is None or instance._state.adding:
+        return
+    instance.row_version=(instance.row_version or 0) + 1
+
+@receiver(post_save)
+def feature_saved(sender, instance, created=False, raw=False, **kwargs):
+    if raw or get_layer_name(sender) is None:
+        return
+    extents=[getattr(instance, '_old_extent', None), geometry_extent(instance.geom)]
+    send_layer_changed(sender, [instance.pk], extents, LayerChange.INSERT if created else LayerChange.UPDATE)
+
+@receiver(post_delete)
+def feature_deleted(sender, instance, **kwargs):
+    if get_layer_name(sender) is None:
+        return
+    send_layer_changed(sender, [instance.pk], [geometry_extent(instance.geom)], LayerChange.DELETE)
+
+@receiver(layer_changed)
+def layer_version_changed(sender, layer, ids, extents, **kwargs):
+    increment_layer_version(layer)
@@ -1,3 +1,216 @@
-from django.test import TestCase
+from django.db import transaction
+from django.test import RequestFactory
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from buildings.models import Buildings
+from core.models import LayerChange
+from core.myLib.changes import get_changes, record_changes, current_token, parse_token, snapshot_xmin
+from core.myLib.geometryTools import WkbConversor
+from core.myLib.pagination import keyset_page
+from core.myLib.testing import PostGISTestCase
+
+class WkbConversorEnginesTest(PostGISTestCase):
+    """
+    The engine 'geos' (core/myLib/geosTools.py) must give exactly the same
+    wkb, wkt and geojson as the engine 'postgis'. Skipped without PostGIS
+    """
+    #(geometry in wkt or geojson, size of the grid)
+    GEOMETRIES = [
+        #snap precision, with values in the middle of the grid (rounded half to even)
+        ('POINT(1.23456 2.98765)', 0.001),
+        ('POINT(0.125 0.375)', 0.25),
+        ('POINT(-0.0004 123456.0005)', 0.001),
+        ('POINT(462345.678912 101234.567891)', 0.01),
+        ('LINESTRING(0 0,0.0001 0.0001,1.00049 1.00051,2 2)', 0.001),
+        #the line collapses to one point and becomes empty
+        ('LINESTRING(0 0,0.0001 0.0002)', 0.001),
+        ('POLYGON((0 0,10.0004 0,10 10.0006,0 10,0 0),(2 2,2 3,3 3,3 2,2 2))', 0.001),
+        #the hole collapses and is removed
+        ('POLYGON((0 0,10 0,10 10,0 10,0 0),(2 2,2 2.0001,2.0001 2.0001,2 2))', 0.001),
+        #the exterior ring collapses and the polygon becomes empty
+        ('POLYGON((0 0,0.0001 0,0.0001 0.0001,0 0))', 0.001),
+        #multi geometries, with a part that collapses
+        ('MULTIPOINT((0 0),(1.00049 1.00051))', 0.001),
+        ('MULTILINESTRING((0 0,1 1),(5 5,5.0001 5.0001))', 0.001),
+        ('MULTIPOLYGON(((0 0,1 0,1 1,0 1,0 0)),((5 5,5.0001 5,5.0001 5.0001,5 5)))', 0.001),
+        ('GEOMETRYCOLLECTION(POINT(1.23456 2.98765),LINESTRING(0 0,1.00049 1.00051))', 0.001),
+        #big and small coordinates, printed in exponential notation by PostGIS
+        ('POINT(1e16 1e-13)', 0.0000000000001),
+        #empty geometries
+        ('POINT EMPTY', 0.001),
+        ('POLYGON EMPTY', 0.001),
+        ('MULTIPOLYGON EMPTY', 0.001),
+        ('GEOMETRYCOLLECTION EMPTY', 0.001),
+        #geojson
+        ('{"type":"Point","coordinates":[1.23456,2.98765]}', 0.001),
+        ('{"type":"LineString","coordinates":[[0,0],[1.00049,1.00051],[2,2]]}', 0.001),
+        ('{"type":"MultiPolygon","coordinates":[[[[0,0],[1,0],[1,1],[0,1],[0,0]]],[[[5,5],[6,5],[6,6],[5,5]]]]}', 0.001),
+        #not valid: self-intersection
+        ('POLYGON((0 0,10 10,10 0,0 10,0 0))', 0.001),
+    ]
+    #geometries that can not be read
+    INVALID_TEXTS = [
+        'POINT(1)',
+        'POLYGON((0 0,1 0,1 1))',
+        'NOT A GEOMETRY',
+        '{"type":"Point","coordinates":"abc"}',
+    ]
+
+    def convert(self, engine: str, geom_text: str, size: float, snap_to_grid: bool=True)->WkbConversor:
+        wc=WkbConversor(st_snap_precision=size, snap_to_grid=snap_to_grid, engine=engine)
+        wc.set_wkt_from_text(geom_text)
+        return wc
+
+    def assert_same_output(self, geom_text: str, size: float, snap_to_grid: bool=True):
+        postgis=self.convert('postgis', geom_text, size, snap_to_grid)
+        geos=self.convert('geos', geom_text, size, snap_to_grid)
+        self.assertEqual(str(geos.get_as_wkb()), str(postgis.get_as_wkb()))
+        self.assertEqual(geos.get_as_wkt(), postgis.get_as_wkt())
+        self.assertEqual(geos.get_as_geojson(), postgis.get_as_geojson())
+        self.assertEqual(geos.is_geometry_valid(), postgis.is_geometry_valid())
+
+    def test_snapped_geometries(self):
+        for geom_text, size in self.GEOMETRIES:
+            with self.subTest(geom_text=geom_text, size=size):
+                self.assert_same_output(geom_text, size)
+
+    def test_geometries_without_snap(self):
+        for geom_text, size in self.GEOMETRIES:
+            with self.subTest(geom_text=geom_text):
+                self.assert_same_output(geom_text, size, snap_to_grid=False)
+
+    def test_invalid_texts(self):
+        for geom_text in self.INVALID_TEXTS:
+            with self.subTest(geom_text=geom_text):
+                with self.assertRaises(Exception):
+                    with transaction.atomic():
+                        self.convert('postgis', geom_text, 0.001)
+                with self.assertRaises(Exception):
+                    self.convert('geos', geom_text, 0.001)
+
+class KeysetPaginationTest(PostGISTestCase):
+    """
+    keyset_page() and IdCursorPagination: the pages follow the id, without
+    repeated or missing rows, and the last page has not next
+    """
+    def setUp(self):
+        super().setUp()
+        self.ids=[Buildings.objects.create(sifko=i).id for i in range(5)]
+        self.factory=RequestFactory()
+
+    def page(self, params: dict):
+        request=self.factory.get('/buildings/buildings_view/selectall/', params)
+        rows, next_url=keyset_page(Buildings.objects.all(), request)
+        return [row.id for row in rows], next_url
+
+    def test_pages(self):
+        ids, next_url=self.page({'page_size': 2})
+        self.assertEqual(ids, self.ids[:2])
+        self.assertIn(f'after={self.ids[1]}', next_url)
+        ids, next_url=self.page({'page_size': 2, 'after': self.ids[1]})
+        self.assertEqual(ids, self.ids[2:4])
+        ids, next_url=self.page({'page_size': 2, 'after': self.ids[3]})
+        self.assertEqual(ids, self.ids[4:])
+        self.assertIsNone(next_url)
+
+    def test_full_last_page_has_not_next(self):
+        ids, next_url=self.page({'page_size': 5})
+        self.assertEqual(ids, self.ids)
+        self.assertIsNone(next_url)
+        ids, next_url=self.page({'page_size': 4})
+        self.assertEqual(ids, self.ids[:4])
+        self.assertIsNotNone(next_url)
+
+    def test_after_the_last_id(self):
+        self.assertEqual(self.page({'after': self.ids[-1]}), ([], None))
+
+    def test_page_size_limits(self):
+        ids, next_url=self.page({'page_size': 0})
+        self.assertEqual(ids, self.ids[:1])
+
+    def test_wrong_parameters(self):
+        with self.assertRaises(ValueError):
+            self.page({'after': 'abc'})
+        with self.assertRaises(ValueError):
+            self.page({'page_size': 'abc'})
+
+    def test_cursor_pagination_of_the_viewset(self):
+        client=APIClient()
+        url='/buildings/buildings/?page_size=2&geom_format=wkt'
+        ids=[]
+        while url is not None:
+            response=client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            ids+=[row['id'] for row in response.data['results']]
+            url=response.data['next']
+        self.assertEqual(ids, self.ids)
+
+class ChangeFeedTest(PostGISTestCase):
+    """
+    get_changes(): the changes after the token, grouped by feature, and only the ones
+    of the transactions older than the xmin of the snapshot
+    """
+    LAYER = 'buildings_buildings'
+
+    def log(self, xid: int, feature_id: int, operation: str)->LayerChange:
+        return LayerChange.objects.create(layer_name=self.LAYER, feature_id=feature_id, operation=operation, xid=xid)
+
+    def setUp(self):
+        super().setUp()
+        #xids 3, 4 and 5 are of transactions finished long ago: smaller than any xmin
+        self.log(3, 1, LayerChange.INSERT)
+        self.log(3, 2, LayerChange.INSERT)
+        self.log(4, 1, LayerChange.UPDATE)
+        self.log(4, 3, LayerChange.UPDATE)
+        self.log(5, 2, LayerChange.DELETE)
+        self.log(5, 4, LayerChange.DELETE)
+        #a transaction that is still running
+        self.log(2**62, 5, LayerChange.INSERT)
+
+    def test_changes_grouped_by_feature(self):
+        changes=get_changes(self.LAYER, '0.0', 100)
+        self.assertEqual(changes['inserted'], [1])
+        self.assertEqual(changes['updated'], [3])
+        #2 was inserted and deleted in the same changes
+        self.assertEqual(changes['deleted'], [4])
+        self.assertFalse(changes['has_more'])
+
+    def test_transactions_not_finished_are_not_returned(self):
+        changes=get_changes(self.LAYER, '0.0', 100)
+        self.assertNotIn(5, changes['inserted'])
+        #the changes of the current transaction are not returned until it finishes
+        record_changes(self.LAYER, [7], LayerChange.INSERT)
+        changes=get_changes(self.LAYER, '0.0', 100)
+        self.assertNotIn(7, changes['inserted'])
+        xid, id=parse_token(changes['next'])
+        self.assertLessEqual(xid, snapshot_xmin())
+        self.assertEqual(get_changes(self.LAYER, changes['next'], 100)['inserted'], [])
+
+    def test_pages_with_the_token(self):
+        changes=get_changes(self.LAYER, '0.0', 2)
+        self.assertTrue(changes['has_more'])
+        self.assertEqual(changes['inserted'], [1, 2])
+        last=LayerChange.objects.filter(layer_name=self.LAYER, xid=3).order_by('id').last()
+        self.assertEqual(changes['next'], f'3.{last.id}')
+        changes=get_changes(self.LAYER, changes['next'], 2)
+        self.assertTrue(changes['has_more'])
+        self.assertEqual(changes['updated'], [1, 3])
+        changes=get_changes(self.LAYER, changes['next'], 2)
+        self.assertFalse(changes['has_more'])
+        self.assertEqual(changes['deleted'], [2, 4])
+        self.assertEqual(get_changes(self.LAYER, changes['next'], 2)['deleted'], [])
+
+    def test_token(self):
+        self.assertEqual(parse_token(None), (0, 0))
+        self.assertEqual(parse_token('12.34'), (12, 34))
+        for token in ('abc', '1.2.3', '-1.0', '1'):
+            with self.subTest(token=token):
+                with self.assertRaises(ValueError):
+                    parse_token(token)
+        xid, id=parse_token(current_token())
+        self.assertEqual(id, 0)
+        self.assertEqual(get_changes(self.LAYER, current_token(), 100)['deleted'], [])
+
+    def test_wrong_token_in_the_view(self):
+        response=self.client.get(f'/changes/{self.LAYER}/', {'since': 'abc'})
+        self.assertEqual(response.status_code, 400)
@@ -5,6 +5,14 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
+
+It serves the async views (core/myLib/asyncBaseDjangoView.py) without
+blocking a worker while they wait for the database, with uvicorn workers
+of gunicorn (djangoapi/gunicorn.conf.py):
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn djangoapi.asgi:application
+
+The sync code of every request runs in its own thread, so the persistent
+connections can not be reused: use DB_CONN_MAX_AGE=0, or the pool (DB_POOL=True).
 """
 
 import os
@@ -12,11 +12,78 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 EPSG_FOR_GEOMETRIES=int(os.getenv('EPSG_FOR_GEOMETRIES',4326))
 ST_SNAP_PRECISION=float(os.getenv('ST_SNAP_PRECISION',0.001))
 MAX_NUMBER_OF_RETRIEVED_ROWS=int(os.getenv('MAX_NUMBER_OF_RETRIEVED_ROWS',1000))
+#Engine used by WkbConversor to parse, snap and convert the geometries:
+#   'postgis' -> the conversions are done in the database
+#   'geos' -> the conversions are done in process, with GEOS, without any query
+GEOMETRY_ENGINE=os.getenv('GEOMETRY_ENGINE','postgis')
+#Number of conflicting ids searched by the relate checks. The checks stop
+#as soon as they are found. The full list is only searched when the request
+#asks for it with the parameter detailed_errors=true
+RELATE_CHECK_LIMIT=int(os.getenv('RELATE_CHECK_LIMIT',1))
+#Streaming responses (?stream=true): rows read from the server side cursor in
+#every round trip, and maximum number of rows streamed (0 = no limit)
+STREAMING_CHUNK_SIZE=int(os.getenv('STREAMING_CHUNK_SIZE',2000))
+MAX_NUMBER_OF_STREAMED_ROWS=int(os.getenv('MAX_NUMBER_OF_STREAMED_ROWS',0))
+#Keyset pagination on the id of the viewsets and the selectall actions.
+#The clients can change the page size with ?page_size=, up to MAX_PAGE_SIZE
+PAGE_SIZE=int(os.getenv('PAGE_SIZE',100))
+MAX_PAGE_SIZE=int(os.getenv('MAX_PAGE_SIZE',MAX_NUMBER_OF_RETRIEVED_ROWS))
+#Vector tiles (/tiles/<layer>/<z>/<x>/<y>.mvt): maximum number of tiles in the
+#cache of every process, seconds a tile can be in it (0 = until the features
+#change), and max-age of the Cache-Control header sent to the clients
+TILE_CACHE_MAX_TILES=int(os.getenv('TILE_CACHE_MAX_TILES',10000))
+TILE_CACHE_TTL=int(os.getenv('TILE_CACHE_TTL',3600))
+TILE_HTTP_MAX_AGE=int(os.getenv('TILE_HTTP_MAX_AGE',60))
+#seconds between the reads of the tiles invalidated by the other processes (0 = in every request)
+TILE_INVALIDATION_INTERVAL=float(os.getenv('TILE_INVALIDATION_INTERVAL',1))
+#Export jobs (/export/jobs/): directory of the files, number of exports that
+#run at the same time in every process, and seconds the files are kept
+EXPORT_DIR=os.getenv('EXPORT_DIR',os.path.join(tempfile.gettempdir(),'djangoapi_exports'))
+EXPORT_WORKERS=int(os.getenv('EXPORT_WORKERS',2))
+EXPORT_RESULT_TTL=int(os.getenv('EXPORT_RESULT_TTL',86400))
+#Layers written at the same time in the exports with one file per layer (shp, csv, ...)
+EXPORT_LAYER_WORKERS=int(os.getenv('EXPORT_LAYER_WORKERS',4))
+#Imports (/import/<layer>/): maximum number of rejected rows in the report
+IMPORT_MAX_REPORTED_ERRORS=int(os.getenv('IMPORT_MAX_REPORTED_ERRORS',1000))
+#QA scans (/qa/runs/): the extent of every layer is divided in QA_TILES x QA_TILES tiles,
+#and QA_WORKERS tiles are checked at the same time, each one with its own connection
+QA_TILES=int(os.getenv('QA_TILES',4))
+QA_WORKERS=int(os.getenv('QA_WORKERS',4))
+#Database connections. Every worker thread keeps its connection open DB_CONN_MAX_AGE
+#seconds and reuses it in the next requests (0 = a new connection for every request).
+#With DB_CONN_HEALTH_CHECKS the connection
+#is checked before it is reused, so a restart of PostgreSQL does not break the first request.
+DB_CONN_MAX_AGE=int(os.getenv('DB_CONN_MAX_AGE',600))
+DB_CONN_HEALTH_CHECKS=os.getenv('DB_CONN_HEALTH_CHECKS','True').lower() in ('true', '1', 't')
+#Pool of connections shared by all the threads of the process (Django 5.1 or newer).
+#It needs psycopg 3 with the pool: pip install "psycopg[binary,pool]". DB_CONN_MAX_AGE
+#is not used with the pool. The connections wait DB_POOL_TIMEOUT seconds for a free one
+DB_POOL=os.getenv('DB_POOL','False').lower() in ('true', '1', 't')
+DB_POOL_MIN_SIZE=int(os.getenv('DB_POOL_MIN_SIZE',2))
+DB_POOL_MAX_SIZE=int(os.getenv('DB_POOL_MAX_SIZE',10))
+DB_POOL_TIMEOUT=float(os.getenv('DB_POOL_TIMEOUT',10))
+#Compression of the responses with gzip (core/myLib/middleware.py)
+GZIP_RESPONSES=os.getenv('GZIP_RESPONSES','True').lower() in ('true', '1', 't')
+#Static files (admin, swagger), collected with 'python manage.py collectstatic' and
+#served compressed by whitenoise, as gunicorn does not serve them
+STATIC_ROOT=os.getenv('STATIC_ROOT',str(BASE_DIR / 'staticfiles'))
+#Cache of the responses of selectone, selectall, list and retrieve until the layer
+#changes (core/myLib/responseCache.py). RESPONSE_CACHE_BACKEND: locmem (memory of every
+#process), file (RESPONSE_CACHE_LOCATION is a directory) or redis (RESPONSE_CACHE_LOCATION
+#is redis://host:port/db, it needs pip install redis). The responses bigger than
+#RESPONSE_CACHE_MAX_ENTRY_SIZE bytes are not saved
+RESPONSE_CACHE_ENABLED=os.getenv('RESPONSE_CACHE_ENABLED','True').lower() in ('true', '1', 't')
+RESPONSE_CACHE_BACKEND=os.getenv('RESPONSE_CACHE_BACKEND','locmem')
+RESPONSE_CACHE_LOCATION=os.getenv('RESPONSE_CACHE_LOCATION','')
+RESPONSE_CACHE_TTL=int(os.getenv('RESPONSE_CACHE_TTL',600))
+RESPONSE_CACHE_MAX_ENTRIES=int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES',1000))
+RESPONSE_CACHE_MAX_ENTRY_SIZE=int(os.getenv('RESPONSE_CACHE_MAX_ENTRY_SIZE',5 * 1024 * 1024))
 # BASE_URL = os.getenv('BASE_URL', 'http://localhost:8000')
 
 # Quick-start development settings - unsuitable for production
@@ -57,11 +124,15 @@ INSTALLED_APPS = [
     'addresses',
     'roads',
     'export',
+    'importer',
+    'qa',
+    'tiles',
     ]
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     # 'django.middleware.csrf.CsrfViewMiddleware',
@@ -69,6 +140,9 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+if GZIP_RESPONSES:
+    #before the middlewares that read or change the content of the response
+    MIDDLEWARE.insert(1, 'core.myLib.middleware.CompressionMiddleware')
 #potrebno za CORS
 if DEBUG:
     # CORS_ALLOW_ALL_ORIGINS=True
@@ -123,11 +197,44 @@ DATABASES = {
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('POSTGRES_HOST', '192.168.0.39'),
         'PORT': os.getenv('POSTGRES_PORT', '5440'),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
         'OPTIONS': {
             'options': '-c search_path=public',
         }
     }
 }
+if DB_POOL:
+    #the pool returns the connections at the end of every request, it can not
+    #be used with persistent connections
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': DB_POOL_MIN_SIZE,
+        'max_size': DB_POOL_MAX_SIZE,
+        'timeout': DB_POOL_TIMEOUT,
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+RESPONSE_CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': RESPONSE_CACHE_BACKENDS[RESPONSE_CACHE_BACKEND],
+        'LOCATION': RESPONSE_CACHE_LOCATION or (os.path.join(tempfile.gettempdir(), 'djangoapi_responses')
+                                                if RESPONSE_CACHE_BACKEND == 'file' else 'responses'),
+        'TIMEOUT': RESPONSE_CACHE_TTL,
+        'OPTIONS': {'MAX_ENTRIES': RESPONSE_CACHE_MAX_ENTRIES} if RESPONSE_CACHE_BACKEND != 'redis' else {},
+    },
+}
 
 
 # Password validation
@@ -166,6 +273,16 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        #the files are also saved compressed (.gz), when they are collected
+        'BACKEND': 'whitenoise.storage.CompressedStaticFilesStorage',
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -24,6 +24,7 @@ from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
 from core.views import custom_logout_view
+from export.views import layer_changes
 
 schema_view = get_schema_view(
    openapi.Info(
@@ -55,5 +56,9 @@ urlpatterns = [
     path('parcels/', include('parcels.urls')),
     path('roads/', include('roads.urls')),
     path('addresses/', include('addresses.urls')),
-    path("export/", include("export.urls"))
+    path("export/", include("export.urls")),
+    path("import/", include("importer.urls")),
+    path("qa/", include("qa.urls")),
+    path("tiles/", include("tiles.urls")),
+    path("changes/<str:layer>/", layer_changes, name="layer_changes"),   # http://localhost:8000/changes/buildings_buildings/?since=<token>
 ]
@@ -0,0 +1,300 @@
+"""
+Export of the layers to a GeoPackage, GeoJSON Text Sequences, FlatGeobuf,
+Shapefile or CSV with the geometry in WKT, in the same process (EXPORT_FORMATS).
+In the GeoPackage all the layers go to the same file. In the rest of the formats
+every layer goes to its own file(s), written by EXPORT_LAYER_WORKERS threads at
+the same time, and they are zipped.
+
+The features are read from the database by Django, as tuples with the wkb
+made by PostGIS, and written with the OGR drivers of the GDAL python bindings.
+In the GeoPackage every layer is written in one transaction. There is not
+any subprocess, and the password of the database is not in any command line.
+
+The export can be filtered:
+    - bbox=minx,miny,maxx,maxy: features whose bounding box intersects it,
+        in EPSG_FOR_GEOMETRIES. Uses the GiST index.
+    - sifko=<code of the cadastral municipality>: the layers with the field sifko
+        are filtered by it, the rest by intersection with the parcels of
+        the municipality.
+    - layers=parcels_parcels,buildings_buildings: only some layers.
+    - since=<token>: only the features inserted or updated after the token of the
+        change feed (core/myLib/changes.py). The deleted ones are in the feed.
+
+Example:
+    filters=get_export_filters(request.GET)
+    path=export_layers(filters)                 #podatki.gpkg
+    path=export_layers(filters, export_format='shp')   #zip with the shapefiles
+    ...
+    os.remove(path)
+"""
+import functools
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+from django.db.models import Exists, OuterRef
+from django.contrib.gis.db.models.functions import AsWKB
+from django.contrib.gis.gdal import OGRGeomType
+from django.contrib.gis.geos import Polygon
+
+from core.myLib.layers import LAYERS, get_layer_model
+from core.myLib.changes import parse_token, changed_ids_since
+from core.myLib.binaryOutput import get_attribute_fields
+from core.myLib.ogrWriter import create_ogr_layer, write_ogr_features
+from core.myLib.streaming import iter_zip
+from djangoapi.settings import EPSG_FOR_GEOMETRIES, STREAMING_CHUNK_SIZE, EXPORT_LAYER_WORKERS
+
+#in this order in the GeoPackage
+EXPORT_LAYERS = ("parcels_parcels", "buildings_buildings", "roads_roads", "addresses_addresses")
+#layer with the field sifko, used to filter the layers that do not have it
+MUNICIPALITY_LAYER = "parcels_parcels"
+#OGR driver of every format, extension of the files, content type of the download,
+#options of the layers, and if all the layers are in only one file. If not, every
+#layer is written in its own file, in parallel, and they are zipped.
+EXPORT_FORMATS = {
+    'gpkg': {'driver': 'GPKG', 'extension': '.gpkg', 'content_type': 'application/geopackage+sqlite3',
+             'single_file': True, 'transactions': True, 'options': []},
+    'geojsonseq': {'driver': 'GeoJSONSeq', 'extension': '.geojsons', 'content_type': 'application/zip',
+                   'single_file': False, 'transactions': False, 'options': []},
+    'fgb': {'driver': 'FlatGeobuf', 'extension': '.fgb', 'content_type': 'application/zip',
+            'single_file': False, 'transactions': False, 'options': []},
+    'shp': {'driver': 'ESRI Shapefile', 'extension': '.shp', 'content_type': 'application/zip',
+            'single_file': False, 'transactions': False, 'options': ['ENCODING=UTF-8']},
+    'csv': {'driver': 'CSV', 'extension': '.csv', 'content_type': 'application/zip',
+            'single_file': False, 'transactions': False, 'options': ['GEOMETRY=AS_WKT']},
+}
+
+def get_export_format(query_dict)->str:
+    """
+    The parameter format, gpkg by default. Raises ValueError if it does not exist
+    """
+    export_format=query_dict.get('format', None)
+    if export_format in (None, ''):
+        return 'gpkg'
+    export_format=export_format.strip().lower()
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"The format {export_format} does not exist. Formats: {list(EXPORT_FORMATS)}")
+    return export_format
+
+def get_file_extension(export_format: str)->str:
+    """
+    Extension of the file of the export: the formats with one file per layer are zipped
+    """
+    fmt=EXPORT_FORMATS[export_format]
+    return fmt['extension'] if fmt['single_file'] else '.zip'
+
+def get_export_filters(query_dict)->dict:
+    """
+    Returns {'layers': (...), 'bbox': (minx, miny, maxx, maxy) or None, 'sifko': int or None,
+             'since': token or None}
+    Raises ValueError if the parameters are not correct
+    """
+    layers=query_dict.get('layers', None)
+    if layers in (None, ''):
+        layers=EXPORT_LAYERS
+    else:
+        layers=tuple(l.strip() for l in layers.split(','))
+        for layer in layers:
+            if layer not in LAYERS:
+                raise ValueError(f"The layer {layer} does not exist. Layers: {EXPORT_LAYERS}")
+
+    bbox=query_dict.get('bbox', None)
+    if bbox in (None, ''):
+        bbox=None
+    else:
+        try:
+            bbox=tuple(float(v) for v in bbox.split(','))
+        except ValueError:
+            raise ValueError("bbox must be minx,miny,maxx,maxy")
+        if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+            raise ValueError("bbox must be minx,miny,maxx,maxy")
+
+    sifko=query_dict.get('sifko', None)
+    if sifko in (None, ''):
+        sifko=None
+    else:
+        try:
+            sifko=int(sifko)
+        except ValueError:
+            raise ValueError("sifko must be an integer")
+
+    since=query_dict.get('since', None)
+    if since in (None, ''):
+        since=None
+    else:
+        parse_token(since)
+    return {'layers': layers, 'bbox': bbox, 'sifko': sifko, 'since': since}
+
+def has_field(model, field_name: str)->bool:
+    return any(f.name == field_name for f in model._meta.concrete_fields)
+
+def get_source_layers(layers: list, sifko: int=None)->list:
+    """
+    The layers whose data is in the export: the exported layers, and
+    MUNICIPALITY_LAYER if sifko filters a layer that does not have the field
+    """
+    sources=list(layers)
+    if sifko is not None and MUNICIPALITY_LAYER not in sources and \
+            any(not has_field(get_layer_model(layer_name), 'sifko') for layer_name in layers):
+        sources.append(MUNICIPALITY_LAYER)
+    return sources
+
+def filter_layer(queryset, bbox: tuple=None, sifko: int=None, since: str=None):
+    """
+    Applies the bbox, sifko and since filters to the queryset of a layer
+    """
+    if bbox is not None:
+        polygon=Polygon.from_bbox(bbox)
+        polygon.srid=int(EPSG_FOR_GEOMETRIES)
+        queryset=queryset.filter(geom__bboverlaps=polygon)
+    if sifko is not None:
+        if has_field(queryset.model, 'sifko'):
+            queryset=queryset.filter(sifko=sifko)
+        else:
+            parcels=get_layer_model(MUNICIPALITY_LAYER).objects.filter(sifko=sifko, geom__intersects=OuterRef('geom'))
+            queryset=queryset.filter(Exists(parcels))
+    if since is not None:
+        queryset=queryset.filter(id__in=changed_ids_since(queryset.model._meta.db_table, since))
+    return queryset
+
+def get_layer_queryset(layer_name: str, bbox: tuple=None, sifko: int=None, since: str=None):
+    model=get_layer_model(layer_name)
+    return filter_layer(model.objects.all(), bbox, sifko, since).order_by('id')
+
+def write_layer(ds, layer_name: str, bbox: tuple=None, sifko: int=None, progress=None, fmt: dict=None,
+                since: str=None)->int:
+    """
+    Writes the features of the layer in the datasource.
+    progress: function called with the number of features written.
+    fmt: the format, of EXPORT_FORMATS. GeoPackage by default.
+    Returns the number of features
+    """
+    fmt=fmt or EXPORT_FORMATS['gpkg']
+    queryset=get_layer_queryset(layer_name, bbox, sifko, since)
+    model=queryset.model
+    geom_field=model._meta.get_field('geom')
+    fields=get_attribute_fields(model)
+    rows=queryset.annotate(geom_wkb=AsWKB('geom')).values_list(*[f.attname for f in fields], 'geom_wkb')
+    layer=create_ogr_layer(ds, layer_name, fields, geom_field.srid, OGRGeomType(geom_field.geom_type).num, fmt['options'])
+    return write_ogr_features(layer, rows.iterator(chunk_size=STREAMING_CHUNK_SIZE), use_transaction=fmt['transactions'],
+                              progress=progress, progress_every=STREAMING_CHUNK_SIZE)
+
+class ProgressCounter:
+    """
+    Translates the number of features written in every layer to the
+    fraction of the whole export. The features are counted before.
+    The layers can be written at the same time, by several threads.
+    """
+    def __init__(self, filters: dict, progress):
+        self.progress=progress
+        self.total=sum(get_layer_queryset(layer_name, filters['bbox'], filters['sifko'], filters.get('since')).count()
+                       for layer_name in filters['layers'])
+        self.written={}
+        self.lock=threading.Lock()
+
+    def layer_progress(self, layer_name: str, n: int):
+        with self.lock:
+            self.written[layer_name]=n
+            if self.total > 0:
+                self.progress(min(1, sum(self.written.values()) / self.total))
+
+    def callback(self, layer_name: str):
+        return functools.partial(self.layer_progress, layer_name)
+
+def export_layers(filters: dict, directory: str=None, progress=None, export_format: str='gpkg')->str:
+    """
+    Writes the layers in a new file of the format (EXPORT_FORMATS), in the
+    temporary directory, or in directory. Returns its path. The caller must
+    remove it. If there is any error the file is removed.
+    The formats with one file per layer are written in parallel and zipped.
+    progress: function called with the fraction (0 to 1) of the features written.
+    """
+    fmt=EXPORT_FORMATS[export_format]
+    if not fmt['single_file']:
+        return export_layers_zip(filters, directory, progress, export_format)
+
+    from osgeo import gdal, ogr
+    gdal.UseExceptions()
+    fd, path=tempfile.mkstemp(suffix=fmt['extension'], dir=directory)
+    os.close(fd)
+    os.remove(path) #the driver creates the file
+    ds=None
+    try:
+        ds=ogr.GetDriverByName(fmt['driver']).CreateDataSource(path)
+        counter=ProgressCounter(filters, progress) if progress is not None else None
+        for layer_name in filters['layers']:
+            n=write_layer(ds, layer_name, filters['bbox'], filters['sifko'],
+                          progress=counter.callback(layer_name) if counter else None, fmt=fmt,
+                          since=filters.get('since'))
+            if counter:
+                counter.layer_progress(layer_name, n)
+        ds=None #closes the file
+    except Exception:
+        ds=None
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return path
+
+def write_layer_file(directory: str, layer_name: str, filters: dict, fmt: dict, counter: ProgressCounter=None)->int:
+    """
+    Writes the layer in its own file, <directory>/<layer_name><extension>.
+    Runs in a thread of the pool, with its own connection to the database
+    """
+    from osgeo import gdal, ogr
+    gdal.UseExceptions()
+    ds=None
+    try:
+        ds=ogr.GetDriverByName(fmt['driver']).CreateDataSource(os.path.join(directory, layer_name + fmt['extension']))
+        n=write_layer(ds, layer_name, filters['bbox'], filters['sifko'],
+                      progress=counter.callback(layer_name) if counter else None, fmt=fmt,
+                      since=filters.get('since'))
+        ds=None #closes the file
+        if counter:
+            counter.layer_progress(layer_name, n)
+        return n
+    finally:
+        ds=None
+        connection.close()
+
+def write_layer_files(filters: dict, export_format: str, progress=None, directory: str=None):
+    """
+    Writes every layer in its own file, all of them at the same time,
+    in a new temporary directory. Returns (directory, [(name in the zip, path), ...]).
+    The caller must remove the directory. If there is any error it is removed.
+    """
+    fmt=EXPORT_FORMATS[export_format]
+    layer_directory=tempfile.mkdtemp(prefix='export_', dir=directory)
+    try:
+        counter=ProgressCounter(filters, progress) if progress is not None else None
+        workers=max(1, min(EXPORT_LAYER_WORKERS, len(filters['layers'])))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='export_layer') as executor:
+            futures=[executor.submit(write_layer_file, layer_directory, layer_name, filters, fmt, counter)
+                     for layer_name in filters['layers']]
+            for future in futures:
+                future.result()
+    except Exception:
+        shutil.rmtree(layer_directory, ignore_errors=True)
+        raise
+    files=[(name, os.path.join(layer_directory, name)) for name in sorted(os.listdir(layer_directory))]
+    return layer_directory, files
+
+def export_layers_zip(filters: dict, directory: str=None, progress=None, export_format: str='shp')->str:
+    """
+    Writes the layers in parallel, and zips them in a new file. Returns its path.
+    """
+    layer_directory, files=write_layer_files(filters, export_format, progress, directory)
+    fd, path=tempfile.mkstemp(suffix='.zip', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in iter_zip(files):
+                f.write(chunk)
+    except Exception:
+        os.remove(path)
+        raise
+    finally:
+        shutil.rmtree(layer_directory, ignore_errors=True)
+    return path
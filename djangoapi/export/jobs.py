@@ -0,0 +1,119 @@
+"""
+Export jobs, run in the background on a pool of threads of the process,
+so the web workers do not wait for GDAL.
+
+    job, cached=submit_export(filters, 'gpkg')
+    job.status -> pending, running, done or error
+    job.progress -> 0 to 100
+    job.file_path -> when it is done
+
+The job is identified by its cache_key: format, filters and version of every
+layer (core.models.LayerVersion). If there is already a job with the same key
+whose file exists, it is returned and nothing is exported: the layers have not
+changed since it was made. If it is still running in this process, it is also
+returned, so the same export is not made twice at the same time.
+
+The files are kept EXPORT_RESULT_TTL seconds in EXPORT_DIR. The old jobs and
+their files are removed when a new export is submitted.
+"""
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from core.myLib.layers import get_layer_versions
+from core.myLib.changes import current_token
+from djangoapi.settings import EXPORT_DIR, EXPORT_WORKERS, EXPORT_RESULT_TTL
+from .exportEngine import export_layers, get_source_layers
+from .models import ExportJob
+
+executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix='export')
+#ids of the jobs queued or running in this process
+active_jobs = set()
+lock = threading.Lock()
+
+def get_cache_key(export_format: str, filters: dict, layer_versions: dict)->str:
+    content=json.dumps({'format': export_format, 'filters': filters, 'versions': layer_versions}, sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+def submit_export(filters: dict, export_format: str='gpkg'):
+    """
+    Returns (job, cached). cached is True if the file of the job was
+    already made, for the same data.
+    """
+    remove_expired_jobs()
+    filters={'layers': list(filters['layers']),
+             'bbox': list(filters['bbox']) if filters['bbox'] is not None else None,
+             'sifko': filters['sifko'],
+             'since': filters.get('since')}
+    #with sifko, the layers without the field are filtered with the parcels, so their version is also in the key
+    layer_versions=get_layer_versions(get_source_layers(filters['layers'], filters['sifko']))
+    cache_key=get_cache_key(export_format, filters, layer_versions)
+    with lock:
+        for job in ExportJob.objects.filter(cache_key=cache_key).exclude(status=ExportJob.ERROR).order_by('-id'):
+            if job.status == ExportJob.DONE and os.path.exists(job.file_path):
+                return job, True
+            if job.id in active_jobs:
+                return job, False
+        job=ExportJob.objects.create(export_format=export_format, filters=filters,
+                                     layer_versions=layer_versions, cache_key=cache_key)
+        active_jobs.add(job.id)
+    executor.submit(run_export_job, job.id)
+    return job, False
+
+def run_export_job(job_id: int):
+    """
+    Runs in a thread of the pool, with its own connection to the database
+    """
+    close_old_connections()
+    jobs=ExportJob.objects.filter(pk=job_id)
+    try:
+        job=jobs.get()
+        jobs.update(status=ExportJob.RUNNING, change_token=current_token())
+
+        def progress(fraction: float):
+            jobs.update(progress=round(fraction * 100, 1))
+
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        path=export_layers(job.filters, EXPORT_DIR, progress, job.export_format)
+        jobs.update(status=ExportJob.DONE, progress=100, file_path=path, file_size=os.path.getsize(path),
+                    message='Export finished', finished_at=timezone.now())
+    except Exception as e:
+        print(f'Export job {job_id} failed: {e}')
+        jobs.update(status=ExportJob.ERROR, message=str(e), finished_at=timezone.now())
+    finally:
+        with lock:
+            active_jobs.discard(job_id)
+        connection.close()
+
+def remove_expired_jobs():
+    """
+    Removes the jobs finished more than EXPORT_RESULT_TTL seconds ago, and their files
+    """
+    limit=timezone.now() - timedelta(seconds=EXPORT_RESULT_TTL)
+    expired=ExportJob.objects.filter(finished_at__lt=limit)
+    for file_path in expired.exclude(file_path='').values_list('file_path', flat=True):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    expired.delete()
+
+def job_to_dict(job: ExportJob, cached: bool=False)->dict:
+    return {
+        'id': job.id,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'format': job.export_format,
+        'filters': job.filters,
+        'layer_versions': job.layer_versions,
+        'file_size': job.file_size,
+        'change_token': job.change_token,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'cached': cached,
+    }
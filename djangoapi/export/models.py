@@ -1,3 +1,32 @@
 from django.db import models
 
 # Create your models here.
+
+class ExportJob(models.Model):
+    """
+    Export of layers made in the background by export/jobs.py.
+    cache_key identifies the export (format, filters and versions of the layers),
+    so an identical request with the same data returns the file already made.
+    change_token is the token of the change feed of the data of the file.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    ERROR = 'error'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (ERROR, 'Error')]
+
+    export_format = models.CharField(max_length=20, default='gpkg')
+    filters = models.JSONField(default=dict)
+    layer_versions = models.JSONField(default=dict)
+    cache_key = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    progress = models.FloatField(default=0)
+    message = models.TextField(blank=True, default='')
+    file_path = models.CharField(max_length=500, blank=True, default='')
+    file_size = models.BigIntegerField(null=True, blank=True)
+    change_token = models.CharField(max_length=50, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Export {self.id} {self.export_format} {self.status}"
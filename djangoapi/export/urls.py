@@ -3,4 +3,8 @@ from . import views
 
 urlpatterns = [
     path("gpkg/", views.export_geopackage, name="export_geopackage"),    # servis bo na voljo na naslovu: http://localhost:8000/export/gpkg/
+    path("file/", views.export_file, name="export_file"),                                   # GET - ?format=gpkg|geojsonseq|fgb|shp|csv
+    path("jobs/", views.export_jobs, name="export_jobs"),                                   # POST - naroči izvoz v ozadju
+    path("jobs/<int:id>/", views.export_job_status, name="export_job_status"),              # GET - stanje izvoza
+    path("jobs/<int:id>/download/", views.export_job_download, name="export_job_download"), # GET - prenos datoteke
 ]
\ No newline at end of file
@@ -1,54 +1,161 @@
-
-import subprocess
 import os
-import tempfile
-from django.http import FileResponse
-from django.conf import settings
+import shutil
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 
+from core.myLib.streaming import iter_zip
+from core.myLib.changes import get_changes, current_token
+from core.myLib.layers import LAYERS, get_layer_model
+from core.myLib.binaryOutput import get_attribute_fields
+from core.myLib.geoOutput import annotate_geom_formats
+from djangoapi.settings import MAX_NUMBER_OF_RETRIEVED_ROWS
+from .exportEngine import (EXPORT_FORMATS, get_export_filters, get_export_format, get_file_extension,
+                           export_layers, write_layer_files)
+from .jobs import submit_export, job_to_dict
+from .models import ExportJob
+
 def export_geopackage(request):
     """
     Ustvari GeoPackage s štirimi sloji (parcele, stavbe, ceste, naslovi)
     in ga ponudi za prenos uporabniku.
+    Sloji se zapišejo v istem procesu z GDAL (export/exportEngine.py),
+    brez ogr2ogr in brez gesla baze v ukazni vrstici.
+
+    Filtri (neobvezni):
+        ?sifko=1234                     samo ena katastrska občina
+        ?bbox=minx,miny,maxx,maxy       samo območje
+        ?layers=parcels_parcels,roads_roads
+        ?since=<token>                  samo objekti, vstavljeni ali spremenjeni po žetonu
+                                        (izbrisane vrne /changes/<layer>/)
+    Glava X-Change-Token je žeton stanja podatkov izvoza.
     """
+    try:
+        filters = get_export_filters(request.GET)
+    except ValueError as e:
+        return JsonResponse({'ok': False, 'message': str(e), 'data': []}, status=400)
+    return export_response(filters, 'gpkg')
 
-    # Nastavimo povezavo na PostGIS bazo (vzeto iz settings.py)
-    db_conn = (
-        f"PG:dbname={settings.DATABASES['default']['NAME']} "
-        f"user={settings.DATABASES['default']['USER']} "
-        f"password={settings.DATABASES['default']['PASSWORD']} "
-        f"host={settings.DATABASES['default']['HOST']} "
-        f"port={settings.DATABASES['default']['PORT']}"
-    )
+def export_file(request):
+    """
+    Izvoz slojev v izbranem formatu:
+        ?format=gpkg            GeoPackage (privzeto)
+        ?format=geojsonseq      GeoJSON Text Sequences
+        ?format=fgb             FlatGeobuf
+        ?format=shp             Shapefile
+        ?format=csv             CSV z geometrijo v WKT
+    Razen GeoPackage se vsak sloj zapiše v svojo datoteko, vsi hkrati, in se
+    stisnejo v zip, ki se pošilja sproti, medtem ko nastaja.
+    Filtri so enaki kot pri export_geopackage.
+        GET /export/file/?format=shp&sifko=1234
+    """
+    try:
+        filters = get_export_filters(request.GET)
+        export_format = get_export_format(request.GET)
+    except ValueError as e:
+        return JsonResponse({'ok': False, 'message': str(e), 'data': []}, status=400)
+    return export_response(filters, export_format)
 
-    # Imena slojev, kot jih imaš v PostGIS (tabela = ime sloja)
-    layers = ["parcels_parcels", "buildings_buildings", "roads_roads", "addresses_addresses"]
+def export_response(filters, export_format):
+    fmt = EXPORT_FORMATS[export_format]
+    # žeton pred branjem podatkov: spremembe po njem vrne /changes/<layer>/?since=
+    change_token = current_token()
+    name = "podatki" if filters['sifko'] is None else f"podatki_{filters['sifko']}"
+    filename = name + get_file_extension(export_format)
 
-    # Ustvari začasno datoteko
-    tmp = tempfile.NamedTemporaryFile(suffix=".gpkg", delete=False)
-    output_path = tmp.name
+    if not fmt['single_file']:
+        directory, files = write_layer_files(filters, export_format)
 
-    # Če slučajno obstaja, zbrišemo
-    if os.path.exists(output_path):
-        os.remove(output_path)
+        def content():
+            try:
+                yield from iter_zip(files)
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
 
-    # Ustvarimo GeoPackage in vanj dodamo vse 4 sloje
-    for i, layer in enumerate(layers):
-        cmd = [
-            "ogr2ogr",
-            "-f", "GPKG",
-            output_path,
-            db_conn,
-            layer,
-        ]
-        if i > 0:
-            cmd += ["-update", "-append"]
+        response = StreamingHttpResponse(content(), content_type=fmt['content_type'])
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['X-Change-Token'] = change_token
+        return response
 
-        # Reprojeciramo v WGS84 (če želiš)
-        # cmd += ["-t_srs", "EPSG:4326"]
+    output_path = export_layers(filters, export_format=export_format)
+
+    # Datoteko odpremo in jo takoj zbrišemo: ostane na disku, dokler je odprta,
+    # in izgine, ko FileResponse pošlje zadnji kos in jo zapre.
+    f = open(output_path, "rb")
+    os.remove(output_path)
+    response = FileResponse(f, as_attachment=True, filename=filename, content_type=fmt['content_type'])
+    response['X-Change-Token'] = change_token
+    return response
+
+def export_jobs(request):
+    """
+    POST: naroči izvoz v ozadju in takoj vrne opravilo (status 202).
+    Če je enak izvoz z nespremenjenimi podatki že narejen, vrne tega (cached=true).
+        POST /export/jobs/?format=gpkg&sifko=1234
+    Parametri so enaki kot pri export_geopackage, poslani v telesu (form) ali v URL.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'ok': False, 'message': 'Only POST is allowed', 'data': []}, status=405)
+    params = request.POST if len(request.POST) > 0 else request.GET
+    try:
+        filters = get_export_filters(params)
+        export_format = get_export_format(params)
+    except ValueError as e:
+        return JsonResponse({'ok': False, 'message': str(e), 'data': []}, status=400)
 
-        subprocess.run(cmd, check=True)
+    job, cached = submit_export(filters, export_format)
+    message = 'The export is ready' if cached else 'The export has been submitted'
+    return JsonResponse({'ok': True, 'message': message, 'data': [job_to_dict(job, cached)]}, status=200 if cached else 202)
 
-    # Pošljemo datoteko uporabniku
-    return FileResponse(open(output_path, "rb"), as_attachment=True, filename="podatki.gpkg")
+def export_job_status(request, id):
+    """
+    GET: stanje in napredek (0-100) izvoza.
+        GET /export/jobs/<id>/
+    """
+    job = ExportJob.objects.filter(pk=id).first()
+    if job is None:
+        return JsonResponse({'ok': False, 'message': f'The export job {id} does not exist', 'data': []}, status=404)
+    return JsonResponse({'ok': True, 'message': 'Export job', 'data': [job_to_dict(job)]})
+
+def export_job_download(request, id):
+    """
+    GET: prenos datoteke končanega izvoza.
+        GET /export/jobs/<id>/download/
+    """
+    job = ExportJob.objects.filter(pk=id).first()
+    if job is None:
+        return JsonResponse({'ok': False, 'message': f'The export job {id} does not exist', 'data': []}, status=404)
+    if job.status != ExportJob.DONE or not os.path.exists(job.file_path):
+        return JsonResponse({'ok': False, 'message': f'The export job {id} is not finished: {job.status}', 'data': [job_to_dict(job)]}, status=409)
+    fmt = EXPORT_FORMATS[job.export_format]
+    filename = f"podatki_{job.id}{get_file_extension(job.export_format)}"
+    return FileResponse(open(job.file_path, "rb"), as_attachment=True, filename=filename, content_type=fmt['content_type'])
+
+def layer_changes(request, layer):
+    """
+    GET: spremembe sloja od žetona (token) naprej: vstavljeni, spremenjeni in
+    izbrisani objekti. Vstavljeni in spremenjeni so vrnjeni s trenutnimi atributi
+    in geometrijo (WKT), izbrisani samo z id. Naslednja zahteva uporabi žeton next,
+    dokler je has_more true.
+        GET /changes/buildings_buildings/?since=<token>&limit=1000
+    Brez since vrne vse spremembe od začetka dnevnika. Žeton trenutnega stanja
+    vrne tudi izvoz (glava X-Change-Token), tako da se sinhronizacija lahko začne
+    s celotnim izvozom in nadaljuje s spremembami.
+    """
+    if layer not in LAYERS:
+        return JsonResponse({'ok': False, 'message': f'The layer {layer} does not exist. Layers: {list(LAYERS)}', 'data': []}, status=404)
+    try:
+        limit = int(request.GET.get('limit', MAX_NUMBER_OF_RETRIEVED_ROWS))
+        if limit <= 0:
+            raise ValueError('limit must be a positive integer')
+        changes = get_changes(layer, request.GET.get('since', None), min(limit, MAX_NUMBER_OF_RETRIEVED_ROWS))
+    except ValueError as e:
+        return JsonResponse({'ok': False, 'message': str(e), 'data': []}, status=400)
 
+    model = get_layer_model(layer)
+    fields = [f.attname for f in get_attribute_fields(model)]
+    queryset = annotate_geom_formats(model.objects.filter(id__in=changes['inserted'] + changes['updated']), ('wkt',))
+    features = {row['id']: row for row in queryset.values(*fields, 'geom_wkt')}
+    changes['inserted'] = [features[id] for id in changes['inserted'] if id in features]
+    changes['updated'] = [features[id] for id in changes['updated'] if id in features]
+    message = f"{len(changes['inserted'])} inserted, {len(changes['updated'])} updated, {len(changes['deleted'])} deleted"
+    return JsonResponse({'ok': True, 'message': message, 'data': changes})
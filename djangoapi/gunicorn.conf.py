@@ -0,0 +1,46 @@
+"""
+Configuration of gunicorn for production (docker-compose.prod.yml). gunicorn
+reads it from the working directory:
+    gunicorn djangoapi.wsgi:application
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn djangoapi.asgi:application
+
+Every value can be changed with an environment variable (.env.prod):
+    - GUNICORN_WORKERS: processes. Default 2 x cpus + 1. Every process has its own
+        caches (tiles) and background jobs (exports, QA runs).
+    - GUNICORN_THREADS: threads of every process (gthread worker). A slow request, as
+        a ST_Relate check of a big geometry, only blocks its thread: the other
+        threads of the process go on. Every thread has its own database
+        connection (DB_CONN_MAX_AGE), so workers x threads must be less than the
+        max_connections of PostgreSQL.
+    - GUNICORN_WORKER_CLASS: gthread (WSGI) or uvicorn.workers.UvicornWorker (ASGI).
+    - GUNICORN_TIMEOUT: seconds a request can take before its worker is restarted.
+        The exports and imports of whole layers are long.
+    - GUNICORN_KEEPALIVE: seconds a connection of a client waits for the next request.
+    - GUNICORN_MAX_REQUESTS, GUNICORN_MAX_REQUESTS_JITTER: the workers are restarted
+        after that number of requests (plus a random number up to the jitter, so
+        they are not restarted at the same time), to free the memory of GDAL and
+        GEOS. 0 = never. A restart waits GUNICORN_GRACEFUL_TIMEOUT seconds for the
+        requests in progress.
+
+Use scripts/benchmarks/loadTest.py to choose the number of workers and threads.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 300))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 60))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 100))
+#the application is loaded in every worker, after the fork: GDAL and the
+#database connections are not shared between processes
+preload_app = False
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+#the proxy in front of gunicorn (nginx) sends the original scheme and address
+forwarded_allow_ips = os.getenv('GUNICORN_FORWARDED_ALLOW_IPS', '127.0.0.1')
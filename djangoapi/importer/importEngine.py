@@ -0,0 +1,255 @@
+"""
+Import of GeoPackage, GeoJSON, GeoJSONSeq and CSV (geometry in WKT) files
+into the layers, with set-based SQL instead of one query per feature.
+
+    1. The features are read with OGR (GDAL python bindings) and loaded with COPY
+       in a temporary staging table, with the fields of the layer that are in the file.
+    2. In the staging table, with one UPDATE for every check:
+        - the geometry is transformed to EPSG_FOR_GEOMETRIES and snapped to
+          ST_SNAP_PRECISION.
+        - the empty geometries, the ones of another type and the invalid ones are rejected.
+        - the ones with the relation matrix9IM with the features of the layer, or
+          with a previous feature of the file, are rejected.
+        - the ones that are not inside a feature of the container table are rejected.
+    3. The rest are inserted in the layer with one INSERT ... SELECT, with the area
+       or the length, and layer_changed is sent.
+All of it in one transaction. With dry_run nothing is inserted, only the checks
+are done.
+
+Example:
+    importer=LayerImporter('parcels_parcels')
+    report=importer.run('/tmp/parcels_1234.gpkg')
+    report -> {'total': 5230, 'inserted': 5228, 'rejected': 2, 'errors': [{'row': 17, 'error': '...'}, ...]}
+"""
+import csv
+import tempfile
+import uuid
+
+from django.db import connection, transaction, DataError
+
+from core.models import LayerChange
+from core.myLib.binaryOutput import get_attribute_fields
+from core.myLib.geometryTools import relate_requires_intersection
+from core.myLib.layers import get_layer_model, send_layer_changed
+from core.myLib.layerRules import LAYER_RULES
+from djangoapi.settings import EPSG_FOR_GEOMETRIES, ST_SNAP_PRECISION, IMPORT_MAX_REPORTED_ERRORS
+
+#bytes sent in every write of the COPY with psycopg 3
+COPY_BUFFER_SIZE = 1024 * 1024
+CSV_OPEN_OPTIONS = ['GEOM_POSSIBLE_NAMES=wkt,WKT,geom,geometry', 'KEEP_GEOM_COLUMNS=NO', 'AUTODETECT_TYPE=YES']
+
+class LayerImporter:
+    """
+    Imports a file in the layer. The rules are in core/myLib/layerRules.py.
+    Raises ValueError if the file or the parameters are not correct.
+    """
+    def __init__(self, layer_name: str):
+        if layer_name not in LAYER_RULES:
+            raise ValueError(f"The layer {layer_name} can not be imported. Layers: {list(LAYER_RULES)}")
+        self.layer_name=layer_name
+        self.rules=LAYER_RULES[layer_name]
+        self.model=get_layer_model(layer_name)
+        self.geom_field=self.model._meta.get_field('geom')
+        computed=(self.rules.area_field_name, self.rules.length_field_name)
+        #updated_at and row_version are not editable: they take the default of the database
+        self.fields=[f for f in get_attribute_fields(self.model)
+                     if f.attname != 'id' and f.attname not in computed and f.editable]
+        self.staging_table=f"import_staging_{uuid.uuid4().hex[:12]}"
+
+    def open_layer(self, path: str, source_layer: str=None):
+        """
+        Returns the OGR datasource and the layer of the file: source_layer, the layer
+        with the name of the table, or the first one
+        """
+        from osgeo import gdal
+        gdal.UseExceptions()
+        open_options=CSV_OPEN_OPTIONS if path.lower().endswith('.csv') else []
+        try:
+            ds=gdal.OpenEx(path, gdal.OF_VECTOR, open_options=open_options)
+        except RuntimeError as e:
+            raise ValueError(f"The file can not be read: {e}")
+        if source_layer is not None:
+            layer=ds.GetLayerByName(source_layer)
+            if layer is None:
+                raise ValueError(f"The file does not have the layer {source_layer}")
+        else:
+            layer=ds.GetLayerByName(self.layer_name)
+            if layer is None:
+                layer=ds.GetLayer(0)
+        return ds, layer
+
+    def get_source_srid(self, layer, srid: int=None)->int:
+        """
+        The srid of the file, the srid parameter or EPSG_FOR_GEOMETRIES
+        """
+        if srid is not None:
+            return srid
+        srs=layer.GetSpatialRef()
+        if srs is not None:
+            srs.AutoIdentifyEPSG()
+            code=srs.GetAuthorityCode(None)
+            if code is not None:
+                return int(code)
+        return int(EPSG_FOR_GEOMETRIES)
+
+    def write_csv(self, layer, f)->list:
+        """
+        Writes the features in f as the CSV of the COPY: row number, hex wkb and
+        the fields of the layer that are in the file. Returns those fields.
+        """
+        layer_defn=layer.GetLayerDefn()
+        source_fields={layer_defn.GetFieldDefn(i).GetName().lower(): i for i in range(layer_defn.GetFieldCount())}
+        fields=[(field, source_fields[field.attname.lower()]) for field in self.fields
+                if field.attname.lower() in source_fields]
+        writer=csv.writer(f)
+        layer.ResetReading()
+        for row_num, feature in enumerate(layer, start=1):
+            geom=feature.GetGeometryRef()
+            wkb='\\x' + bytes(geom.ExportToWkb()).hex() if geom is not None else None
+            writer.writerow([row_num, wkb] + [feature.GetField(i) if feature.IsFieldSetAndNotNull(i) else None
+                                              for field, i in fields])
+        return [field for field, i in fields]
+
+    def create_staging_table(self, cursor, fields: list):
+        qn=connection.ops.quote_name
+        columns=''.join(f', {qn(f.column)} {f.db_type(connection)}' for f in fields)
+        cursor.execute(f"""CREATE TEMP TABLE {self.staging_table} (
+                                row_num integer PRIMARY KEY, geom_in bytea{columns},
+                                geom geometry, error text
+                            ) ON COMMIT DROP""")
+
+    def copy_rows(self, cursor, f, fields: list):
+        qn=connection.ops.quote_name
+        columns=''.join(f', {qn(field.column)}' for field in fields)
+        f.seek(0)
+        sql=f"COPY {self.staging_table} (row_num, geom_in{columns}) FROM STDIN WITH (FORMAT csv)"
+        if hasattr(cursor, 'copy_expert'):
+            cursor.copy_expert(sql, f)
+            return
+        #psycopg 3 (DB_POOL)
+        with cursor.copy(sql) as copy:
+            while data := f.read(COPY_BUFFER_SIZE):
+                copy.write(data)
+
+    def check_geometries(self, cursor, source_srid: int):
+        """
+        Snaps the geometries and rejects the wrong ones, in set-based SQL
+        """
+        stg=self.staging_table
+        target_srid=self.geom_field.srid
+        geom_type=self.geom_field.geom_type.upper()
+        cursor.execute(f"""UPDATE {stg} SET geom=ST_SnapToGrid(ST_Transform(ST_SetSRID(ST_Force2D(
+                                CASE WHEN GeometryType(g) LIKE 'MULTI%%' AND ST_NumGeometries(g) = 1
+                                    THEN ST_GeometryN(g, 1) ELSE g END), %s), %s), %s)
+                            FROM (SELECT row_num AS r, ST_GeomFromWKB(geom_in) AS g FROM {stg}) s
+                            WHERE row_num = s.r""", [source_srid, target_srid, ST_SNAP_PRECISION])
+        cursor.execute(f"UPDATE {stg} SET error='The feature does not have geometry' WHERE geom IS NULL OR ST_IsEmpty(geom)")
+        cursor.execute(f"""UPDATE {stg} SET error='The geometry must be ' || %s || ', not ' || GeometryType(geom)
+                            WHERE error IS NULL AND GeometryType(geom) <> %s""", [geom_type, geom_type])
+        cursor.execute(f"""UPDATE {stg} SET error='The geometry is not valid: ' || ST_IsValidReason(geom)
+                            WHERE error IS NULL AND NOT ST_IsValid(geom)""")
+        cursor.execute(f"CREATE INDEX ON {stg} USING GIST (geom)")
+        cursor.execute(f"ANALYZE {stg}")
+
+    def check_relations(self, cursor):
+        """
+        Rejects the geometries with the relation matrix9IM with the features of the
+        table or with a previous feature of the file, and the ones that are not
+        inside the container table
+        """
+        stg=self.staging_table
+        matrix9IM=self.rules.matrix9IM
+        if matrix9IM is not None:
+            bbox_filter=" AND t.geom && s.geom" if relate_requires_intersection(matrix9IM) else ""
+            cursor.execute(f"""WITH related AS (
+                                    SELECT DISTINCT ON (s.row_num) s.row_num, t.id
+                                    FROM {stg} s JOIN {self.layer_name} t ON ST_Relate(t.geom, s.geom, %s){bbox_filter}
+                                    WHERE s.error IS NULL
+                                    ORDER BY s.row_num, t.id
+                                )
+                                UPDATE {stg} s SET error='The geometry has the relation ' || %s || ' with the feature '
+                                                         || related.id || ' of {self.layer_name}'
+                                FROM related WHERE s.row_num = related.row_num""", [matrix9IM, matrix9IM])
+            cursor.execute(f"""WITH related AS (
+                                    SELECT DISTINCT ON (s.row_num) s.row_num, t.row_num AS other_row
+                                    FROM {stg} s JOIN {stg} t ON t.row_num < s.row_num AND ST_Relate(t.geom, s.geom, %s){bbox_filter}
+                                    WHERE s.error IS NULL AND t.error IS NULL
+                                    ORDER BY s.row_num, t.row_num
+                                )
+                                UPDATE {stg} s SET error='The geometry has the relation ' || %s || ' with the row '
+                                                         || related.other_row || ' of the file'
+                                FROM related WHERE s.row_num = related.row_num""", [matrix9IM, matrix9IM])
+        container_table=self.rules.container_table
+        if container_table is not None:
+            cursor.execute(f"""UPDATE {stg} s SET error='The geometry is not inside any feature of {container_table}'
+                                WHERE s.error IS NULL AND NOT EXISTS (
+                                    SELECT 1 FROM {container_table} c WHERE c.geom && s.geom AND ST_Contains(c.geom, s.geom)
+                                )""")
+
+    def insert_features(self, cursor, fields: list)->list:
+        """
+        Inserts the accepted features. Returns their ids
+        """
+        qn=connection.ops.quote_name
+        columns=[qn(f.column) for f in fields] + ['geom']
+        values=[qn(f.column) for f in fields] + ['geom']
+        if self.rules.area_field_name is not None:
+            columns.append(qn(self.rules.area_field_name))
+            values.append('ST_Area(geom)')
+        if self.rules.length_field_name is not None:
+            columns.append(qn(self.rules.length_field_name))
+            values.append('ST_Length(geom)')
+        cursor.execute(f"""INSERT INTO {self.layer_name} ({', '.join(columns)})
+                            SELECT {', '.join(values)} FROM {self.staging_table}
+                            WHERE error IS NULL ORDER BY row_num
+                            RETURNING id""")
+        return [row[0] for row in cursor.fetchall()]
+
+    def get_extent(self, cursor)->tuple:
+        cursor.execute(f"""SELECT ST_XMin(e), ST_YMin(e), ST_XMax(e), ST_YMax(e)
+                            FROM (SELECT ST_Extent(geom) AS e FROM {self.staging_table} WHERE error IS NULL) x""")
+        row=cursor.fetchone()
+        return tuple(row) if row[0] is not None else None
+
+    def get_report(self, cursor)->dict:
+        stg=self.staging_table
+        cursor.execute(f"SELECT count(*), count(*) FILTER (WHERE error IS NOT NULL) FROM {stg}")
+        total, rejected=cursor.fetchone()
+        cursor.execute(f"SELECT row_num, error FROM {stg} WHERE error IS NOT NULL ORDER BY row_num LIMIT %s",
+                       [IMPORT_MAX_REPORTED_ERRORS])
+        errors=[{'row': row_num, 'error': error} for row_num, error in cursor.fetchall()]
+        return {'total': total, 'inserted': 0, 'rejected': rejected, 'errors': errors}
+
+    def run(self, path: str, source_layer: str=None, srid: int=None, dry_run: bool=False)->dict:
+        """
+        Imports the file. Returns the report: number of features of the file,
+        inserted and rejected, the row number and the error of the rejected ones
+        (at most IMPORT_MAX_REPORTED_ERRORS), and the ids of the inserted ones.
+        """
+        ds, layer=self.open_layer(path, source_layer)
+        source_srid=self.get_source_srid(layer, srid)
+        with tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024, mode='w+', newline='') as f:
+            fields=self.write_csv(layer, f)
+            ds=None
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    self.create_staging_table(cursor, fields)
+                    try:
+                        self.copy_rows(cursor, f, fields)
+                    except DataError as e:
+                        raise ValueError(f"The values of the file are not correct: {e}")
+                    self.check_geometries(cursor, source_srid)
+                    self.check_relations(cursor)
+                    report=self.get_report(cursor)
+                    report['fields']=[field.attname for field in fields]
+                    report['ids']=[]
+                    if dry_run:
+                        transaction.set_rollback(True)
+                        return report
+                    ids=self.insert_features(cursor, fields)
+                    if len(ids) > 0:
+                        send_layer_changed(self.model, ids, [self.get_extent(cursor)], LayerChange.INSERT)
+                    report['inserted']=len(ids)
+                    report['ids']=ids
+                    cursor.execute(f"DROP TABLE {self.staging_table}")
+        return report
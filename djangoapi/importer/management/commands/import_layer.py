@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from importer.importEngine import LayerImporter
+
+class Command(BaseCommand):
+    """
+    Imports a GeoPackage, GeoJSON, GeoJSONSeq or CSV file in a layer, with the
+    same checks as the endpoint /import/<layer>/:
+        python manage.py import_layer parcels_parcels /data/parcels_1234.gpkg
+        python manage.py import_layer addresses_addresses addresses.csv --srid 3794 --dry-run
+    """
+    help = "Imports a file in a layer, with COPY and set-based geometry checks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('layer', help='Layer (table) where the features are imported')
+        parser.add_argument('path', help='GeoPackage, GeoJSON, GeoJSONSeq or CSV file')
+        parser.add_argument('--source-layer', default=None, help='Layer of the file')
+        parser.add_argument('--srid', type=int, default=None, help='srid of the geometries, if the file does not have it')
+        parser.add_argument('--dry-run', action='store_true', help='Only checks the features')
+
+    def handle(self, *args, **options):
+        try:
+            importer=LayerImporter(options['layer'])
+            report=importer.run(options['path'], source_layer=options['source_layer'],
+                                srid=options['srid'], dry_run=options['dry_run'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        for error in report['errors']:
+            self.stdout.write(f"Row {error['row']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['total']} features, {report['inserted']} inserted, {report['rejected']} rejected"))
@@ -0,0 +1,6 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path("<str:layer>/", views.ImportView.as_view(), name="import_layer"),    # POST http://localhost:8000/import/parcels_parcels/
+]
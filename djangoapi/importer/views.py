@@ -0,0 +1,51 @@
+import os
+import tempfile
+
+from django.http import JsonResponse
+from django.views import View
+
+from .importEngine import LayerImporter
+
+class ImportView(View):
+    """
+    Uvoz datoteke v sloj (GeoPackage, GeoJSON, GeoJSONSeq ali CSV z geometrijo v WKT):
+        POST /import/<layer>/       multipart, datoteka v polju file
+    Parametri (neobvezni):
+        source_layer=<ime>      sloj v datoteki GeoPackage
+        srid=<epsg>             srid geometrij, če ga datoteka nima
+        dry_run=true            samo preveri, nič ne vstavi
+    Objekti se naložijo s COPY v začasno tabelo, kjer se geometrije poravnajo na mrežo in
+    preverijo (veljavnost, matrika 9IM, vsebovanost) z enim SQL stavkom za vse. Vrne
+    število vstavljenih in zavrnjenih objektov, in napako vsake zavrnjene vrstice.
+    """
+    def post(self, request, layer):
+        upload = request.FILES.get('file', None)
+        if upload is None:
+            return JsonResponse({'ok': False, 'message': 'The file must be sent in the field file', 'data': []}, status=400)
+        params = request.POST
+        try:
+            srid = int(params['srid']) if params.get('srid', '') != '' else None
+        except ValueError:
+            return JsonResponse({'ok': False, 'message': 'srid must be an integer', 'data': []}, status=400)
+        dry_run = params.get('dry_run', 'false').lower() in ('true', '1', 't')
+        source_layer = params.get('source_layer', None) or None
+
+        # OGR potrebuje datoteko na disku, s pravo končnico
+        suffix = os.path.splitext(upload.name)[1].lower()
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in upload.chunks():
+                    f.write(chunk)
+            importer = LayerImporter(layer)
+            report = importer.run(path, source_layer=source_layer, srid=srid, dry_run=dry_run)
+        except ValueError as e:
+            return JsonResponse({'ok': False, 'message': str(e), 'data': []}, status=400)
+        finally:
+            os.remove(path)
+
+        if dry_run:
+            message = f"{report['total']} features checked, {report['rejected']} rejected. Nothing has been inserted"
+        else:
+            message = f"{report['inserted']} features inserted, {report['rejected']} rejected"
+        return JsonResponse({'ok': report['rejected'] == 0, 'message': message, 'data': report})
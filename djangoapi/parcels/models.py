@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.gis.db import models as gis_models
+from django.db.models.functions import Now
 from djangoapi.settings import EPSG_FOR_GEOMETRIES
 from django.core.validators import MinValueValidator, MaxValueValidator
 
@@ -14,6 +15,8 @@ class Parcels(models.Model):
     )
     area = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
     geom = gis_models.PolygonField(srid=int(EPSG_FOR_GEOMETRIES), blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now())
+    row_version = models.IntegerField(default=1, db_default=1, editable=False)  # +1 on every update, in the ETag
 
 
 class Parcels_Owners(models.Model):
@@ -12,6 +12,7 @@ class ParcelsSerializer(GeoModelSerializer):
     check_geometry_is_valid = True # preveri, če je geometrija veljavna: ne seka sama sebe in je zaprta
     check_st_relation = True # preveri, če se geometrija seka z drugimi geometrijami
     matrix9IM = 'T********' # matrika 9IM za odnos geometrij: 'T********' = notranjost seka
+    area_field_name = 'area' # polje, kamor množične operacije shranijo površino geometrije
     geoms_as_wkt = True # če je True, serializer pričakuje geometrije v WKT formatu. Če je False, v geojson formatu
     check_st_relation = True # če mora biti nova geometrija preverjena glede na
             # druge geometrije v tabeli glede na matriko9IM. Če ima katera koli geometrija
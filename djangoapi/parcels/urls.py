@@ -21,6 +21,13 @@ urlpatterns = [
     path('parcels_view/insert2/', views.ParcelsView.as_view(), name='parcels-insert2'),
     path('parcels_view/update/<int:id>/', views.ParcelsView.as_view(), name='parcels-update'),
     path('parcels_view/delete/<int:id>/', views.ParcelsView.as_view(), name='parcels-delete'),
+
+    # ParcelsAsyncView - async variant of ParcelsView, for the ASGI server
+    path('parcels_async/selectone/<int:id>/', views.ParcelsAsyncView.as_view(), {'action': 'selectone'}, name='parcels_async_selectone'),  # GET
+    path('parcels_async/selectall/', views.ParcelsAsyncView.as_view(), {'action': 'selectall'}, name='parcels_async_selectall'),  # GET
+    path('parcels_async/insert/', views.ParcelsAsyncView.as_view(), {'action': 'insert'}, name='parcels_async_insert'),  # POST
+    path('parcels_async/update/<int:id>/', views.ParcelsAsyncView.as_view(), {'action': 'update'}, name='parcels_async_update'),  # POST
+    path('parcels_async/delete/<int:id>/', views.ParcelsAsyncView.as_view(), {'action': 'delete'}, name='parcels_async_delete'),  # POST
     
     # ViewSet URL-ji (REST framework)
     path('', include(router.urls)),
@@ -49,6 +56,9 @@ POST   http://localhost:8000/parcels/parcels/
 PUT    http://localhost:8000/parcels/parcels/1/
 PATCH  http://localhost:8000/parcels/parcels/1/
 DELETE http://localhost:8000/parcels/parcels/1/
+POST   http://localhost:8000/parcels/parcels/bulk_validate/
+POST   http://localhost:8000/parcels/parcels/bulk_create/
+PATCH  http://localhost:8000/parcels/parcels/bulk_update/
 
 4. PARCELOWNERSMODELVIEWSET (REST FRAMEWORK)
 ---------------------------------------------
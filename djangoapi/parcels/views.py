@@ -6,20 +6,18 @@ from django.shortcuts import redirect
 from django.forms.models import model_to_dict
 from django.contrib.auth.mixins import LoginRequiredMixin
 
-#Geoss
-from django.contrib.gis.geos import GEOSGeometry
-from django.contrib.gis.db.models.functions import SnapToGrid
-
 #rest_framework imports
 from rest_framework import viewsets
 from rest_framework import permissions
 
 #My imports
-from core.myLib.geometryTools import WkbConversor, GeometryChecks
+from core.myLib.geometryTools import GeometryPreparer
 from .models import Parcels, Parcels_Owners
 from .serializers import ParcelsSerializer, ParcelsOwnersSerializer
-from djangoapi.settings import EPSG_FOR_GEOMETRIES, ST_SNAP_PRECISION, MAX_NUMBER_OF_RETRIEVED_ROWS
 from core.myLib.baseDjangoView import BaseDjangoView
+from core.myLib.asyncBaseDjangoView import AsyncBaseDjangoView
+from core.myLib.geoModelViewSet import GeoModelViewSet
+from core.myLib.featureWriter import FeatureWriter
 
 from decimal import Decimal, ROUND_HALF_UP
 
@@ -55,6 +53,9 @@ class ParcelsView(BaseDjangoView):
     #     POST /parcels_view/delete/<id>/
  
     
+    # z modelom se odgovori selectone in selectall shranijo v predpomnilnik, dokler se sloj ne spremeni
+    model = Parcels
+
     def post(self, request, *args, **kwargs):
         # request vsebuje podatke o zahtevi, ki jo je uporabnik poslal
         # *args je list argumentov, ki jih posredujemo metodi
@@ -89,14 +90,9 @@ class ParcelsView(BaseDjangoView):
 
     # podobna metoda kot zgoraj, samo da vrne vse objekte Parcels
     # Link: http://localhost:8000/parcels/parcels_view/selectall/
+    # s parametrom ?stream=true se vrnejo vse parcele, brez da bi jih naložili v pomnilnik
     def selectall(self):
-        l=Parcels.objects.all()[:MAX_NUMBER_OF_RETRIEVED_ROWS]
-        data=[]
-        for b in l:
-            d=model_to_dict(b)
-            d['geom']=b.geom.wkt
-            data.append(d)
-        return JsonResponse({'ok':True, 'message': 'Parcel data retrieved', 'data': data}, status=200)
+        return self.selectall_response(Parcels.objects.all(), 'Parcel data retrieved')
 
     #POST OPERATIONS
     # Tudi metoda insert ni samostojna URL metoda, ampak je metoda, ki jo lahko pokličeš iz razreda BaseDjangoView.
@@ -108,63 +104,35 @@ class ParcelsView(BaseDjangoView):
     #     "area": 700,
     #     "geom": "POLYGON((0 0, 0 10, 10 10, 10 0, 0 0))"
     def insert(self, request):
-        # Inserts the polygon. Latter snap it to the grid. This must be done
-        # in the database. So we need to insert it before.
-        # After the parcel has been inserted:
+        # Inserts the polygon. Before writing anything, in only one query:
         #     - snap it to grid
         #     - Check if the geometry is valid
         #     - Check if the interior intersects with other geometry
-        #     - If any check fails, remove the row.
-        #     - The only inconvenient is the id counter sums one more
+        # If any check fails nothing is written. If not, the parcel
+        # is saved with only one INSERT. See core/myLib/featureWriter.py
         
         originalWkt=request.POST.get('geom', None)   # preverimo ali imamo geometrijo v POST zahtevi
         if originalWkt is None:                      # če nimamo geometrije, se spremenljivka originalWkt nastavi na None, in vrnemo napako
             return JsonResponse({'ok':False, 'message': 'The geometry is mandartory', 'data':[], 'post_data': dict(request.POST) },  status=400)
-        
-        #Creates the geometry
-        g=GEOSGeometry(request.POST.get('geom',''), srid=EPSG_FOR_GEOMETRIES)   # EPSG 25830 zamenjan z WGS84 4326
-        #print the representation of the object
-        print(f"Original geometry: {g}")
-
-        description = request.POST.get('description','') 
-        b=Parcels(description=description, area=g.area, geom=g)
-        b.save()
-        print(f"Geometry inserted id: {b.id}")
-
-        #Update the geometry to an snaped one to the grid
-        Parcels.objects.filter(id=b.id).update(geom=SnapToGrid('geom', ST_SNAP_PRECISION))
-
-        #Now we get a new object with the new geometry to perform the checks
-        b=Parcels.objects.get(id=b.id)           # ponovno preberemo objekt Parcels iz baze, da dobimo novo geometrijo
-        print('Snapped geometry',b.geom.wkt)       # pretvori geometrijo v WKT format in jo izpiše
-        #bGeos=GEOSGeometry(b.geom.wkt, srid=25830)
-        #valid=bGeos.valid
-        #b.geom is a GEOSGeometry object, so we can use it directly
-        valid=b.geom.valid
-        print(f'Valid: {valid}')
-        if not valid:
-            print(f"Deleting invalid geometry {b.id}")   # če geometrija ni veljavna, jo izbrišemo
-            b.delete()
-            return JsonResponse({'ok':False, 'message': 'The Parcel geometry is not valid after the st_SnapToGrid', 'data':[]}, status=400)   
 
-        #create a filter to get all the geometries which interiors intersects,
-        #but excluding the one just created
-        filt=Parcels.objects.filter(geom__relate=(g.wkt,'T********')).exclude(id=b.id)   # te filtre že poznamo iz prejšnjih vaj
-        print(f"Query:{filt.query}")
-        exist=filt.exists()
-        print(f"Exists {exist}") 
-        n=filt.count() 
-        print(f"Count: {n}")
-        print(f"Values: {list(filt)}")
-        
-        if exist:         # če obstajajo geometrije, ki se sekajo z novo geometrijo, jo izbrišemo in izpišemo poročilo o napaki
-            print(f"Deleting parcels id {b.id}, as it intersects with others")
-            b.delete()
-            return JsonResponse({'ok':False, 'message': f'The parcel intersects with {n} parcel/s'}, status=400)
-        
-        #create a parcels object, from the model Parcels
-        d=model_to_dict(b)       # pretvori objekt Parcels v dictionary, da ga lahko izpišemo v JSON formatu
-        d['geom']=b.geom.wkt
+        parc_st = request.POST.get('parc_st','') 
+        sifko = request.POST.get('sifko', None)
+        limit=self.get_relate_check_limit(request)
+        # snap, preverjanje veljavnosti in sekanja z enim SQL stavkom, nato en sam INSERT
+        fw=FeatureWriter(Parcels, 'T********', area_field_name='area')
+        fw.insert(originalWkt, {'parc_st': parc_st, 'sifko': sifko}, limit=limit)
+
+        if fw.error == FeatureWriter.INVALID_GEOMETRY:   # če geometrija ni veljavna, ni ničesar zapisano v bazo
+            return JsonResponse({'ok':False, 'message': 'The Parcel geometry is not valid after the st_SnapToGrid', 'data':[]}, status=400)   
+        if fw.error == FeatureWriter.RELATED_IDS:        # če obstajajo geometrije, ki se sekajo z novo geometrijo, izpišemo poročilo o napaki
+            ids=fw.get_related_ids()
+            n=len(ids)
+            print(f"Values: {ids}")
+            at_least='at least ' if fw.is_limit_reached() else ''
+            return JsonResponse({'ok':False, 'message': f'The parcel intersects with {at_least}{n} parcel/s', 'data':ids}, status=400)
+        print(f"Geometry inserted id: {fw.instance.id}")
+
+        d=fw.to_dict()       # pretvori objekt Parcels v dictionary, da ga lahko izpišemo v JSON formatu
         return JsonResponse({'ok':True, 'message': 'Parcel data inserted', 'data': [d]}, status=201)
 
 
@@ -189,13 +157,14 @@ class ParcelsView(BaseDjangoView):
         originalWkt=request.POST.get('geom', None)    # iz POST zahteve izluščimo geometrijo
         
         if originalWkt is not None:                        # če imamo geometrijo, jo pretvorimo v WKB format
-            conversor=WkbConversor()                       # Ustvarimo objekt wkb za pretvorbo geometrijskih podatkov
-            wkb=conversor.set_wkt_from_text(originalWkt)   # Pretvorimo WKT v WKB (Well-Known Binary)
-            newWkt=conversor.get_as_wkt()                  # Dobimo pretvorjen WKT iz WKB
-            geojson=conversor.get_as_geojson()             # Dobimo GeoJSON predstavitev geometrije
-            gc=GeometryChecks(wkb)                         # Ustvarimo objekt gc za preverjanje geometrije
-            isValid=gc.is_geometry_valid()                 # Preverimo, ali je geometrija veljavna
-            interesectionIds=gc.check_st_relate('parcels_parcels','T********', id_to_avoid=id) # Preverimo, ali se geometrija sekajo z drugimi geometrijami
+            # Snap, preverjanje veljavnosti, sekanja in WKT/GeoJSON dobimo z enim samim SQL stavkom
+            gc=GeometryPreparer()                          # Ustvarimo objekt gc za pripravo in preverjanje geometrije
+            wkb=gc.prepare(originalWkt, 'parcels_parcels', 'T********', id_to_avoid=id,
+                           limit=self.get_relate_check_limit(request)) # Pretvorimo WKT v WKB in preverimo, ali se sekajo z drugimi geometrijami
+            newWkt=gc.get_as_wkt()                         # Dobimo pretvorjen WKT iz WKB
+            geojson=gc.get_as_geojson()                    # Dobimo GeoJSON predstavitev geometrije
+            isValid=gc.is_valid                            # Ali je geometrija veljavna
+            interesectionIds=gc.related_ids                # id-ji parcel, ki se sekajo z novo geometrijo
             thereAre = gc.are_there_related_ids()          # vrne True ali False, glede na to ali obstajajo geometrije, ki se sekajo z novo geometrijo
             
             print(f"Snaped wkt: {newWkt}")
@@ -211,11 +180,10 @@ class ParcelsView(BaseDjangoView):
                 return JsonResponse({'ok':False, 'message': gc.get_relate_message(), 'data':gc.related_ids}, status=400)   
             b.geom=wkb
             b.description=request.POST.get('description', '')
-            polyGeos=GEOSGeometry(wkb)
-            b.area=polyGeos.area                  # izračunamo površino nove geometrije
+            b.area=gc.area                        # površina nove geometrije, izračunana v bazi
             b.save()
             d=model_to_dict(b)
-            d['geom']=conversor.get_as_wkt()#snaped version
+            d['geom']=newWkt#snaped version
         else:                                     # če v zahtevi nimamo geometrije, vrnemo napako
             return JsonResponse({'ok':False, 'message': 'The geometry mandartory', 'data':[]}, status=400)
              # če je geometrija veljavna, izpišemo sporočilo o uspehu in vrnemo podatke o stavbi
@@ -252,11 +220,10 @@ class ParcelsView(BaseDjangoView):
         originalWkt=request.POST.get('geom', None) # iz post zahteve izluščimo geometrijo, ki je že v WKT formatu
         
         if originalWkt is not None:
-            conversor=WkbConversor()
-            wkb=conversor.set_wkt_from_text(originalWkt) # WKT spretvorimo v WKB format
-            gc=GeometryChecks(wkb)                       # Ustvarimo objekt gc za preverjanje geometrijskih podatkov
-            isValid=gc.is_geometry_valid()               # Preverimo, ali je geometrija veljavna
-            gc.check_st_relate('parcels_parcels','T********')    # Preverimo, ali se geometrija sekajo z drugimi geometrijami
+            gc=GeometryPreparer()                        # Ustvarimo objekt gc za pripravo in preverjanje geometrijskih podatkov
+            wkb=gc.prepare(originalWkt, 'parcels_parcels', 'T********',
+                           limit=self.get_relate_check_limit(request)) # WKT pretvorimo v WKB format in preverimo, ali se sekajo z drugimi geometrijami
+            isValid=gc.is_valid                          # Ali je geometrija veljavna
             print(gc.get_relate_message())                           # izpišemo sporočilo o napaki, če obstaja 
 
             if not(isValid):    # če geometrija ni veljavna, vrnemo napako
@@ -268,10 +235,10 @@ class ParcelsView(BaseDjangoView):
             p.geom=wkb               # nastavimo geometrijo na WKB format, wkt pretvorimo v wkb format
             p.parc_st=request.POST.get('parc_st', '')   # iz POST zahteve izluščimo parcelno številko
             p.sifko=request.POST.get('sifko', '')   # iz POST zahteve izluščimo še šifro KO
-            p.area=p.geom.area                                  # izračunamo površino nove geometrije
+            p.area=gc.area                                      # površina nove geometrije, izračunana v bazi
             p.save()                                            # shranimo objekt Parcels v bazo
             d=model_to_dict(p)
-            d['geom']=p.geom.wkt
+            d['geom']=gc.get_as_wkt()
         else:                       # če v zahtevi nimamo geometrijo, vrnemo napako            
             return JsonResponse({'ok':False, 'message': 'The geometry mandartory', 'data':[]}, status=400)
         # če je geometrija veljavna, izpišemo sporočilo o uspehu in vrnemo podatke o stavbi
@@ -289,7 +256,20 @@ class ParcelsView(BaseDjangoView):
 # ---------------------------------------------------------------------------------------------------
 
 # Create your views here.
-class ParcelsModelViewSet(viewsets.ModelViewSet):
+class ParcelsAsyncView(AsyncBaseDjangoView):
+    """
+    Async variant of ParcelsView, for the ASGI server. The geometry checks are the
+    rules of parcels_parcels in core/myLib/layerRules.py.
+        GET /parcels/parcels_async/selectone/<id>/
+        GET /parcels/parcels_async/selectall/
+        POST /parcels/parcels_async/insert/
+        POST /parcels/parcels_async/update/<id>/
+        POST /parcels/parcels_async/delete/<id>/
+    """
+    model = Parcels
+
+
+class ParcelsModelViewSet(GeoModelViewSet):
     #     GET operation over /parcels/parcels/. It will return all reccords
     #     GET operation over /parcels/parcels/<id>/. 
     #     POST operation over /parcels/parcels/. It will insert a new record
@@ -0,0 +1,5 @@
+from django.contrib.gis import admin
+from .models import QARun, QAIssue
+
+admin.site.register(QARun, admin.ModelAdmin)
+admin.site.register(QAIssue, admin.GISModelAdmin)
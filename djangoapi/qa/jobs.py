@@ -0,0 +1,57 @@
+"""
+QA runs in the background, on a pool of threads of the process, like the
+export jobs (export/jobs.py). Every run uses QA_WORKERS more threads for its tiles.
+
+    run=submit_qa(['parcels_parcels', 'buildings_buildings'], tiles=4)
+    run.status -> pending, running, done or error
+    run.progress -> 0 to 100
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+
+from djangoapi.settings import QA_TILES
+from .models import QARun, QAIssue
+from .qaEngine import run_qa, get_summary
+
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='qa-run')
+
+def submit_qa(layers: list, tiles: int=QA_TILES)->QARun:
+    run=QARun.objects.create(layers=list(layers), tiles=tiles)
+    executor.submit(run_qa_job, run.id)
+    return run
+
+def run_qa_job(run_id: int):
+    try:
+        run_qa(run_id)
+    except Exception:
+        pass #the error is saved in the run
+    finally:
+        connection.close()
+
+def run_to_dict(run: QARun, summary: bool=False)->dict:
+    data={
+        'id': run.id,
+        'layers': run.layers,
+        'tiles': run.tiles,
+        'status': run.status,
+        'progress': run.progress,
+        'issue_count': run.issue_count,
+        'message': run.message,
+        'created_at': run.created_at.isoformat() if run.created_at else None,
+        'finished_at': run.finished_at.isoformat() if run.finished_at else None,
+    }
+    if summary:
+        data['summary']=get_summary(run.id)
+    return data
+
+def issue_to_dict(issue: QAIssue)->dict:
+    return {
+        'id': issue.id,
+        'layer_name': issue.layer_name,
+        'check_name': issue.check_name,
+        'feature_id': issue.feature_id,
+        'other_id': issue.other_id,
+        'detail': issue.detail,
+        'geom_wkt': issue.geom.wkt if issue.geom is not None else None,
+    }
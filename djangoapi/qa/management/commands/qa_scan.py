@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from djangoapi.settings import QA_TILES, QA_WORKERS
+from qa.models import QARun
+from qa.qaEngine import run_qa, get_qa_layers, get_summary
+
+class Command(BaseCommand):
+    """
+    QA scan of whole layers, in this process, with the same checks as the
+    endpoint /qa/runs/:
+        python manage.py qa_scan
+        python manage.py qa_scan --layers parcels_parcels,buildings_buildings --tiles 8 --workers 8
+    """
+    help = "Checks the geometries and relations of whole layers with set-based SQL"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--layers', default=None, help='Comma separated layers. All the layers with rules by default')
+        parser.add_argument('--tiles', type=int, default=QA_TILES, help='The extent is divided in tiles x tiles tiles')
+        parser.add_argument('--workers', type=int, default=QA_WORKERS, help='Tiles checked at the same time')
+
+    def handle(self, *args, **options):
+        try:
+            layers=get_qa_layers(options['layers'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['tiles'] < 1:
+            raise CommandError('tiles must be a positive integer')
+        run=QARun.objects.create(layers=layers, tiles=options['tiles'])
+        try:
+            run_qa(run.id, options['workers'])
+        except Exception as e:
+            raise CommandError(f'QA run {run.id} failed: {e}')
+        for row in get_summary(run.id):
+            self.stdout.write(f"{row['layer_name']} {row['check_name']}: {row['count']}")
+        run.refresh_from_db()
+        self.stdout.write(self.style.SUCCESS(f"QA run {run.id}: {run.message}"))
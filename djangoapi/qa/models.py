@@ -0,0 +1,52 @@
+from django.db import models
+from django.contrib.gis.db import models as gis_models
+
+from djangoapi.settings import EPSG_FOR_GEOMETRIES
+
+class QARun(models.Model):
+    """
+    QA scan of whole layers, made by qa/qaEngine.py
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    ERROR = 'error'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (ERROR, 'Error')]
+
+    layers = models.JSONField(default=list)
+    tiles = models.IntegerField(default=1)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    progress = models.FloatField(default=0)
+    issue_count = models.IntegerField(default=0)
+    message = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"QA {self.id} {self.status}"
+
+class QAIssue(models.Model):
+    """
+    Problem found by a QA scan: the feature, the check, the other feature
+    of the relation, if there is one, and a point where it is
+    """
+    INVALID = 'invalid'
+    EMPTY = 'empty'
+    RELATION = 'relation'
+    NOT_CONTAINED = 'not_contained'
+    CHECK_CHOICES = [(INVALID, 'Invalid geometry'), (EMPTY, 'Empty geometry'),
+                     (RELATION, 'Forbidden relation'), (NOT_CONTAINED, 'Not contained')]
+
+    run = models.ForeignKey(QARun, on_delete=models.CASCADE, related_name='issues')
+    layer_name = models.CharField(max_length=100)
+    check_name = models.CharField(max_length=20, choices=CHECK_CHOICES)
+    feature_id = models.BigIntegerField()
+    other_id = models.BigIntegerField(null=True, blank=True)
+    detail = models.TextField(blank=True, default='')
+    geom = gis_models.PointField(srid=int(EPSG_FOR_GEOMETRIES), blank=True, null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['run', 'layer_name', 'check_name'])]
+
+    def __str__(self):
+        return f"{self.layer_name} {self.feature_id} {self.check_name}"
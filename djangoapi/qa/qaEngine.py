@@ -0,0 +1,175 @@
+"""
+QA scan of whole layers, with set-based SQL, for the data that has not been
+checked when it was written (loaded with pgAdmin, GeoServer WFS-T, ...).
+
+For every layer, with the rules of core/myLib/layerRules.py:
+    - empty: features without geometry.
+    - invalid: invalid geometries, with the reason and the location of ST_IsValidDetail.
+    - relation: pairs of valid features with the forbidden relation matrix9IM (overlapping
+        parcels and buildings, crossing roads, duplicated addresses). Spatial self-join
+        on the GiST index (a.geom && b.geom).
+    - not_contained: features that are not inside a feature of the container table
+        (addresses outside the buildings).
+The problems are inserted in qa.models.QAIssue directly by the queries
+(INSERT ... SELECT), without reading them in python.
+
+The extent of every layer is divided in tiles x tiles tiles, and every tile is
+checked by its own query. A feature belongs to the tile where the lower left corner
+of its bounding box is, and a pair to the tile of the feature with the lower id,
+so nothing is checked twice. The tiles are run by QA_WORKERS threads at the same
+time, each one with its own connection: the work is done by PostgreSQL, in as
+many backends as threads.
+
+Example:
+    run=QARun.objects.create(layers=['parcels_parcels'], tiles=4)
+    run_qa(run.id)
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection, close_old_connections
+from django.db.models import Count
+from django.utils import timezone
+
+from core.myLib.geometryTools import relate_requires_intersection
+from core.myLib.layerRules import LAYER_RULES
+from core.myLib.layers import get_layer_model
+from djangoapi.settings import QA_WORKERS
+from .models import QARun, QAIssue
+
+INSERT_ISSUE = f"INSERT INTO {QAIssue._meta.db_table} (run_id, layer_name, check_name, feature_id, other_id, detail, geom)"
+#in the tile: the lower left corner of the bounding box of a is in it. If it is, the
+#bounding box of a intersects the tile, so the GiST index can be used with &&
+IN_TILE = """a.geom && ST_MakeEnvelope(%s, %s, %s, %s, {srid})
+             AND ST_XMin(a.geom) >= %s AND ST_XMin(a.geom) < %s
+             AND ST_YMin(a.geom) >= %s AND ST_YMin(a.geom) < %s"""
+
+def get_layer_tiles(layer_name: str, tiles: int)->list:
+    """
+    Divides the extent of the layer in tiles x tiles (xmin, ymin, xmax, ymax).
+    The maximums are a little bigger than the ones of the extent, as the
+    tiles do not include their maximums
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT ST_XMin(e), ST_YMin(e), ST_XMax(e), ST_YMax(e) FROM (SELECT ST_Extent(geom) AS e FROM {layer_name}) x")
+        xmin, ymin, xmax, ymax=cursor.fetchone()
+    if xmin is None:
+        return []
+    width=(xmax - xmin) * (1 + 1e-9) + 1e-6
+    height=(ymax - ymin) * (1 + 1e-9) + 1e-6
+    return [(xmin + width * i / tiles, ymin + height * j / tiles,
+             xmin + width * (i + 1) / tiles, ymin + height * (j + 1) / tiles)
+            for i in range(tiles) for j in range(tiles)]
+
+def check_empty(run_id: int, layer_name: str):
+    with connection.cursor() as cursor:
+        cursor.execute(f"""{INSERT_ISSUE}
+                           SELECT %s, %s, %s, a.id, NULL, 'The feature does not have geometry', NULL
+                           FROM {layer_name} a WHERE a.geom IS NULL OR ST_IsEmpty(a.geom)""",
+                       [run_id, layer_name, QAIssue.EMPTY])
+
+def check_tile(run_id: int, layer_name: str, tile: tuple):
+    """
+    Runs the checks of the layer over the features of the tile
+    """
+    rules=LAYER_RULES[layer_name]
+    srid=get_layer_model(layer_name)._meta.get_field('geom').srid
+    in_tile=IN_TILE.format(srid=srid)
+    tile_values=[tile[0], tile[1], tile[2], tile[3], tile[0], tile[2], tile[1], tile[3]]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"""{INSERT_ISSUE}
+                               SELECT %s, %s, %s, a.id, NULL, d.reason, ST_SetSRID(d.location, {srid})
+                               FROM {layer_name} a, LATERAL ST_IsValidDetail(a.geom) d
+                               WHERE {in_tile} AND NOT d.valid""",
+                           [run_id, layer_name, QAIssue.INVALID] + tile_values)
+            if rules.matrix9IM is not None:
+                bbox_filter="AND a.geom && b.geom" if relate_requires_intersection(rules.matrix9IM) else ""
+                cursor.execute(f"""{INSERT_ISSUE}
+                                   SELECT %s, %s, %s, a.id, b.id, 'ST_Relate ' || %s, ST_ClosestPoint(a.geom, b.geom)
+                                   FROM {layer_name} a JOIN {layer_name} b ON a.id < b.id {bbox_filter}
+                                   WHERE {in_tile}
+                                       AND (ST_Relate(a.geom, b.geom, %s) OR ST_Relate(b.geom, a.geom, %s))
+                                       AND ST_IsValid(a.geom) AND ST_IsValid(b.geom)""",
+                               [run_id, layer_name, QAIssue.RELATION, rules.matrix9IM] + tile_values
+                               + [rules.matrix9IM, rules.matrix9IM])
+            if rules.container_table is not None:
+                cursor.execute(f"""{INSERT_ISSUE}
+                                   SELECT %s, %s, %s, a.id, NULL, 'Not inside any feature of {rules.container_table}',
+                                          ST_PointOnSurface(a.geom)
+                                   FROM {layer_name} a
+                                   WHERE {in_tile} AND NOT EXISTS (
+                                       SELECT 1 FROM {rules.container_table} c
+                                       WHERE c.geom && a.geom AND ST_Contains(c.geom, a.geom))""",
+                               [run_id, layer_name, QAIssue.NOT_CONTAINED] + tile_values)
+    finally:
+        connection.close()
+
+def run_qa(run_id: int, workers: int=QA_WORKERS):
+    """
+    Runs the QA scan. The old issues of the run are removed
+    """
+    close_old_connections()
+    runs=QARun.objects.filter(pk=run_id)
+    try:
+        run=runs.get()
+        runs.update(status=QARun.RUNNING, progress=0)
+        QAIssue.objects.filter(run_id=run_id).delete()
+        tasks=[]
+        for layer_name in run.layers:
+            check_empty(run_id, layer_name)
+            tasks+=[(layer_name, tile) for tile in get_layer_tiles(layer_name, run.tiles)]
+
+        done=0
+        lock=threading.Lock()
+        def task_done(future):
+            nonlocal done
+            with lock:
+                done+=1
+                runs.update(progress=round(100 * done / len(tasks), 1))
+
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='qa') as executor:
+            futures=[executor.submit(check_tile, run_id, layer_name, tile) for layer_name, tile in tasks]
+            for future in futures:
+                future.add_done_callback(task_done)
+            for future in futures:
+                future.result()
+
+        issue_count=QAIssue.objects.filter(run_id=run_id).count()
+        runs.update(status=QARun.DONE, progress=100, issue_count=issue_count,
+                    message=f'{issue_count} issues found', finished_at=timezone.now())
+    except Exception as e:
+        print(f'QA run {run_id} failed: {e}')
+        runs.update(status=QARun.ERROR, message=str(e), finished_at=timezone.now())
+        raise
+
+def get_summary(run_id: int)->list:
+    """
+    Number of issues of the run by layer and check
+    """
+    return list(QAIssue.objects.filter(run_id=run_id).values('layer_name', 'check_name')
+                .annotate(count=Count('id')).order_by('layer_name', 'check_name'))
+
+def get_qa_layers(layers: str)->list:
+    """
+    Layers of the comma separated list, all the layers with rules if it is empty.
+    Raises ValueError if a layer does not have rules
+    """
+    if layers is None or layers.strip() == '':
+        return list(LAYER_RULES)
+    layer_names=[layer.strip() for layer in layers.split(',') if layer.strip() != '']
+    for layer_name in layer_names:
+        if layer_name not in LAYER_RULES:
+            raise ValueError(f'The layer {layer_name} does not exist. Layers: {list(LAYER_RULES)}')
+    return layer_names
+
+def get_tiles(tiles, default: int)->int:
+    """
+    Number of tiles by side, from 1 to 64. Raises ValueError if it is not an integer
+    """
+    if tiles is None or tiles == '':
+        return default
+    tiles=int(tiles)
+    if tiles < 1 or tiles > 64:
+        raise ValueError('tiles must be between 1 and 64')
+    return tiles
@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path("runs/", views.qa_runs, name="qa_runs"),                                       # POST - zažene pregled v ozadju
+    path("runs/<int:id>/", views.qa_run_status, name="qa_run_status"),                  # GET - stanje pregleda
+    path("runs/<int:id>/issues/", views.qa_run_issues, name="qa_run_issues"),           # GET - napake, po straneh
+]
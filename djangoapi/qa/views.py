@@ -0,0 +1,56 @@
+from django.http import JsonResponse
+
+from core.myLib.pagination import keyset_page
+from djangoapi.settings import QA_TILES
+from .jobs import submit_qa, run_to_dict, issue_to_dict
+from .models import QARun
+from .qaEngine import get_qa_layers, get_tiles
+
+def qa_runs(request):
+    """
+    POST: zažene pregled kakovosti celotnih slojev v ozadju in takoj vrne
+    pregled (status 202). Napredek in rezultat vrne /qa/runs/<id>/.
+        POST /qa/runs/?layers=parcels_parcels,buildings_buildings&tiles=4
+    Brez layers se pregledajo vsi sloji s pravili (core/myLib/layerRules.py).
+    tiles: razdelitev obsega sloja na tiles x tiles ploščic, ki se pregledujejo hkrati.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'ok': False, 'message': 'Only POST is allowed', 'data': []}, status=405)
+    params = request.POST if len(request.POST) > 0 else request.GET
+    try:
+        layers = get_qa_layers(params.get('layers', None))
+        tiles = get_tiles(params.get('tiles', None), QA_TILES)
+    except ValueError as e:
+        return JsonResponse({'ok': False, 'message': str(e), 'data': []}, status=400)
+    run = submit_qa(layers, tiles)
+    return JsonResponse({'ok': True, 'message': 'The QA run has been submitted', 'data': [run_to_dict(run)]}, status=202)
+
+def qa_run_status(request, id):
+    """
+    GET: stanje, napredek (0-100) in število napak po slojih in pregledih.
+        GET /qa/runs/<id>/
+    """
+    run = QARun.objects.filter(pk=id).first()
+    if run is None:
+        return JsonResponse({'ok': False, 'message': f'The QA run {id} does not exist', 'data': []}, status=404)
+    return JsonResponse({'ok': True, 'message': 'QA run', 'data': [run_to_dict(run, summary=True)]})
+
+def qa_run_issues(request, id):
+    """
+    GET: napake pregleda, po straneh (after=<zadnji id>, page_size).
+    Filtra: layer=<sloj> in check=invalid|empty|relation|not_contained
+        GET /qa/runs/<id>/issues/?layer=parcels_parcels&check=relation&page_size=500
+    """
+    run = QARun.objects.filter(pk=id).first()
+    if run is None:
+        return JsonResponse({'ok': False, 'message': f'The QA run {id} does not exist', 'data': []}, status=404)
+    queryset = run.issues.all()
+    if request.GET.get('layer', '') != '':
+        queryset = queryset.filter(layer_name=request.GET['layer'])
+    if request.GET.get('check', '') != '':
+        queryset = queryset.filter(check_name=request.GET['check'])
+    try:
+        rows, next_url = keyset_page(queryset, request)
+    except ValueError as e:
+        return JsonResponse({'ok': False, 'message': str(e), 'data': []}, status=400)
+    return JsonResponse({'ok': True, 'message': f'{len(rows)} issues', 'data': [issue_to_dict(row) for row in rows], 'next': next_url})
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.gis.db import models as gis_models
+from django.db.models.functions import Now
 from djangoapi.settings import EPSG_FOR_GEOMETRIES
 # Create your models here.
 class Roads(models.Model):
@@ -9,5 +10,7 @@ class Roads(models.Model):
     maintainer = models.CharField(max_length=64, blank=True, null=True)
     length = models.FloatField(blank=True, null=True)
     geom = gis_models.LineStringField(srid=int(EPSG_FOR_GEOMETRIES), blank=True, null=True)  # občutljivo na velike in male črke
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now())
+    row_version = models.IntegerField(default=1, db_default=1, editable=False)  # +1 on every update, in the ETag
 
 
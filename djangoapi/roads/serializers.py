@@ -8,6 +8,7 @@ from django.contrib.gis.geos import GEOSGeometry
 class RoadsSerializer(GeoModelSerializer):
     check_geometry_is_valid = True  # preveri, če je geometrija veljavna: ne seka sama sebe in je zaprta
     matrix9IM = '1*T***T**'  # matrika 9IM za odnos geometrij: 'T********' = notranjost seka
+    length_field_name = 'length'  # polje, kamor množične operacije shranijo dolžino geometrije
     geoms_as_wkt = True  # če je True, serializer pričakuje geometrije v WKT formatu. Če je False, v geojson formatu
     check_st_relation = True  # če mora biti nova geometrija preverjena glede na
             # druge geometrije v tabeli glede na matriko9IM. Če ima katera koli geometrija
@@ -21,30 +22,14 @@ class RoadsSerializer(GeoModelSerializer):
                     # dodajte tukaj ostale polja modela, ki jih želite serializirati
                     # in ki niso v GeoModelSerializer
 
-    def create(self, validated_data):
-        geometry = validated_data.get('geom')
-        instance = super().create(validated_data)
-        if geometry:
-            print(f"Izračunana dolžina (create): {geometry.length}")
-            instance.length = geometry.length
-            instance.save()
-        return instance
-
-    def update(self, instance, validated_data):
-        geometry = validated_data.get('geom', instance.geom)
-        instance = super().update(instance, validated_data)
-        if geometry:
-            print(f"Izračunana dolžina (update): {geometry.length}")
-            instance.length = geometry.length
-            instance.save()
-        return instance
-
     def validate_geom(self, value):
         """
-        Preveri, da linija (cesta) ne seka sama sebe.
+        Preveri, da linija (cesta) ne seka sama sebe. Nato GeoModelSerializer
+        geometrijo poravna na mrežo in preveri odnos 9IM. Dolžino shrani
+        GeoModelSerializer v polje length_field_name.
         """
         try:
-            geom = GEOSGeometry(value.wkt)  # Uporabimo WKT za zanesljivo pretvorbo
+            geom = GEOSGeometry(value)  # wkt ali geojson
         except Exception:
             raise serializers.ValidationError("Neveljavna geometrija.")
 
@@ -54,5 +39,4 @@ class RoadsSerializer(GeoModelSerializer):
         if not geom.simple:
             raise serializers.ValidationError("Linija (cesta) ne sme sekati sama sebe.")
 
-
-        return value  # vrnemo originalni value, ker bo shranjen v modelu
+        return super().validate_geom(value)  # wkb, poravnan na mrežo
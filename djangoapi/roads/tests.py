@@ -1,3 +1,36 @@
-from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from core.myLib.testing import PostGISTestCase
+from .models import Roads
+
+class RoadsCreateTest(PostGISTestCase):
+    """
+    POST /roads/roads/: the geometry is snapped, checked with the matrix 1*T***T**
+    and its length is stored in the field length
+    """
+    def setUp(self):
+        super().setUp()
+        self.client=APIClient()
+
+    def create(self, wkt: str):
+        return self.client.post('/roads/roads/', {'geom': wkt, 'str_name': 'Test'}, format='json')
+
+    def test_create_stores_the_snapped_geometry_and_its_length(self):
+        response=self.create('LINESTRING(0 0,0.00001 0.00001,3 4)')
+        self.assertEqual(response.status_code, 201, response.content)
+        road=Roads.objects.get(id=response.data['id'])
+        self.assertEqual(road.geom.wkt, 'LINESTRING (0 0, 3 4)')
+        self.assertAlmostEqual(road.length, 5)
+
+    def test_create_rejects_an_overlapping_road(self):
+        response=self.create('LINESTRING(0 0,3 4)')
+        self.assertEqual(response.status_code, 201, response.content)
+        response=self.create('LINESTRING(1.5 2,6 8)')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('geom', response.data)
+        self.assertEqual(Roads.objects.count(), 1)
+
+    def test_create_rejects_a_self_intersecting_road(self):
+        response=self.create('LINESTRING(0 0,2 2,2 0,0 2)')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Roads.objects.count(), 0)
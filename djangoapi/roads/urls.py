@@ -15,6 +15,13 @@ urlpatterns = [
     path('roads_view/insert2/', views.RoadsView.as_view(), {'action': 'insert2'}, name='roads_view_insert2'),  # POST
     path('roads_view/update/<int:id>/', views.RoadsView.as_view(), {'action': 'update'}, name='roads_view_update'),  # POST
     path('roads_view/delete/<int:id>/', views.RoadsView.as_view(), {'action': 'delete'}, name='roads_view_delete'),  # POST
+
+    # RoadsAsyncView - async variant of RoadsView, for the ASGI server
+    path('roads_async/selectone/<int:id>/', views.RoadsAsyncView.as_view(), {'action': 'selectone'}, name='roads_async_selectone'),  # GET
+    path('roads_async/selectall/', views.RoadsAsyncView.as_view(), {'action': 'selectall'}, name='roads_async_selectall'),  # GET
+    path('roads_async/insert/', views.RoadsAsyncView.as_view(), {'action': 'insert'}, name='roads_async_insert'),  # POST
+    path('roads_async/update/<int:id>/', views.RoadsAsyncView.as_view(), {'action': 'update'}, name='roads_async_update'),  # POST
+    path('roads_async/delete/<int:id>/', views.RoadsAsyncView.as_view(), {'action': 'delete'}, name='roads_async_delete'),  # POST
     
     # REST Framework router URLs (RoadsModelViewSet)
     path('', include(router.urls)),                                        
@@ -37,4 +44,7 @@ urlpatterns = [
 # POST /roads/roads/ - create() - vstavi
 # PUT /roads/roads/<id>/ - update() - posodobi
 # PATCH /roads/roads/<id>/ - partial_update() - delna posodobitev
-# DELETE /roads/roads/<id>/ - destroy() - izbriši
\ No newline at end of file
+# DELETE /roads/roads/<id>/ - destroy() - izbriši
+# POST /roads/roads/bulk_validate/ - bulk_validate() - preveri več geometrij z eno poizvedbo
+# POST /roads/roads/bulk_create/ - bulk_create() - vstavi več objektov v eni transakciji
+# PATCH /roads/roads/bulk_update/ - bulk_update() - delna posodobitev več objektov v eni transakciji
\ No newline at end of file
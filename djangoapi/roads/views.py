@@ -7,20 +7,17 @@ from django.forms.models import model_to_dict
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.db.models import Q
 
-#Geoss
-from django.contrib.gis.geos import GEOSGeometry
-from django.contrib.gis.db.models.functions import SnapToGrid
-
 #rest_framework imports
-from rest_framework import viewsets
 from rest_framework import permissions
 
 #My imports
-from core.myLib.geometryTools import WkbConversor, GeometryChecks
+from core.myLib.geometryTools import GeometryPreparer
 from .models import Roads
 from .serializers import RoadsSerializer
-from djangoapi.settings import EPSG_FOR_GEOMETRIES, ST_SNAP_PRECISION, MAX_NUMBER_OF_RETRIEVED_ROWS
 from core.myLib.baseDjangoView import BaseDjangoView
+from core.myLib.asyncBaseDjangoView import AsyncBaseDjangoView
+from core.myLib.geoModelViewSet import GeoModelViewSet
+from core.myLib.featureWriter import FeatureWriter
 
 from decimal import Decimal, ROUND_HALF_UP
 
@@ -56,6 +53,9 @@ class RoadsView(BaseDjangoView):
     #     POST /roads_view/delete/<id>/
  
     
+    # z modelom se odgovori selectone in selectall shranijo v predpomnilnik, dokler se sloj ne spremeni
+    model = Roads
+
     def post(self, request, *args, **kwargs):
         # request vsebuje podatke o zahtevi, ki jo je uporabnik poslal
         # *args je list argumentov, ki jih posredujemo metodi
@@ -90,14 +90,9 @@ class RoadsView(BaseDjangoView):
 
     # podobna metoda kot zgoraj, samo da vrne vse objekte Roads
     # Link: http://localhost:8000/roads/roads_view/selectall/
+    # s parametrom ?stream=true se vrnejo vse ceste, brez da bi jih naložili v pomnilnik
     def selectall(self):
-        l=Roads.objects.all()[:MAX_NUMBER_OF_RETRIEVED_ROWS]
-        data=[]
-        for r in l:
-            d=model_to_dict(r)
-            d['geom']=r.geom.wkt
-            data.append(d)
-        return JsonResponse({'ok':True, 'message': 'Road data retrieved', 'data': data}, status=200)
+        return self.selectall_response(Roads.objects.all(), 'Road data retrieved')
 
     #POST OPERATIONS
     # Tudi metoda insert ni samostojna URL metoda, ampak je metoda, ki jo lahko pokličeš iz razreda BaseDjangoView.
@@ -110,50 +105,22 @@ class RoadsView(BaseDjangoView):
     #     "length": 700,
     #     "geom": "LINESTRING(0 0, 0 10)"
     def insert(self, request):
-        # Inserts the polygon. Latter snap it to the grid. This must be done
-        # in the database. So we need to insert it before.
-        # After the road has been inserted:
+        # Inserts the line. Before writing anything, in only one query:
         #     - snap it to grid
         #     - Check if the geometry is valid
         #     - Check if the road overlaps or crosses with other roads
         #       (touching at endpoints/nodes is allowed - normal for road networks)
-        #     - If any check fails, remove the row.
-        #     - The only inconvenient is the id counter sums one more
+        # If any check fails nothing is written. If not, the road
+        # is saved with only one INSERT. See core/myLib/featureWriter.py
         
         originalWkt=request.POST.get('geom', None)   # preverimo ali imamo geometrijo v POST zahtevi
         if originalWkt is None:                      # če nimamo geometrije, se spremenljivka originalWkt nastavi na None, in vrnemo napako
             return JsonResponse({'ok':False, 'message': 'The geometry is mandatory', 'data':[], 'post_data': dict(request.POST) },  status=400)
-        
-        #Creates the geometry
-        g=GEOSGeometry(request.POST.get('geom',''), srid=EPSG_FOR_GEOMETRIES)   # EPSG 25830 zamenjan z WGS84 4326
-        #print the representation of the object
-        print(f"Original geometry: {g}")
 
         str_name = request.POST.get('str_name','') 
         administrator = request.POST.get('administrator','') 
         maintainer = request.POST.get('maintainer','')
 
-        r=Roads(str_name=str_name, administrator=administrator, maintainer=maintainer, length=g.length, geom=g)
-        r.save()
-        print(f"Road geometry inserted id: {r.id}")
-
-        #Update the geometry to an snaped one to the grid
-        Roads.objects.filter(id=r.id).update(geom=SnapToGrid('geom', ST_SNAP_PRECISION))
-
-        #Now we get a new object with the new geometry to perform the checks
-        r=Roads.objects.get(id=r.id)           # ponovno preberemo objekt Roads iz baze, da dobimo novo geometrijo
-        print('Snapped geometry',r.geom.wkt)       # pretvori geometrijo v WKT format in jo izpiše
-    
-        #valid=bGeos.valid
-        #b.geom is a GEOSGeometry object, so we can use it directly
-        valid=r.geom.valid
-        print(f'Valid: {valid}')
-        if not valid:
-            print(f"Deleting invalid geometry {r.id}")   # če geometrija ni veljavna, jo izbrišemo
-            r.delete()
-            return JsonResponse({'ok':False, 'message': 'The Road geometry is not valid after the st_SnapToGrid', 'data':[]}, status=400)   
-
-        # POPRAVEK: Preverjanje prekrivanja in križanja cest
         # Za cestno omrežje je normalno, da se ceste dotikajo v vozliščih (končne točke),
         # vendar NE smejo:
         #   - Overlaps (si deliti segmente - 1*T***T**)
@@ -163,31 +130,26 @@ class RoadsView(BaseDjangoView):
         #   - Interior(A) ∩ Interior(B) = 1-dimenzionalen (linijski presek - prekrivanje segmentov)
         #   - Interior(A) ∩ Boundary(B) = True (ena cesta seka rob druge vmes)
         # To zajame obe nedovoljeni situaciji.
-        
-        # POMEMBNO: Uporabljamo r.geom (geometrija PO snap_to_grid), ne g.wkt (pred snap)!
-        filt = Roads.objects.filter(
-            geom__relate=(r.geom.wkt, '1*T***T**')  # Prekrivanje segmentov ALI križanje vmes
-        ).exclude(id=r.id)
-        
-        print(f"Query:{filt.query}")
-        exist=filt.exists()
-        print(f"Exists {exist}") 
-        n=filt.count() 
-        print(f"Count: {n}")
-        print(f"Values: {list(filt)}")
-        
-        if exist:         # če obstajajo geometrije, ki se prekrivajo ali križajo z novo cesto, jo izbrišemo
-            print(f"Deleting road id {r.id}, as it overlaps or crosses with {n} other road(s)")
-            r.delete()
+        # Preverja se geometrija PO snap_to_grid.
+        limit=self.get_relate_check_limit(request)
+        fw=FeatureWriter(Roads, '1*T***T**', length_field_name='length')
+        fw.insert(originalWkt, {'str_name': str_name, 'administrator': administrator, 'maintainer': maintainer}, limit=limit)
+
+        if fw.error == FeatureWriter.INVALID_GEOMETRY:   # če geometrija ni veljavna, ni ničesar zapisano v bazo
+            return JsonResponse({'ok':False, 'message': 'The Road geometry is not valid after the st_SnapToGrid', 'data':[]}, status=400)   
+        if fw.error == FeatureWriter.RELATED_IDS:        # če obstajajo ceste, ki se prekrivajo ali križajo z novo cesto
+            ids=fw.get_related_ids()
+            n=len(ids)
+            print(f"Values: {ids}")
+            at_least='at least ' if fw.is_limit_reached() else ''
             return JsonResponse({
                 'ok':False, 
-                'message': f'The road overlaps or crosses with {n} road(s). Roads can only touch at endpoints/nodes.',
-                'data':[]
+                'message': f'The road overlaps or crosses with {at_least}{n} road(s). Roads can only touch at endpoints/nodes.',
+                'data':ids
             }, status=400)
-        
-        #create a roads object, from the model Roads
-        d=model_to_dict(r)       # pretvori objekt Roads v dictionary, da ga lahko izpišemo v JSON formatu
-        d['geom']=r.geom.wkt
+        print(f"Road geometry inserted id: {fw.instance.id}")
+
+        d=fw.to_dict()       # pretvori objekt Roads v dictionary, da ga lahko izpišemo v JSON formatu
         return JsonResponse({'ok':True, 'message': 'Road data inserted', 'data': [d]}, status=201)
 
 
@@ -213,16 +175,16 @@ class RoadsView(BaseDjangoView):
         originalWkt=request.POST.get('geom', None)    # iz POST zahteve izluščimo geometrijo
         
         if originalWkt is not None:                        # če imamo geometrijo, jo pretvorimo v WKB format
-            conversor=WkbConversor()                       # Ustvarimo objekt wkb za pretvorbo geometrijskih podatkov
-            wkb=conversor.set_wkt_from_text(originalWkt)   # Pretvorimo WKT v WKB (Well-Known Binary)
-            newWkt=conversor.get_as_wkt()                  # Dobimo pretvorjen WKT iz WKB
-            geojson=conversor.get_as_geojson()             # Dobimo GeoJSON predstavitev geometrije
-            gc=GeometryChecks(wkb)                         # Ustvarimo objekt gc za preverjanje geometrije
-            isValid=gc.is_geometry_valid()                 # Preverimo, ali je geometrija veljavna
-            
             # POPRAVEK: Uporabimo masko za preverjanje prekrivanja in križanja
             # '1*T***T**' - prekrivanje segmentov ali križanje vmes (ne dotikanje v vozliščih)
-            interesectionIds=gc.check_st_relate('roads_roads','1*T***T**', id_to_avoid=id) # Preverimo prekrivanje/križanje
+            # Snap, preverjanje veljavnosti, prekrivanja/križanja in WKT/GeoJSON dobimo z enim samim SQL stavkom
+            gc=GeometryPreparer()                          # Ustvarimo objekt gc za pripravo in preverjanje geometrije
+            wkb=gc.prepare(originalWkt, 'roads_roads', '1*T***T**', id_to_avoid=id,
+                           limit=self.get_relate_check_limit(request)) # Pretvorimo WKT v WKB in preverimo prekrivanje/križanje
+            newWkt=gc.get_as_wkt()                         # Dobimo pretvorjen WKT iz WKB
+            geojson=gc.get_as_geojson()                    # Dobimo GeoJSON predstavitev geometrije
+            isValid=gc.is_valid                            # Ali je geometrija veljavna
+            interesectionIds=gc.related_ids                # id-ji cest, ki se prekrivajo/križajo
             thereAre = gc.are_there_related_ids()          # vrne True ali False
             
             print(f"Snaped wkt: {newWkt}")
@@ -244,11 +206,10 @@ class RoadsView(BaseDjangoView):
             r.str_name=request.POST.get('str_name', '')
             r.administrator=request.POST.get('administrator', '')
             r.maintainer=request.POST.get('maintainer', '')
-            polyGeos=GEOSGeometry(wkb)
-            r.length=polyGeos.length                  # izračunamo dolžino nove geometrije
+            r.length=gc.length                        # dolžina nove geometrije, izračunana v bazi
             r.save()
             d=model_to_dict(r)
-            d['geom']=conversor.get_as_wkt()#snaped version
+            d['geom']=newWkt#snaped version
         else:                                     # če v zahtevi nimamo geometrije, vrnemo napako
             return JsonResponse({'ok':False, 'message': 'The geometry is mandatory', 'data':[]}, status=400)
              # če je geometrija veljavna, izpišemo sporočilo o uspehu in vrnemo podatke o cesti
@@ -285,14 +246,12 @@ class RoadsView(BaseDjangoView):
         originalWkt=request.POST.get('geom', None) # iz post zahteve izluščimo geometrijo, ki je že v WKT formatu
         
         if originalWkt is not None:
-            conversor=WkbConversor()
-            wkb=conversor.set_wkt_from_text(originalWkt) # WKT spretvorimo v WKB format
-            gc=GeometryChecks(wkb)                       # Ustvarimo objekt gc za preverjanje geometrijskih podatkov
-            isValid=gc.is_geometry_valid()               # Preverimo, ali je geometrija veljavna
-            
             # POPRAVEK: Uporabimo masko za preverjanje prekrivanja in križanja
             # '1*T***T**' - prekrivanje segmentov ali križanje vmes (ne dotikanje v vozliščih)
-            gc.check_st_relate('roads_roads','1*T***T**')    # Preverimo prekrivanje/križanje
+            gc=GeometryPreparer()                        # Ustvarimo objekt gc za pripravo in preverjanje geometrijskih podatkov
+            wkb=gc.prepare(originalWkt, 'roads_roads', '1*T***T**',
+                           limit=self.get_relate_check_limit(request)) # WKT pretvorimo v WKB format in preverimo prekrivanje/križanje
+            isValid=gc.is_valid                          # Ali je geometrija veljavna
             print(gc.get_relate_message())                           # izpišemo sporočilo o napaki, če obstaja 
 
             if not(isValid):    # če geometrija ni veljavna, vrnemo napako
@@ -309,10 +268,10 @@ class RoadsView(BaseDjangoView):
             r.str_name=request.POST.get('str_name', '')   # iz POST zahteve izluščimo street name
             r.administrator=request.POST.get('administrator', '')   # iz POST zahteve izluščimo upravljalca ceste
             r.maintainer=request.POST.get('maintainer', '')   # iz POST zahteve izluščimo vzdrževalca ceste
-            r.length=round(r.geom.length, 2)                                  # izračunamo dolžino nove geometrije
+            r.length=round(gc.length, 2)                                  # dolžina nove geometrije, izračunana v bazi
             r.save()                                            # shranimo objekt Roads v bazo
             d=model_to_dict(r)
-            d['geom']=r.geom.wkt
+            d['geom']=gc.get_as_wkt()
         else:                       # če v zahtevi nimamo geometrijo, vrnemo napako            
             return JsonResponse({'ok':False, 'message': 'The geometry is mandatory', 'data':[]}, status=400)
         # če je geometrija veljavna, izpišemo sporočilo o uspehu in vrnemo podatke o cesti
@@ -322,7 +281,20 @@ class RoadsView(BaseDjangoView):
 
 
 # Create your views here.
-class RoadsModelViewSet(viewsets.ModelViewSet):
+class RoadsAsyncView(AsyncBaseDjangoView):
+    """
+    Async variant of RoadsView, for the ASGI server. The geometry checks are the
+    rules of roads_roads in core/myLib/layerRules.py.
+        GET /roads/roads_async/selectone/<id>/
+        GET /roads/roads_async/selectall/
+        POST /roads/roads_async/insert/
+        POST /roads/roads_async/update/<id>/
+        POST /roads/roads_async/delete/<id>/
+    """
+    model = Roads
+
+
+class RoadsModelViewSet(GeoModelViewSet):
     #     GET operation over /roads/roads/. It will return all reccords
     #     GET operation over /roads/roads/<id>/. 
     #     POST operation over /roads/roads/. It will insert a new record
@@ -0,0 +1,112 @@
+"""
+Load benchmark of the requests per second of the API, to compare the database
+connection modes (djangoapi/settings.py):
+    - before: DB_CONN_MAX_AGE=0, a new connection to PostgreSQL in every request
+    - after: DB_CONN_MAX_AGE=600, the connection of every worker thread is reused
+    - pool: DB_POOL=True, pool of psycopg 3 connections shared by the threads
+
+Start the server with every mode and run the benchmark against it. Use gunicorn,
+as in production: runserver makes a new thread for every request, so its
+connections can not be reused. Only the environment variables change:
+    DB_CONN_MAX_AGE=0 gunicorn djangoapi.wsgi:application --bind 0.0.0.0:8000 --workers 4
+    python scripts/benchmarks/connectionBenchmark.py --url http://localhost:8000/buildings/buildings/?page_size=10
+
+    DB_CONN_MAX_AGE=600 gunicorn djangoapi.wsgi:application --bind 0.0.0.0:8000 --workers 4
+    python scripts/benchmarks/connectionBenchmark.py --url http://localhost:8000/buildings/buildings/?page_size=10
+
+It also measures, in this process, the cost of opening a connection against
+running a query in an open one, with the database of the settings:
+    python scripts/benchmarks/connectionBenchmark.py --connect-only
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+def percentile(values: list, p: float)->float:
+    values=sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def load(url: str, total: int, concurrency: int, headers: dict)->dict:
+    """
+    Sends total GET requests, concurrency at the same time. Every thread
+    has its own session (keep-alive), so only the database connection changes
+    """
+    sessions={}
+
+    def get(i: int)->float:
+        session=sessions.setdefault(i % concurrency, requests.Session())
+        start=time.perf_counter()
+        response=session.get(url, headers=headers)
+        elapsed=(time.perf_counter() - start) * 1000
+        if response.status_code != 200:
+            raise RuntimeError(f'{url} returned {response.status_code}: {response.text[:200]}')
+        return elapsed
+
+    #warm up: the first requests open the connections of the workers
+    for i in range(concurrency):
+        get(i)
+    start=time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies=list(executor.map(get, range(total)))
+    elapsed=time.perf_counter() - start
+    return {'requests_per_second': total / elapsed, 'median_ms': statistics.median(latencies),
+            'p95_ms': percentile(latencies, 0.95)}
+
+def connect_cost(repetitions: int)->dict:
+    """
+    Milliseconds of a query with a new connection, and with the same one
+    """
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'djangoapi.settings')
+    import django
+    django.setup()
+    from django.db import connection
+
+    def query():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+
+    new_connection=[]
+    for i in range(repetitions):
+        connection.close()
+        start=time.perf_counter()
+        query()
+        new_connection.append((time.perf_counter() - start) * 1000)
+    same_connection=[]
+    for i in range(repetitions):
+        start=time.perf_counter()
+        query()
+        same_connection.append((time.perf_counter() - start) * 1000)
+    connection.close()
+    return {'new_connection_ms': statistics.median(new_connection),
+            'same_connection_ms': statistics.median(same_connection)}
+
+def main():
+    parser=argparse.ArgumentParser(description='Requests per second of the API with the current connection mode')
+    parser.add_argument('--url', default='http://localhost:8000/buildings/buildings/?page_size=10')
+    parser.add_argument('--requests', type=int, default=2000, help='Number of requests')
+    parser.add_argument('--concurrency', type=int, default=8, help='Requests at the same time')
+    parser.add_argument('--token', default=None, help='Knox token, if the url needs authentication')
+    parser.add_argument('--connect-only', action='store_true', help='Only the cost of a new connection, without the server')
+    parser.add_argument('--repetitions', type=int, default=50)
+    args=parser.parse_args()
+
+    if args.connect_only:
+        result=connect_cost(args.repetitions)
+        print(f"query with a new connection: {result['new_connection_ms']:.2f} ms (median)")
+        print(f"query with the same connection: {result['same_connection_ms']:.2f} ms (median)")
+        return
+
+    headers={'Authorization': f'Token {args.token}'} if args.token else {}
+    result=load(args.url, args.requests, args.concurrency, headers)
+    print(f"{args.url}: {args.requests} requests, {args.concurrency} at the same time")
+    print(f"{result['requests_per_second']:.1f} requests/s, median {result['median_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms")
+
+if __name__ == '__main__':
+    main()
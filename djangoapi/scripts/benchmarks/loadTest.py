@@ -0,0 +1,78 @@
+"""
+Load test to choose the number of workers and threads of gunicorn
+(djangoapi/gunicorn.conf.py).
+
+It sends the requests of the urls, in turns, with more and more clients at the
+same time, and prints the requests per second and the latency of every level.
+The best number of clients is the last one that increases the requests per
+second without a big increase of the p95 latency. Run it with several values
+of GUNICORN_WORKERS and GUNICORN_THREADS, and keep the one with the highest
+requests per second at an acceptable p95.
+
+Include a slow request (a ST_Relate check, a big bbox) with the fast ones, so
+the test shows if the slow requests block the others:
+    GUNICORN_WORKERS=4 GUNICORN_THREADS=4 gunicorn djangoapi.wsgi:application
+    python scripts/benchmarks/loadTest.py \\
+        --url "http://localhost:8000/buildings/buildings/?page_size=10" \\
+        --url "http://localhost:8000/parcels/parcels/?bbox=460000,100000,470000,110000" \\
+        --concurrency 1 2 4 8 16 32 64 --requests 500
+"""
+import argparse
+import itertools
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from connectionBenchmark import percentile
+
+def run_level(urls: list, total: int, concurrency: int, headers: dict)->dict:
+    local=threading.local()
+    url_cycle=itertools.cycle(urls)
+    lock=threading.Lock()
+    errors=[]
+
+    def get(i: int)->float:
+        if not hasattr(local, 'session'):
+            local.session=requests.Session()
+        with lock:
+            url=next(url_cycle)
+        start=time.perf_counter()
+        try:
+            response=local.session.get(url, headers=headers, timeout=300)
+            if response.status_code != 200:
+                errors.append(f'{url}: {response.status_code}')
+        except requests.RequestException as e:
+            errors.append(f'{url}: {e}')
+        return (time.perf_counter() - start) * 1000
+
+    start=time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies=list(executor.map(get, range(total)))
+    elapsed=time.perf_counter() - start
+    return {'concurrency': concurrency, 'requests_per_second': total / elapsed,
+            'median_ms': statistics.median(latencies), 'p95_ms': percentile(latencies, 0.95),
+            'max_ms': max(latencies), 'errors': errors}
+
+def main():
+    parser=argparse.ArgumentParser(description='Requests per second of the API with more and more clients')
+    parser.add_argument('--url', action='append', required=True, help='Url to request. It can be repeated')
+    parser.add_argument('--requests', type=int, default=500, help='Number of requests of every level')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64],
+                        help='Clients at the same time of every level')
+    parser.add_argument('--token', default=None, help='Knox token, if the urls need authentication')
+    args=parser.parse_args()
+
+    headers={'Authorization': f'Token {args.token}'} if args.token else {}
+    print(f"{'clients':>8} {'req/s':>10} {'median ms':>10} {'p95 ms':>10} {'max ms':>10} {'errors':>7}")
+    for concurrency in args.concurrency:
+        result=run_level(args.url, args.requests, concurrency, headers)
+        print(f"{concurrency:>8} {result['requests_per_second']:>10.1f} {result['median_ms']:>10.1f} "
+              f"{result['p95_ms']:>10.1f} {result['max_ms']:>10.1f} {len(result['errors']):>7}")
+        for error in result['errors'][:3]:
+            print(f'    {error}')
+
+if __name__ == '__main__':
+    main()
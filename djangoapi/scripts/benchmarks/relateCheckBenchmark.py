@@ -0,0 +1,93 @@
+"""
+Benchmark of the insert latency (median) against the table size, with the relate
+check done as before (only ST_relate, full scan) and after (geom && + ST_relate,
+with the GiST index).
+
+It works over a temporary table with a grid of squares, so the data of the
+application is not modified.
+
+Run it from the djangoapi folder, in the container:
+    python scripts/benchmarks/relateCheckBenchmark.py
+    python scripts/benchmarks/relateCheckBenchmark.py --sizes 1000 10000 100000 400000 --repetitions 20
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'djangoapi.settings')
+
+import django
+django.setup()
+
+from django.db import connection, transaction
+from djangoapi.settings import EPSG_FOR_GEOMETRIES
+
+TABLE_NAME = 'bench_relate_check'
+MATRIX9IM = 'T********'
+SQUARE_SIZE = 10
+
+QUERY_BEFORE = f"SELECT id FROM {TABLE_NAME} WHERE ST_relate(geom,%s,%s)"
+QUERY_AFTER = f"SELECT id FROM {TABLE_NAME} WHERE geom && %s and ST_relate(geom,%s,%s)"
+QUERY_INSERT = f"INSERT INTO {TABLE_NAME} (geom) VALUES (%s)"
+
+def create_table(cursor, size: int):
+    """Creates a grid of size squares, with a GiST index"""
+    side = int(size ** 0.5) + 1
+    cursor.execute(f"DROP TABLE IF EXISTS {TABLE_NAME}")
+    cursor.execute(f"""CREATE TEMP TABLE {TABLE_NAME} AS
+            SELECT row_number() OVER ()::integer AS id,
+                ST_MakeEnvelope(x * {SQUARE_SIZE}, y * {SQUARE_SIZE},
+                                x * {SQUARE_SIZE} + {SQUARE_SIZE}, y * {SQUARE_SIZE} + {SQUARE_SIZE},
+                                %s) AS geom
+            FROM generate_series(0, {side - 1}) x, generate_series(0, {side - 1}) y
+            LIMIT %s""", [EPSG_FOR_GEOMETRIES, size])
+    cursor.execute(f"CREATE INDEX ON {TABLE_NAME} USING GIST (geom)")
+    cursor.execute(f"ANALYZE {TABLE_NAME}")
+    return side
+
+def random_polygon(cursor, side: int):
+    """A square that overlaps four squares of the grid"""
+    x = random.uniform(0, (side - 1) * SQUARE_SIZE)
+    y = random.uniform(0, (side - 1) * SQUARE_SIZE)
+    cursor.execute("SELECT ST_MakeEnvelope(%s, %s, %s, %s, %s)",
+                   [x, y, x + SQUARE_SIZE, y + SQUARE_SIZE, EPSG_FOR_GEOMETRIES])
+    return cursor.fetchone()[0]
+
+def time_insert(cursor, check_query: str, values: list, wkb: str)->float:
+    """Relate check and insert, rolled back. Returns the milliseconds"""
+    start = time.perf_counter()
+    sid = transaction.savepoint()
+    cursor.execute(check_query, values)
+    cursor.fetchall()
+    cursor.execute(QUERY_INSERT, [wkb])
+    elapsed = (time.perf_counter() - start) * 1000
+    transaction.savepoint_rollback(sid)
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 400000])
+    parser.add_argument('--repetitions', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'before (ms)':>14} {'after (ms)':>14} {'speedup':>10}")
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            for size in args.sizes:
+                side = create_table(cursor, size)
+                before = []
+                after = []
+                for i in range(args.repetitions):
+                    wkb = random_polygon(cursor, side)
+                    before.append(time_insert(cursor, QUERY_BEFORE, [wkb, MATRIX9IM], wkb))
+                    after.append(time_insert(cursor, QUERY_AFTER, [wkb, wkb, MATRIX9IM], wkb))
+                before_ms = sorted(before)[len(before) // 2]
+                after_ms = sorted(after)[len(after) // 2]
+                print(f"{size:>10} {before_ms:>14.2f} {after_ms:>14.2f} {before_ms / after_ms:>9.1f}x")
+        transaction.set_rollback(True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class TilesConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'tiles'
+
+    def ready(self):
+        #the cached tiles of the changed features are removed
+        from core.myLib.layers import layer_changed
+        from .tileCache import invalidate_tiles
+        layer_changed.connect(invalidate_tiles, dispatch_uid='tiles_invalidate_tiles')
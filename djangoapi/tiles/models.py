@@ -0,0 +1,22 @@
+from django.db import models
+
+class TileInvalidation(models.Model):
+    """
+    Extent of a layer changed by an insert, update or delete (signal layer_changed),
+    in the srid of the layer. Every process reads the new ones and removes the tiles
+    of its cache that intersect them (tiles/tileCache.py).
+    xid is the id of the transaction that wrote it, as in core.models.LayerChange.
+    """
+    layer_name = models.CharField(max_length=100)
+    xmin = models.FloatField()
+    ymin = models.FloatField()
+    xmax = models.FloatField()
+    ymax = models.FloatField()
+    xid = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['xid', 'id']), models.Index(fields=['created_at'])]
+
+    def __str__(self):
+        return f"{self.layer_name} ({self.xmin}, {self.ymin}, {self.xmax}, {self.ymax})"
@@ -0,0 +1,174 @@
+"""
+In-process LRU cache of the vector tiles.
+
+Every tile is stored with its extent in the srid of the layer (including
+the buffer of the tile). When the features of a layer change (signal
+layer_changed), only the tiles whose extent intersects the old or the
+new geometries are removed.
+
+The cache is per process, so the extents are also written in the table
+TileInvalidation (tiles/models.py). Before a tile is read, every process
+reads the extents written by the others since its last read, at most every
+TILE_INVALIDATION_INTERVAL seconds, and removes its tiles that intersect them.
+As in the change feed (core/myLib/changes.py), the position of the process is
+a token <xid>.<id>, and only the rows of the finished transactions are read,
+so a row that commits late is not skipped.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from core.myLib.changes import CurrentXactId, snapshot_xmin
+from djangoapi.settings import TILE_CACHE_MAX_TILES, TILE_CACHE_TTL, TILE_INVALIDATION_INTERVAL
+from .models import TileInvalidation
+
+#the rows of TileInvalidation are deleted after this number of seconds. With
+#TILE_CACHE_TTL the tiles older than them have already expired
+INVALIDATION_RETENTION = TILE_CACHE_TTL if TILE_CACHE_TTL > 0 else 86400
+
+def extents_intersect(e1: tuple, e2: tuple)->bool:
+    return e1[0] <= e2[2] and e2[0] <= e1[2] and e1[1] <= e2[3] and e2[1] <= e1[3]
+
+class TileCache:
+    """
+    key: (layer_name, z, x, y)
+
+    Example:
+        invalidation_reader.read()
+        generation=tile_cache.get_generation(layer_name)
+        tile=tile_cache.get(key)
+        if tile is None:
+            tile, extent=build_tile(...)
+            tile_cache.set(key, tile, extent, generation)
+    The generation avoids storing a tile built before an invalidation
+    that happened while it was being built.
+    """
+    def __init__(self, max_tiles: int=TILE_CACHE_MAX_TILES, ttl: int=TILE_CACHE_TTL):
+        self.max_tiles=max_tiles
+        self.ttl=ttl
+        self.__tiles=OrderedDict()
+        self.__generations={}
+        self.__lock=threading.Lock()
+
+    def get_generation(self, layer_name: str)->int:
+        with self.__lock:
+            return self.__generations.get(layer_name, 0)
+
+    def get(self, key: tuple)->bytes:
+        """
+        Returns the tile, or None if it is not in the cache or it has expired
+        """
+        with self.__lock:
+            entry=self.__tiles.get(key)
+            if entry is None:
+                return None
+            tile, extent, created=entry
+            if self.ttl > 0 and time.monotonic() - created > self.ttl:
+                del self.__tiles[key]
+                return None
+            self.__tiles.move_to_end(key)
+            return tile
+
+    def set(self, key: tuple, tile: bytes, extent: tuple, generation: int):
+        if self.max_tiles <= 0:
+            return
+        with self.__lock:
+            if self.__generations.get(key[0], 0) != generation:
+                return
+            self.__tiles[key]=(tile, extent, time.monotonic())
+            self.__tiles.move_to_end(key)
+            while len(self.__tiles) > self.max_tiles:
+                self.__tiles.popitem(last=False)
+
+    def invalidate(self, layer_name: str, extents: list)->int:
+        """
+        Removes the tiles of the layer that intersect any of the extents.
+        Returns the number of removed tiles
+        """
+        with self.__lock:
+            self.__generations[layer_name]=self.__generations.get(layer_name, 0) + 1
+            keys=[key for key, (tile, extent, created) in self.__tiles.items()
+                  if key[0] == layer_name and any(extents_intersect(extent, e) for e in extents)]
+            for key in keys:
+                del self.__tiles[key]
+            return len(keys)
+
+    def clear(self, layer_name: str=None):
+        with self.__lock:
+            if layer_name is None:
+                layer_names=set(self.__generations) | set(key[0] for key in self.__tiles)
+            else:
+                layer_names={layer_name}
+            for name in layer_names:
+                self.__generations[name]=self.__generations.get(name, 0) + 1
+            for key in [key for key in self.__tiles if key[0] in layer_names]:
+                del self.__tiles[key]
+
+class InvalidationReader:
+    """
+    Reads the rows of TileInvalidation written since the last read, by any
+    process, and removes the tiles of the cache that intersect them
+    """
+    def __init__(self, cache: TileCache, interval: float=TILE_INVALIDATION_INTERVAL):
+        self.cache=cache
+        self.interval=interval
+        self.token=None
+        self.last_read=None
+        self.__lock=threading.Lock()
+
+    def read(self)->int:
+        """
+        Returns the number of removed tiles. The table is read at most every interval
+        seconds: if other thread has read it in that time, nothing is done
+        """
+        with self.__lock:
+            now=time.monotonic()
+            if self.last_read is not None and now - self.last_read < self.interval:
+                return 0
+            self.last_read=now
+            token=self.token
+        xmin=snapshot_xmin()
+        if token is None:
+            #the cache of a new process is empty: only the next changes matter
+            self.set_token((xmin, 0))
+            return 0
+        since_xid, since_id=token
+        rows=list(TileInvalidation.objects.filter(xid__lt=xmin)
+                  .filter(Q(xid__gt=since_xid) | Q(xid=since_xid, id__gt=since_id))
+                  .order_by('xid', 'id')
+                  .values_list('xid', 'id', 'layer_name', 'xmin', 'ymin', 'xmax', 'ymax'))
+        extents={}
+        for xid, id, layer_name, *extent in rows:
+            extents.setdefault(layer_name, []).append(tuple(extent))
+        n=sum(self.cache.invalidate(layer_name, layer_extents) for layer_name, layer_extents in extents.items())
+        #all the transactions older than xmin have finished: their rows have been read
+        if xmin > since_xid:
+            self.set_token((xmin, 0))
+        return n
+
+    def set_token(self, token: tuple):
+        with self.__lock:
+            if self.token is None or token > self.token:
+                self.token=token
+
+tile_cache=TileCache()
+invalidation_reader=InvalidationReader(tile_cache)
+last_cleanup=None
+
+def invalidate_tiles(sender, layer, ids, extents, **kwargs):
+    """
+    Receiver of the signal layer_changed. The tiles of this process are removed
+    at once, and the extents are written for the other processes
+    """
+    global last_cleanup
+    tile_cache.invalidate(layer, extents)
+    TileInvalidation.objects.bulk_create([TileInvalidation(layer_name=layer, xmin=e[0], ymin=e[1], xmax=e[2], ymax=e[3],
+                                                           xid=CurrentXactId()) for e in extents])
+    now=time.monotonic()
+    if last_cleanup is None or now - last_cleanup > 60:
+        last_cleanup=now
+        TileInvalidation.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=INVALIDATION_RETENTION)).delete()
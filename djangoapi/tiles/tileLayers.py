@@ -0,0 +1,50 @@
+"""
+Configuration of the layers served as vector tiles.
+
+For every layer:
+    - min_zoom, max_zoom: out of these zooms the tiles are empty, without any query.
+    - attributes: {from_zoom: [fields]}. The fields of the features in the tiles
+        from that zoom on. In the overview zooms only a few are sent.
+    - simplify: {from_zoom: tolerance}. Tolerance of the simplification, in pixels
+        of the tile (4096 x 4096). 0 means no simplification.
+"""
+
+class TileLayer:
+    def __init__(self, min_zoom: int=0, max_zoom: int=22, attributes: dict=None, simplify: dict=None):
+        self.min_zoom=min_zoom
+        self.max_zoom=max_zoom
+        self.attributes=attributes or {0: ['id']}
+        self.simplify=simplify or {0: 0}
+
+    def has_zoom(self, z: int)->bool:
+        return self.min_zoom <= z <= self.max_zoom
+
+    def __value_for_zoom(self, values: dict, z: int):
+        zooms=[zoom for zoom in values if zoom <= z]
+        if len(zooms) == 0:
+            return values[min(values)]
+        return values[max(zooms)]
+
+    def get_attributes(self, z: int)->list:
+        return self.__value_for_zoom(self.attributes, z)
+
+    def get_simplify(self, z: int)->float:
+        return self.__value_for_zoom(self.simplify, z)
+
+TILE_LAYERS = {
+    'parcels_parcels': TileLayer(
+        min_zoom=12,
+        attributes={12: ['id'], 15: ['id', 'parc_st', 'sifko', 'area']},
+        simplify={12: 2, 15: 1, 17: 0}),
+    'buildings_buildings': TileLayer(
+        min_zoom=13,
+        attributes={13: ['id'], 16: ['id', 'sifko', 'st_stavbe', 'description', 'area']},
+        simplify={13: 2, 16: 1, 18: 0}),
+    'roads_roads': TileLayer(
+        min_zoom=8,
+        attributes={8: ['id'], 12: ['id', 'str_name'], 15: ['id', 'str_name', 'administrator', 'maintainer', 'length']},
+        simplify={8: 4, 12: 2, 15: 1, 17: 0}),
+    'addresses_addresses': TileLayer(
+        min_zoom=15,
+        attributes={15: ['id', 'house_num'], 17: ['id', 'building_num', 'street', 'house_num', 'post_num', 'post_name']}),
+}
@@ -0,0 +1,88 @@
+from django.db import connection
+from django.http import HttpResponse, JsonResponse
+from django.views import View
+
+from djangoapi.settings import EPSG_FOR_GEOMETRIES, TILE_HTTP_MAX_AGE
+from .tileLayers import TILE_LAYERS, TileLayer
+from .tileCache import tile_cache, invalidation_reader
+
+#width of the world in web mercator (EPSG:3857), in meters
+WEB_MERCATOR_WIDTH = 40075016.68557849
+MVT_EXTENT = 4096 #size of the tiles in their own coordinates
+MVT_BUFFER = 64 #the geometries are clipped this number of units out of the tile
+MAX_ZOOM = 24
+
+def build_tile(layer_name: str, tile_layer: TileLayer, z: int, x: int, y: int):
+    """
+    Builds the Mapbox Vector Tile of the layer, in only one query, with ST_AsMVT.
+    The features are filtered with the GiST index (&&) in the srid of the layer, and
+    transformed to web mercator. They are simplified and have the attributes of the zoom.
+    Returns the tile, and its extent in the srid of the layer (xmin, ymin, xmax, ymax)
+    """
+    tile_width=WEB_MERCATOR_WIDTH / 2**z
+    margin=tile_width * MVT_BUFFER / MVT_EXTENT
+    #tolerance from pixels of the tile to meters
+    tolerance=tile_layer.get_simplify(z) * tile_width / MVT_EXTENT
+    qn=connection.ops.quote_name
+    columns=''.join(f', t.{qn(a)}' for a in tile_layer.get_attributes(z))
+
+    values=[z, x, y, z, x, y, margin, EPSG_FOR_GEOMETRIES]
+    geom="ST_Transform(t.geom, 3857)"
+    if tolerance > 0:
+        geom=f"ST_SimplifyPreserveTopology({geom}, %s)"
+        values.append(tolerance)
+    values+=[MVT_EXTENT, MVT_BUFFER, layer_name, MVT_EXTENT]
+
+    q=f"""WITH bounds AS (
+                SELECT ST_TileEnvelope(%s, %s, %s) AS tile,
+                       ST_Transform(ST_Expand(ST_TileEnvelope(%s, %s, %s), %s), %s) AS geom
+            ), mvt AS (
+                SELECT ST_AsMVTGeom({geom}, b.tile, %s, %s, true) AS geom{columns}
+                FROM {layer_name} t, bounds b
+                WHERE t.geom && b.geom
+            )
+            SELECT (SELECT ST_AsMVT(mvt.*, %s, %s, 'geom') FROM mvt WHERE mvt.geom IS NOT NULL),
+                   ST_XMin(b.geom), ST_YMin(b.geom), ST_XMax(b.geom), ST_YMax(b.geom)
+            FROM bounds b
+        """
+    with connection.cursor() as cursor:
+        cursor.execute(q, values)
+        row=cursor.fetchone()
+    tile=bytes(row[0]) if row[0] is not None else b''
+    return tile, tuple(row[1:5])
+
+class TileView(View):
+    """
+    Mapbox Vector Tiles of the layers, made by PostGIS. They replace the
+    GeoServer layers for the web map:
+        GET /tiles/<layer>/<z>/<x>/<y>.mvt
+        GET /tiles/buildings_buildings/16/32345/24567.mvt
+    The layers and the attributes and simplification of every zoom are
+    in tileLayers.py. The tiles are kept in tile_cache until the features
+    in them are inserted, updated or deleted, in any process. The header X-Tile-Cache
+    says if the tile was in the cache (HIT) or not (MISS).
+    """
+    def get(self, request, layer, z, x, y):
+        if layer not in TILE_LAYERS:
+            return JsonResponse({'ok':False, 'message': f'The layer {layer} does not exist. Layers: {list(TILE_LAYERS)}', 'data':[]}, status=404)
+        if z > MAX_ZOOM or x >= 2**z or y >= 2**z:
+            return JsonResponse({'ok':False, 'message': f'The tile {z}/{x}/{y} does not exist', 'data':[]}, status=400)
+
+        tile_layer=TILE_LAYERS[layer]
+        key=(layer, z, x, y)
+        cache_status='HIT'
+        #the tiles changed by the other processes
+        invalidation_reader.read()
+        generation=tile_cache.get_generation(layer)
+        tile=tile_cache.get(key)
+        if tile is None:
+            cache_status='MISS'
+            if tile_layer.has_zoom(z):
+                tile, extent=build_tile(layer, tile_layer, z, x, y)
+                tile_cache.set(key, tile, extent, generation)
+            else:
+                tile=b''
+        response=HttpResponse(tile, content_type='application/vnd.mapbox-vector-tile')
+        response['X-Tile-Cache']=cache_status
+        response['Cache-Control']=f'max-age={TILE_HTTP_MAX_AGE}'
+        return response